@@ -27,13 +27,939 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import array
+import collections
+import collections.abc
 import itertools
-import sys
 import functools
+import heapq
+import json
+import math
+import multiprocessing
+import operator
+
+from anlinq import instrumentation as _instrumentation
+from anlinq.cache import QueryCache, default_cache as _default_cache
+from anlinq.expressions import F, Expression, function as _function
+
+
+class _KeySet(object):
+    """
+    Set of keys which uses hashing where possible and falls back to linear search for unhashable keys
+    """
+
+    def __init__(self, keys=()):
+        self.hashed = set()
+        self.unhashed = []
+        for key in keys:
+            self.add(key)
+
+    def add(self, key):
+        try:
+            self.hashed.add(key)
+        except TypeError:
+            if key not in self.unhashed:
+                self.unhashed.append(key)
+
+    def __contains__(self, key):
+        try:
+            return key in self.hashed
+        except TypeError:
+            return key in self.unhashed
+
+
+def _reiterable(iterable):
+    """
+    Makes one-shot iterators safe to consume more than once, other iterables are returned as is.
+    Argument is not iterated here, so deferred queries passed as arguments stay deferred.
+    """
+    return _Memoized(iterable) if isinstance(iterable, collections.abc.Iterator) else iterable
+
+
+def _keys(iterable, key_selector):
+    return iterable if key_selector is None else map(_function(key_selector), iterable)
+
+
+def _where(iterable, *predicates):
+    # nested C-level filters are cheaper than one python function calling all predicates,
+    # expressions are unwrapped inline as this runs for every short query
+    for predicate in predicates:
+        iterable = filter(predicate.function if predicate.__class__ is Expression else predicate, iterable)
+    return iterable
+
+
+def _select(iterable, selector):
+    return map(selector.function if selector.__class__ is Expression else selector, iterable)
+
+
+def _select_many(iterable, selector):
+    return itertools.chain.from_iterable(map(_function(selector), iterable))
+
+
+def _distinct(iterable, key_selector, max_memory=None):
+    key_selector = _function(key_selector)
+    if max_memory is not None:
+        from anlinq.spill import external_distinct
+        for i in external_distinct(iterable, key_selector, max_memory):
+            yield i
+        return
+    keys = _KeySet()
+    for i in iterable:
+        key = key_selector(i) if key_selector is not None else i
+        if key not in keys:
+            keys.add(key)
+            yield i
+
+
+def _range_len(start, stop, step):
+    return max(0, (stop - start + step - (1 if step > 0 else -1)) // step)
+
+
+def _slice_len(length, slc):
+    return _range_len(*slc.indices(length))
+
+
+class _SequenceView(object):
+    """
+    Lazy slice of a sequence. Slices are resolved against the sequence on every access,
+    so view never copies items and reflects later changes of the sequence.
+    """
+    __slots__ = ('sequence', 'slices')
+
+    def __init__(self, sequence, slices):
+        self.sequence = sequence
+        self.slices = slices
+
+    def _bounds(self):
+        start, step, length = 0, 1, len(self.sequence)
+        for slc in self.slices:
+            sub_start, sub_stop, sub_step = slc.indices(length)
+            length = _range_len(sub_start, sub_stop, sub_step)
+            start, step = start + sub_start * step, step * sub_step
+        return start, step, length
+
+    def __len__(self):
+        return self._bounds()[2]
+
+    def __iter__(self):
+        start, step, length = self._bounds()
+        return map(self.sequence.__getitem__, range(start, start + step * length, step))
+
+    def to_list(self):
+        sequence = self.sequence
+        if sequence.__class__ in _SLICEABLE_TYPES and (len(self.slices) == 1 or len(sequence) <= _SMALL_INPUT):
+            # nested native slices copy every level, which is still cheaper than index arithmetic on few items
+            for slc in self.slices:
+                sequence = sequence[slc]
+            return sequence if sequence.__class__ is list else list(sequence)
+        start, step, length = self._bounds()
+        if step > 0 and self.sequence.__class__ in _SLICEABLE_TYPES:
+            # native slicing copies references in C
+            return list(self.sequence[start:start + step * length:step])
+        return list(self)
+
+    def __reversed__(self):
+        start, step, length = self._bounds()
+        return map(self.sequence.__getitem__, range(start + step * (length - 1), start - step, -step))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _SequenceView(self.sequence, self.slices + (index,))
+        start, step, length = self._bounds()
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("view index out of range")
+        return self.sequence[start + index * step]
+
+
+_SLICEABLE_TYPES = (list, tuple)
+# inputs of this size are ordered with a plain sort, which is cheaper than a heap up to a few hundred items,
+# and short plans over them run directly
+_SMALL_INPUT = 512
+_SEQUENCE_TYPES = (list, tuple, range, _SequenceView, array.array)
+# sequences with O(1) indexing, abstract Sequence is not enough as deque and others index in O(n)
+_INDEXED_TYPES = _SEQUENCE_TYPES + (str, bytes, bytearray, memoryview)
+
+
+def _is_sequence(iterable):
+    # exact type checks first, isinstance also accepts subclasses but is slower
+    return iterable.__class__ in _SEQUENCE_TYPES or \
+        iterable.__class__ is not _Query and isinstance(iterable, _INDEXED_TYPES)
+
+
+def _view(sequence, slc):
+    """
+    Slices sequence lazily with index arithmetic instead of iterating it
+    """
+    if sequence.__class__ is _SequenceView:
+        return sequence[slc]
+    return _SequenceView(sequence, (slc,))
+
+
+def _slice(iterable, slc):
+    if (slc.start or 0) >= 0 and (slc.stop or 0) >= 0 and (slc.step or 1) > 0:
+        return itertools.islice(iterable, slc.start, slc.stop, slc.step)
+    return list(iterable)[slc]
+
+
+def _take(iterable, number):
+    if iterable.__class__ in _SLICEABLE_TYPES:
+        return iterable[:max(number, 0)]
+    return itertools.islice(iterable, max(number, 0))
+
+
+def _skip(iterable, number):
+    if iterable.__class__ in _SLICEABLE_TYPES and len(iterable) <= _SMALL_INPUT:
+        return iterable[max(number, 0):]
+    return itertools.islice(iterable, max(number, 0), None)
+
+
+def _concat(iterable, other):
+    return itertools.chain(iterable, other)
+
+
+def _kept(iterable, keys, key_selector):
+    """
+    Yields items whose keys are in _KeySet keys. Membership is tested inline rather than through
+    _KeySet.__contains__, linear search over unhashable keys runs only for keys which cannot be hashed.
+    """
+    hashed, unhashed = keys.hashed, keys.unhashed
+    if key_selector is None:
+        for i in iterable:
+            try:
+                if i not in hashed:
+                    continue
+            except TypeError:
+                if i not in unhashed:
+                    continue
+            yield i
+        return
+    for i in iterable:
+        key = key_selector(i)
+        try:
+            if key not in hashed:
+                continue
+        except TypeError:
+            if key not in unhashed:
+                continue
+        yield i
+
+
+def _dropped(iterable, keys, key_selector):
+    """
+    Yields items whose keys are not in _KeySet keys, see _kept
+    """
+    hashed, unhashed = keys.hashed, keys.unhashed
+    if key_selector is None:
+        for i in iterable:
+            try:
+                if i in hashed:
+                    continue
+            except TypeError:
+                if i in unhashed:
+                    continue
+            yield i
+        return
+    for i in iterable:
+        key = key_selector(i)
+        try:
+            if key in hashed:
+                continue
+        except TypeError:
+            if key in unhashed:
+                continue
+        yield i
+
+
+def _except_for(iterable, other, key_selector):
+    return _dropped(iterable, _KeySet(_keys(other, key_selector)), key_selector)
+
+
+def _intersect(iterable, other, key_selector):
+    return _kept(iterable, _KeySet(_keys(other, key_selector)), key_selector)
+
+
+def _union(iterable, other, key_selector):
+    return _distinct(itertools.chain(iterable, other), key_selector)
+
+
+def _symmetric_difference(iterable, other, key_selector):
+    other_keys = _KeySet(_keys(other, key_selector))
+    keys = _KeySet()
+    for i in iterable:
+        key = key_selector(i) if key_selector is not None else i
+        if key not in keys:
+            keys.add(key)
+            if key not in other_keys:
+                yield i
+    for i in other:
+        key = key_selector(i) if key_selector is not None else i
+        if key not in keys:
+            keys.add(key)
+            yield i
+
+
+class _OrderKey(object):
+    """
+    Composite sort key for orderings which mix ascending and descending keys
+    """
+    __slots__ = ('values', 'directions')
+
+    def __init__(self, values, directions):
+        self.values = values
+        self.directions = directions
+
+    def __eq__(self, other):
+        # heapq compares (key, index) tuples, which needs equality of keys to fall back to index on ties
+        return self.values == other.values
+
+    __hash__ = None
+
+    def __lt__(self, other):
+        for a, b, descending in zip(self.values, other.values, self.directions):
+            if a < b:
+                return not descending
+            if b < a:
+                return descending
+        return False
+
+
+def _identity(item):
+    return item
+
+
+def _order_by(iterable, keys, limit, max_memory=None):
+    """
+    Orders items by list of (key, descending) pairs in one stable sort pass,
+    or picks only first limit items with a heap in O(n log limit) when limit is given,
+    or sorts runs of max_memory bytes and merges them from temporary files when max_memory is given
+    """
+    if len(keys) == 1:
+        key, descending = _function(keys[0][0]), keys[0][1]
+    else:
+        directions = [descending for key, descending in keys]
+        if not any(directions) or all(directions):
+            funcs = [_function(key) if key is not None else _identity for key, _ in keys]
+            key, descending = lambda item: tuple([func(item) for func in funcs]), directions[0]
+        elif limit is None and max_memory is None:
+            # sorts are stable also in reverse, so sorting by every key from the last one orders by all of them
+            # with C-level comparisons instead of python _OrderKey
+            items = list(iterable)
+            for key, descending in reversed(keys):
+                items.sort(key=_function(key), reverse=descending)
+            return items
+        else:
+            funcs = [_function(key) if key is not None else _identity for key, _ in keys]
+            key, descending = lambda item: _OrderKey([func(item) for func in funcs], directions), False
+
+    if limit is not None and not (iterable.__class__ in _SLICEABLE_TYPES and len(iterable) <= _SMALL_INPUT):
+        return (heapq.nlargest if descending else heapq.nsmallest)(max(limit, 0), iterable, key=key)
+    if limit is None and max_memory is not None:
+        from anlinq.spill import external_sort
+        return external_sort(iterable, key, descending, max_memory)
+    ordered = sorted(iterable, key=key, reverse=descending)
+    return ordered if limit is None else ordered[:max(limit, 0)]
+
+
+_MISSING = object()
+_new = object.__new__
+
+
+def _sum_count(iterable):
+    """
+    Sums numbers and counts them in one pass using only builtins:
+    zip pulls counter once per number, so counter stops at number of items
+    """
+    counter = itertools.count()
+    total = sum(map(operator.itemgetter(0), zip(iterable, counter)))
+    return total, next(counter)
+
+
+def _percentile(ordered, percent):
+    """
+    Linear interpolation between closest ranks of sorted values, same as numpy default
+    """
+    position = (len(ordered) - 1) * percent / 100.0
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _group_adjacent(iterable, key_selector, value_selector):
+    for key, group in itertools.groupby(iterable, key_selector):
+        yield key, AnLinq(list(group) if value_selector is None else list(map(value_selector, group)))
+
+
+def _take_while(iterable, predicate):
+    return itertools.takewhile(_function(predicate), iterable)
+
+
+def _skip_while(iterable, predicate):
+    return itertools.dropwhile(_function(predicate), iterable)
+
+
+def _chunk(iterable, size):
+    iterator = iter(iterable)
+    return iter(lambda: list(itertools.islice(iterator, size)), [])
+
+
+def _window(iterable, size, step):
+    """
+    Sliding (step < size), tumbling (step == size) or hopping (step > size) windows as tuples.
+    Deque drops the oldest items as new ones are appended, so every step costs O(step), not O(size).
+    """
+    iterator = iter(iterable)
+    window = collections.deque(itertools.islice(iterator, size), size)
+    while len(window) == size:
+        yield tuple(window)
+        if step >= size:
+            window.clear()
+            # items between hopping windows are never part of any window
+            collections.deque(itertools.islice(iterator, step - size), 0)
+        added = list(itertools.islice(iterator, min(step, size)))
+        if step < size and len(added) < step:
+            return
+        window.extend(added)
+
+
+def _pairwise(iterable):
+    first, second = itertools.tee(iterable)
+    next(second, None)
+    return zip(first, second)
+
+
+def _scan(iterable, func, seed):
+    for index, i in enumerate(iterable):
+        seed = func(seed, i, index)
+        yield seed
+
+
+def _rolling(iterable, size, func, selector):
+    """
+    Aggregates of sliding windows, updated incrementally: sums add entering and subtract leaving value,
+    minimums and maximums keep monotonic deque of candidates, so every step is O(1) amortized
+    """
+    values = iterable if selector is None else map(_function(selector), iterable)
+    window = collections.deque()
+    if func in ('sum', 'average'):
+        total = 0
+        for value in values:
+            window.append(value)
+            total += value
+            if len(window) > size:
+                total -= window.popleft()
+            if len(window) == size:
+                yield total if func == 'sum' else total / float(size)
+        return
+
+    better = operator.lt if func == 'min' else operator.gt
+    for index, value in enumerate(values):
+        while window and not better(window[-1][1], value):
+            window.pop()
+        window.append((index, value))
+        if window[0][0] <= index - size:
+            window.popleft()
+        if index >= size - 1:
+            yield window[0][1]
+
+
+def _zip_with(iterable, other, result_selector):
+    if result_selector is None:
+        return zip(iterable, other)
+    return map(result_selector, iterable, other)
+
+
+def _batches(iterable, func, size):
+    """
+    Calls func once per list of up to size items, checking it returns one result per item
+    :return: iterator of (items, results) pairs
+    """
+    func = _function(func)
+    for chunk in _chunk(iterable, size):
+        results = func(chunk)
+        if not hasattr(results, '__len__'):
+            results = list(results)
+        if len(results) != len(chunk):
+            raise AnLinq.AnLinqException("Batch function returned " + repr(len(results)) + " results for " +
+                                         repr(len(chunk)) + " items")
+        yield chunk, results
+
+
+def _select_batch(iterable, func, size):
+    return itertools.chain.from_iterable(results for chunk, results in _batches(iterable, func, size))
+
+
+def _where_batch(iterable, func, size):
+    return itertools.chain.from_iterable(itertools.compress(chunk, flags)
+                                         for chunk, flags in _batches(iterable, func, size))
+
+
+def _pair(outer, inner):
+    return outer, inner
+
+
+def _lookup(iterable, key_selector, value_selector=None):
+    """
+    Builds dict of lists, where each key holds all items (or values) with that key in original order
+    """
+    key_selector, value_selector = _function(key_selector), _function(value_selector)
+    result = {}
+    for i in iterable:
+        key = key_selector(i)
+        value = value_selector(i) if value_selector is not None else i
+        values = result.get(key)
+        if values is None:
+            result[key] = [value]
+        else:
+            values.append(value)
+    return result
+
+
+def _join(outer, inner, outer_key, inner_key, result_selector):
+    outer_len, inner_len = _static_len(outer), _static_len(inner)
+    if outer_len is not None and inner_len is not None and outer_len < inner_len:
+        table = _lookup(outer, outer_key)
+        for i in inner:
+            for o in table.get(inner_key(i), ()):
+                yield result_selector(o, i)
+    else:
+        table = _lookup(inner, inner_key)
+        for o in outer:
+            for i in table.get(outer_key(o), ()):
+                yield result_selector(o, i)
+
+
+def _left_join(outer, inner, outer_key, inner_key, result_selector, default):
+    table = _lookup(inner, inner_key)
+    defaults = (default,)
+    for o in outer:
+        for i in table.get(outer_key(o)) or defaults:
+            yield result_selector(o, i)
+
+
+def _group_join(outer, inner, outer_key, inner_key, result_selector):
+    table = _lookup(inner, inner_key)
+    for o in outer:
+        yield result_selector(o, AnLinq(table.get(outer_key(o), ())))
+
+
+def _semi_join(outer, inner, outer_key, inner_key):
+    return _kept(outer, _KeySet(map(inner_key, inner)), outer_key)
+
+
+def _anti_join(outer, inner, outer_key, inner_key):
+    return _dropped(outer, _KeySet(map(inner_key, inner)), outer_key)
+
+
+_PARTITION_STAGES = ('where', 'select', 'select_many', 'where_batch', 'select_batch')
+
+
+def _chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parallel_map(iterable, workers, backend, chunk_size, ordered, func, *args):
+    """
+    Runs func(chunk, *args) for chunks of iterable in process or thread pool and yields results.
+    Only limited number of chunks is in flight, so streaming sources are not read ahead unboundedly.
+    Results are yielded in order of chunks if ordered, otherwise as soon as they are ready.
+    """
+    from concurrent import futures
+    workers = workers or multiprocessing.cpu_count()
+    executor_class = futures.ProcessPoolExecutor if backend == 'process' else futures.ThreadPoolExecutor
+    executor = executor_class(workers)
+    pending = collections.deque()
+    try:
+        for chunk in _chunks(iterable, chunk_size):
+            pending.append(executor.submit(func, chunk, *args))
+            while len(pending) >= 2 * workers:
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, not_done = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    pending = collections.deque(not_done)
+                    for future in done:
+                        yield future.result()
+        while pending:
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                for future in futures.as_completed(list(pending)):
+                    pending.remove(future)
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+
+
+def _run_partition(chunk, stages):
+    return list(_Query(chunk, stages))
+
+
+def _count_partition(chunk, stages):
+    return sum(1 for _ in _Query(chunk, stages))
+
+
+def _aggregate_partition(chunk, stages, func, seed):
+    for index, i in enumerate(_Query(chunk, stages)):
+        seed = func(seed, i, index)
+    return seed
+
+
+def _group_partition(chunk, stages, key_selector, value_selector):
+    return _lookup(_Query(chunk, stages), key_selector, value_selector)
+
+
+def _sketch_partition(chunk, stages, sketch_class, args):
+    return sketch_class(*args).update(_Query(chunk, stages))
+
+
+def _parallel(iterable, workers, backend, chunk_size, ordered, stages):
+    return itertools.chain.from_iterable(
+        _parallel_map(iterable, workers, backend, chunk_size, ordered, _run_partition, stages))
+
+
+_STAGES = {
+    'where': _where,
+    'select': _select,
+    'select_many': _select_many,
+    'distinct': _distinct,
+    'take': _take,
+    'order_by': _order_by,
+    'skip': _skip,
+    'slice': _slice,
+    'concat': _concat,
+    'except_for': _except_for,
+    'intersect': _intersect,
+    'union': _union,
+    'symmetric_difference': _symmetric_difference,
+    'join': _join,
+    'left_join': _left_join,
+    'group_join': _group_join,
+    'semi_join': _semi_join,
+    'anti_join': _anti_join,
+    'parallel': _parallel,
+    'group_adjacent': _group_adjacent,
+    'take_while': _take_while,
+    'skip_while': _skip_while,
+    'chunk': _chunk,
+    'window': _window,
+    'pairwise': _pairwise,
+    'scan': _scan,
+    'rolling': _rolling,
+    'zip': _zip_with,
+    'select_batch': _select_batch,
+    'where_batch': _where_batch,
+}
+
+
+_DISTINCT_STAGES = ('distinct', 'union', 'symmetric_difference')
+# stages which return new list when they return list
+_LIST_STAGES = ('order_by', 'take', 'skip')
+
+
+def _rewrite(stages):
+    """
+    Applies first matching rewrite rule to the tail of stages list in place
+    :return: True if stages were changed
+    :rtype: bool
+    """
+    (previous, previous_args), (name, args) = stages[-2], stages[-1]
+    if previous == 'where' and name == 'where':
+        stages[-2:] = [('where', previous_args + args)]
+    elif previous == 'skip' and name == 'skip':
+        stages[-2:] = [('skip', (max(previous_args[0], 0) + max(args[0], 0),))]
+    elif previous == 'take' and name == 'take':
+        stages[-2:] = [('take', (min(previous_args[0], args[0]),))]
+    elif previous == 'order_by' and name == 'take':
+        # heap top-k instead of full sort
+        limit = previous_args[1]
+        stages[-2:] = [('order_by', (previous_args[0], args[0] if limit is None else min(limit, args[0]),
+                                     previous_args[2]))]
+    elif len(stages) > 2 and stages[-3][0] == 'order_by' and previous == 'skip' and name == 'take':
+        keys, limit, max_memory = stages[-3][1]
+        needed = max(previous_args[0], 0) + max(args[0], 0)
+        if limit is not None and limit <= needed:
+            return False
+        stages[-3] = ('order_by', (keys, needed, max_memory))
+    elif previous in _DISTINCT_STAGES and name == 'distinct' and \
+            previous_args[0 if previous == 'distinct' else -1] is args[0]:
+        # items are distinct by the same key already
+        stages.pop()
+    elif previous == 'distinct' and name in ('union', 'symmetric_difference') and previous_args[0] is args[-1] \
+            and previous_args[1] is None:
+        # set operation makes items distinct by the same key anyway, unless distinct has to keep memory bounded
+        stages.pop(-2)
+    else:
+        return False
+    return True
+
+
+def _optimize(stages):
+    """
+    Rewrites operator stages into cheaper equivalent plan
+    :param stages: tuple of (name, args) stages as recorded
+    :return: tuple of optimized stages
+    :rtype: tuple
+    """
+    if len(stages) < 2:
+        return stages
+    result = []
+    for stage in stages:
+        result.append(stage)
+        while len(result) > 1 and _rewrite(result):
+            pass
+    return tuple(result)
+
+
+def _describe(value):
+    if hasattr(value, '__name__'):
+        return value.__name__
+    if value.__class__ is functools.partial:
+        return 'partial(' + _describe(value.func) + ')'
+    if isinstance(value, tuple):
+        return '(' + ', '.join(_describe(i) for i in value) + ')'
+    if isinstance(value, (list, dict, set, frozenset, _SequenceView)):
+        return value.__class__.__name__.lstrip('_') + '[' + repr(len(value)) + ']'
+    text = repr(value)
+    if text.startswith('<'):
+        return value.__class__.__name__.lstrip('_')
+    return text if len(text) <= 40 else text[:37] + '...'
+
+
+def _describe_plan(source, stages, indent='  '):
+    lines = [indent + 'source: ' + _describe(source)]
+    for name, args in stages:
+        if name == 'parallel':
+            workers, backend, chunk_size, ordered, partition_stages = args
+            lines.append(indent + 'parallel(workers=' + repr(workers) + ', backend=' + repr(backend) +
+                         ', chunk_size=' + repr(chunk_size) + ', ordered=' + repr(ordered) + ')')
+            lines.extend(_describe_plan('partition', partition_stages, indent + '  ')[1:])
+        elif name == 'order_by':
+            keys = ', '.join((_describe(key) if key is not None else 'item') + (' desc' if descending else '')
+                             for key, descending in args[0])
+            if args[1] is not None:
+                keys += ', top=' + repr(args[1])
+            elif args[2] is not None:
+                keys += ', max_memory=' + repr(args[2])
+            lines.append(indent + 'order_by(' + keys + ')')
+        elif name == 'distinct':
+            lines.append(indent + 'distinct(' + _describe(args[0]) +
+                         ('' if len(args) < 2 or args[1] is None else ', max_memory=' + repr(args[1])) + ')')
+        else:
+            lines.append(indent + name + '(' + ', '.join(_describe(arg) for arg in args) + ')')
+    return lines
+
+
+class _Query(object):
+    """
+    Deferred pipeline: source iterable plus recorded operator stages.
+    Stages are optimized and composed into a single lazy pass only when query is iterated,
+    and every iteration replays them from the source, so query may be consumed many times.
+    """
+    __slots__ = ('source', 'stages', 'plan')
+
+    def __init__(self, source, stages):
+        self.source = source
+        self.stages = stages
+        self.plan = None
+
+    def __iter__(self):
+        if _instrumentation.hooks and not _instrumentation.is_reporting():
+            if self.plan is None:
+                self.plan = _optimize(self.stages)
+            return _instrumentation.run(self.source, self.plan, list(_instrumentation.hooks))
+        return iter(self._compose())
+
+    def _compose(self):
+        """
+        Composes stages over source. Small lists and tuples run stages as recorded,
+        as optimizing the plan costs more than it saves on few items.
+        """
+        source = self.source
+        if source.__class__ in _SLICEABLE_TYPES and len(source) <= _SMALL_INPUT:
+            stages = self.stages
+        else:
+            if self.plan is None:
+                self.plan = _optimize(self.stages)
+            stages = self.plan
+        iterable = source
+        functions = _STAGES
+        for name, args in stages:
+            iterable = functions[name](iterable, *args)
+        return iterable
+
+    def to_list(self):
+        if _instrumentation.hooks:
+            return list(self)
+        items = self._compose()
+        # ordered items and slices are new lists already
+        if items.__class__ is list and self.stages and self.stages[-1][0] in _LIST_STAGES:
+            return items
+        return list(items)
+
+
+# stages which number of items may be known without running them, see _static_len
+_SIZED_STAGES = ('select', 'select_batch', 'order_by', 'take', 'skip', 'slice', 'concat', 'parallel', 'scan', 'zip',
+                 'chunk', 'pairwise', 'window', 'rolling')
+
+
+def _static_len(iterable):
+    """
+    Computes number of items without iterating, when it is statically known
+    :return: number of items or None if it can be found only by iteration
+    :rtype: int
+    """
+    if iterable.__class__ is AnLinq:
+        return _static_len(iterable.iterable)
+    if iterable.__class__ is not _Query:
+        return len(iterable) if hasattr(iterable, '__len__') else None
+
+    source = iterable.source
+    length = len(source) if source.__class__ in _SEQUENCE_TYPES else _static_len(source)
+    for name, args in iterable.stages:
+        if length is None:
+            return None
+        if name in ('select', 'select_batch'):
+            pass
+        elif name == 'order_by':
+            length = length if args[1] is None else min(length, max(args[1], 0))
+        elif name == 'take':
+            length = min(length, max(args[0], 0))
+        elif name == 'skip':
+            length = max(length - max(args[0], 0), 0)
+        elif name == 'slice':
+            length = _slice_len(length, args[0])
+        elif name == 'concat':
+            other = _static_len(args[0])
+            length = None if other is None else length + other
+        elif name == 'parallel' and all(stage[0] == 'select' for stage in args[-1]):
+            pass
+        elif name == 'scan':
+            pass
+        elif name == 'zip':
+            other = _static_len(args[0])
+            length = None if other is None else min(length, other)
+        elif name == 'chunk':
+            length = -(-length // args[0])
+        elif name == 'pairwise':
+            length = max(length - 1, 0)
+        elif name in ('window', 'rolling'):
+            size, step = args[0], args[1] if name == 'window' else 1
+            length = 0 if length < size else (length - size) // step + 1
+        else:
+            return None
+    return length
+
+
+class _Memoized(object):
+    """
+    Buffers upstream iterable exactly once and shares buffered items between all consumers.
+    Upstream is pulled lazily, only as far as the most advanced consumer needs.
+    """
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.iterator = None
+        self.buffer = []
+        self.done = False
+
+    def __iter__(self):
+        index = 0
+        while True:
+            if index < len(self.buffer):
+                yield self.buffer[index]
+            elif self.done:
+                return
+            else:
+                if self.iterator is None:
+                    self.iterator = iter(self.iterable)
+                try:
+                    item = next(self.iterator)
+                except StopIteration:
+                    self.done = True
+                    self.iterable = self.iterator = None
+                    return
+                self.buffer.append(item)
+                yield item
+            index += 1
+
+
+def _cache_key(value):
+    """
+    Converts stage arguments to hashable key: expressions are compared by their text, functions by identity
+    :return: hashable value
+    """
+    if value.__class__ is Expression:
+        return 'F:' + repr(value)
+    if isinstance(value, tuple):
+        return tuple(_cache_key(i) for i in value)
+    if value.__class__ is slice:
+        return 'slice', value.start, value.stop, value.step
+    hash(value)
+    return value
+
+
+class _Cached(object):
+    """
+    Serves results of upstream query from QueryCache, computing them on miss.
+    Key consists of source identity, source version attribute if source has one, and operator chain,
+    so sources which bump version on mutation invalidate their entries automatically.
+    """
+
+    def __init__(self, iterable, key, ttl, cache):
+        source, stages = (iterable.source, iterable.stages) if iterable.__class__ is _Query else (iterable, ())
+        if source.__class__ is _SequenceView:
+            source, stages = source.sequence, (('view', source.slices), stages)
+        if key is None:
+            try:
+                key = _cache_key(stages)
+            except TypeError:
+                raise AnLinq.AnLinqException("Query has unhashable arguments, cached requires explicit key")
+        self.iterable = iterable
+        self.source = source
+        self.key = key
+        self.ttl = ttl
+        self.cache = cache
+
+    def __iter__(self):
+        key = (id(self.source), getattr(self.source, 'version', None), self.key)
+        found, items = self.cache.get(key)
+        if not found:
+            items = list(self.iterable)
+            self.cache.put(key, items, self.source, self.ttl)
+        return iter(items)
+
+
+class _Instrumented(object):
+    """
+    Runs upstream query with probes after every stage and reports statistics to callback and global hooks
+    """
+
+    def __init__(self, iterable, callback, allocations):
+        self.iterable = iterable
+        self.callback = callback
+        self.allocations = allocations
+
+    def __iter__(self):
+        if self.iterable.__class__ is _Query:
+            source, plan = self.iterable.source, _optimize(self.iterable.stages)
+        else:
+            source, plan = self.iterable, ()
+        callbacks = ([self.callback] if self.callback is not None else []) + list(_instrumentation.hooks)
+        return _instrumentation.run(source, plan, callbacks, self.allocations)
 
 
 class AnLinq(object):
     """Allows to apply AnLinq-like methods to wrapped iterable"""
+    __slots__ = ('iterable',)
 
     class AnLinqException(Exception):
         """
@@ -41,6 +967,17 @@ class AnLinq(object):
         """
         pass
 
+    Stats = collections.namedtuple('Stats', ['count', 'sum', 'min', 'max', 'mean', 'variance'])
+
+    class Lookup(dict):
+        """
+        Multi-map returned by to_lookup: each key holds AnLinq with all values for that key.
+        Missing keys give empty AnLinq instead of KeyError.
+        """
+
+        def __missing__(self, key):
+            return AnLinq([])
+
     def __init__(self, iterable):
         """
         Instantiates AnLinq wrapper
@@ -55,6 +992,106 @@ class AnLinq(object):
         else:
             self.iterable = iterable
 
+    @staticmethod
+    def from_async(iterable):
+        """
+        Wraps async iterable, so AnLinq methods can be applied to it with async selectors and predicates
+        :param iterable: async iterable or plain iterable
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        from anlinq.async_anlinq import AsyncAnLinq
+        return AsyncAnLinq(iterable)
+
+    @staticmethod
+    def from_array(columns, vectorize=False):
+        """
+        Wraps NumPy array or dict of column arrays in columnar mode with vectorized where, select and aggregates.
+        Requires numpy.
+        :param columns: array-like or dict of equally sized array-likes
+        :param vectorize: if True plain functions are applied to whole columns too, not only expressions,
+                          see ColumnarAnLinq
+        :return: results wrapped with ColumnarAnLinq
+        :rtype: ColumnarAnLinq
+        """
+        from anlinq.columnar import ColumnarAnLinq
+        return ColumnarAnLinq(columns, vectorize)
+
+    @staticmethod
+    def from_buffer(buffer):
+        """
+        Wraps items encoded with to_buffer or to_shared_memory. Numeric columns are read from the buffer
+        without copying, items are decoded when pulled. Call iterable.release() before closing shared memory or mmap.
+        :param buffer: bytes, bytearray, memoryview, mmap or multiprocessing.shared_memory.SharedMemory
+        :return: results wrapped with AnLinq over anlinq.buffers.BufferTable
+        :rtype: AnLinq
+        """
+        from anlinq.buffers import BufferTable
+        return AnLinq(BufferTable(buffer))
+
+    @staticmethod
+    def from_lines(path, encoding='utf-8', start=0, end=None, raw_filter=None):
+        """
+        Lazily reads lines of text file, without line terminators. Query reopens file on every iteration.
+        :param path: path to file
+        :param encoding: encoding of file, None gives raw bytes
+        :param start: first byte of range, see anlinq.sources.byte_ranges
+        :param end: byte after the range, end of file by default
+        :param raw_filter: function which takes raw line bytes and returns bool, applied before decoding
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        from anlinq.sources import LineSource
+        lines = AnLinq(LineSource(path, start, end, raw_filter))
+        return lines if encoding is None else lines.select(operator.methodcaller('decode', encoding))
+
+    @staticmethod
+    def from_jsonl(path, start=0, end=None, raw_filter=None):
+        """
+        Lazily reads JSON Lines file, one decoded JSON value per non-empty line
+        :param path: path to file
+        :param start: first byte of range, see anlinq.sources.byte_ranges
+        :param end: byte after the range, end of file by default
+        :param raw_filter: function which takes raw line bytes and returns bool, applied before JSON decoding,
+                           like lambda line: b'"error"' in line
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        from anlinq.sources import LineSource
+        return AnLinq(LineSource(path, start, end, raw_filter)).where(bool).select(json.loads)
+
+    @staticmethod
+    def from_csv(path, header=True, encoding='utf-8', start=0, end=None, raw_filter=None, **fmtparams):
+        """
+        Lazily reads CSV file
+        :param path: path to file
+        :param header: if True first line contains field names and rows are dicts, otherwise rows are lists
+        :param encoding: encoding of file
+        :param start: first byte of range, see anlinq.sources.byte_ranges
+        :param end: byte after the range, end of file by default
+        :param raw_filter: function which takes raw line bytes and returns bool, applied before parsing
+        :param fmtparams: csv.reader formatting parameters, like delimiter
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        from anlinq.sources import CsvSource
+        return AnLinq(CsvSource(path, start, end, raw_filter, header, encoding, **fmtparams))
+
+    @staticmethod
+    def from_binary_records(path, struct_format, start=0, end=None):
+        """
+        Lazily unpacks fixed size binary records from memory-mapped file.
+        Records are tuples, or plain values when format has single field. Count is known without reading.
+        :param path: path to file
+        :param struct_format: struct format of one record, like '<id'
+        :param start: first byte of range, see anlinq.sources.byte_ranges
+        :param end: byte after the range, end of file by default
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        from anlinq.sources import RecordSource
+        return AnLinq(RecordSource(path, struct_format, start, end))
+
     def __repr__(self):
         return repr(self.to_list())
 
@@ -66,17 +1103,150 @@ class AnLinq(object):
 
     def __getitem__(self, index):
         """
-        Defines operator[]
-        :param index: numeric index of item in iterable
-        :return: item
-        :rtype: object
+        Defines operator[], supports negative indexes and slices.
+        Sequences (lists, tuples, ranges, arrays) are indexed directly and sliced into lazy views.
+        :param index: numeric index of item in iterable or slice
+        :return: item or slice wrapped with AnLinq
+        :rtype: object
+        """
+        if isinstance(index, slice):
+            if _is_sequence(self.iterable):
+                return AnLinq(_view(self.iterable, index))
+            return self._then('slice', index)
+
+        sequence, selectors = self.iterable, ()
+        if sequence.__class__ is _Query and all(name == 'select' for name, args in sequence.stages):
+            sequence, selectors = sequence.source, [args[0] for name, args in sequence.stages]
+
+        if _is_sequence(sequence):
+            try:
+                item = sequence[index]
+            except IndexError:
+                count = len(sequence)
+            else:
+                for selector in selectors:
+                    item = selector(item)
+                return item
+        elif index < 0:
+            items = collections.deque(self.iterable, -index)
+            if len(items) == -index:
+                return items[0]
+            count = len(items)
+        else:
+            count = 0
+            for item in self.iterable:
+                if count == index:
+                    return item
+                count += 1
+        raise AnLinq.AnLinqException("Index " + repr(index) + " is out of range (" + repr(count) + ")")
+
+    def _last_stage(self):
+        """
+        :return: (name, args) of the last recorded stage or None for plain iterable
+        :rtype: tuple
+        """
+        if self.iterable.__class__ is _Query and self.iterable.stages:
+            return self.iterable.stages[-1]
+        return None
+
+    def _replace_last(self, name, *args):
+        """
+        Replaces last recorded stage of deferred pipeline
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return AnLinq(_Query(self.iterable.source, self.iterable.stages[:-1] + ((name, args),)))
+
+    def _parallel_stage(self):
+        """
+        :return: arguments of the last stage if it is parallel, otherwise None
+        :rtype: tuple
+        """
+        iterable = self.iterable
+        if iterable.__class__ is _Query and iterable.stages and iterable.stages[-1][0] == 'parallel':
+            return iterable.stages[-1][1]
+        return None
+
+    def _partial_results(self, func, *args):
+        """
+        Runs func(chunk, stages, *args) over partitions of parallel query
+        :return: iterable of partial results, one per partition
+        """
+        workers, backend, chunk_size, ordered, stages = self._parallel_stage()
+        upstream = _Query(self.iterable.source, self.iterable.stages[:-1])
+        return _parallel_map(upstream, workers, backend, chunk_size, ordered, func, stages, *args)
+
+    def _partition(self, name, *args):
+        """
+        Merges stage into the last parallel stage, so it runs on every partition in pool
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        workers, backend, chunk_size, ordered, stages = self._parallel_stage()
+        return self._replace_last('parallel', workers, backend, chunk_size, ordered, stages + ((name, args),))
+
+    def _then(self, name, *args):
+        """
+        Appends operator stage to deferred pipeline.
+        Element-wise stages following as_parallel are merged into parallel stage to run on partitions.
+        :param name: stage name, key of _STAGES
+        :param args: stage arguments
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        iterable = self.iterable
+        # every operator goes through here, so objects are created without calling __init__
+        query = _new(_Query)
+        query.plan = None
+        if iterable.__class__ is not _Query:
+            query.source, query.stages = iterable, ((name, args),)
+        else:
+            stages = iterable.stages
+            if stages and stages[-1][0] == 'parallel' and name in _PARTITION_STAGES:
+                return self._partition(name, *args)
+            query.source, query.stages = iterable.source, stages + ((name, args),)
+        result = _new(AnLinq)
+        result.iterable = query
+        return result
+
+    def instrument(self, callback=None, allocations=False):
+        """
+        Profiles the query so far every time it is iterated: counts items in and out of source and every stage,
+        and measures their own wall and CPU time. Report is passed to callback and to hooks added with
+        anlinq.instrumentation.add_hook, when iteration finishes or stops.
+        :param callback: function which takes anlinq.instrumentation.Report
+        :param allocations: if True, net memory allocated by every stage is measured with tracemalloc
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return AnLinq(_Instrumented(self.iterable, callback, allocations))
+
+    def profile(self, allocations=False):
+        """
+        Runs the query and reports statistics of its source and every stage
+        :param allocations: if True, net memory allocated by every stage is measured with tracemalloc
+        :return: report
+        :rtype: anlinq.instrumentation.Report
+        """
+        reports = []
+        for _ in self.instrument(reports.append, allocations):
+            pass
+        return reports[0]
+
+    def explain(self):
+        """
+        Describes how query is executed: stages as recorded and plan after optimization,
+        where adjacent filters are merged, skips and takes are collapsed, take after ordering becomes
+        top-k selection and redundant distinct stages are dropped.
+        :return: text with original and optimized plans
+        :rtype: str
         """
-        count = 0
-        for item in self.iterable:
-            if count == index:
-                return item
-            count += 1
-        raise AnLinq.AnLinqException("Index " + repr(index) + " is out of range (" + repr(count) + ")")
+        if self.iterable.__class__ is _Query:
+            source, stages = self.iterable.source, self.iterable.stages
+        else:
+            source, stages = self.iterable, ()
+        return '\n'.join(['Original plan:'] + _describe_plan(source, stages) +
+                         ['Optimized plan:'] + _describe_plan(source, _optimize(stages)))
 
     def __len__(self):
         """
@@ -92,11 +1262,28 @@ class AnLinq(object):
         :return: number of items in iterable
         :rtype: int
         """
-        if hasattr(self.iterable, '__len__'):
-            return len(self.iterable)
+        iterable = self.iterable
+        if iterable.__class__ is _Query:
+            # trailing stages which keep number of items do not need to run, order_by has no limit until optimized
+            stages = iterable.stages
+            while stages and (stages[-1][0] == 'select' or stages[-1][0] == 'order_by' and stages[-1][1][1] is None):
+                stages = stages[:-1]
+            if stages is not iterable.stages:
+                iterable = _Query(iterable.source, stages)
+            source = iterable.source
+            if stages and stages[-1][0] not in _SIZED_STAGES and source.__class__ in _SLICEABLE_TYPES and \
+                    len(source) <= _SMALL_INPUT:
+                # few items are collected by C-level iteration, which is cheaper than counting them in python
+                return len(iterable.to_list())
+
+        length = _static_len(iterable)
+        if length is not None:
+            return length
+        if self._parallel_stage() is not None:
+            return sum(self._partial_results(_count_partition))
 
         count = 0
-        for item in self.iterable:
+        for item in iterable:
             count += 1
         return count
 
@@ -106,7 +1293,7 @@ class AnLinq(object):
         :return: True if items are equal
         :rtype: bool
         """
-        return self.iterable == other.iterable if isinstance(other, self.__class__) else self.to_list() == other
+        return self.to_list() == (other.to_list() if isinstance(other, self.__class__) else other)
 
     def __ne__(self, other):
         """
@@ -151,7 +1338,11 @@ class AnLinq(object):
         :return: item
         :rtype: object
         """
-        for i in self.iterable:
+        iterable = self.iterable
+        stage = self._last_stage()
+        if predicate is None and stage is not None and stage[0] == 'order_by':
+            iterable = self.take(1).iterable
+        for i in iterable:
             if predicate is None:
                 return i
             elif predicate(i):
@@ -179,6 +1370,12 @@ class AnLinq(object):
         :return: item
         :rtype: object
         """
+        if _is_sequence(self.iterable):
+            for i in reversed(self.iterable):
+                if predicate is None or predicate(i):
+                    return i
+            raise AnLinq.AnLinqException('No matching items!')
+
         last_item = None
         last_item_set = False
         for i in self.iterable:
@@ -209,6 +1406,8 @@ class AnLinq(object):
         :return: list
         :rtype: list
         """
+        if self.iterable.__class__ is _SequenceView or self.iterable.__class__ is _Query:
+            return self.iterable.to_list()
         return list(self.iterable)
 
     def to_dictionary(self, key_selector=None, value_selector=None, unique=True):
@@ -233,6 +1432,57 @@ class AnLinq(object):
             result[key] = value
         return result
 
+    def to_lookup(self, key_selector, value_selector=None):
+        """
+        Converts LinqIterable to multi-map, where every key may hold many values
+        :param key_selector: function which takes item and returns key for it
+        :param value_selector: function which takes item and returns value for it
+        :return: AnLinq.Lookup, where value is AnLinq for given key
+        :rtype: AnLinq.Lookup
+        """
+        result = AnLinq.Lookup()
+        for key, values in _lookup(self.iterable, key_selector, value_selector).items():
+            result[key] = AnLinq(values)
+        return result
+
+    def to_array(self, typecode=None):
+        """
+        Converts numbers to compact array.array, which is pickled and shared as single buffer
+        :param typecode: array type code, 'q' (int64) if all items are ints, otherwise 'd' (float64) by default
+        :return: array
+        :rtype: array.array
+        """
+        if typecode is not None:
+            return array.array(typecode, self.iterable)
+        items = self.to_list()
+        typecode = 'q' if all(i.__class__ is int for i in items) else 'd'
+        return array.array(typecode, items)
+
+    def to_buffer(self):
+        """
+        Encodes items to compact columnar binary layout, see anlinq.buffers.
+        Plain values, dicts with the same string keys and tuples of equal length are stored as columns,
+        other items are pickled.
+        :return: buffer to be read with AnLinq.from_buffer
+        :rtype: bytearray
+        """
+        from anlinq.buffers import encode
+        return encode(self.iterable)
+
+    def to_shared_memory(self, name=None):
+        """
+        Encodes items to columnar binary layout in new shared memory block, see to_buffer.
+        Caller owns the block and should close and unlink it. Requires python 3.8+.
+        :param name: name of shared memory block, random by default
+        :return: shared memory block to be read with AnLinq.from_buffer
+        :rtype: multiprocessing.shared_memory.SharedMemory
+        """
+        from multiprocessing import shared_memory
+        data = self.to_buffer()
+        block = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+        block.buf[:len(data)] = data
+        return block
+
     def where(self, predicate):
         """
         Returns items which matching predicate function
@@ -240,18 +1490,35 @@ class AnLinq(object):
         :return: results wrapped with AnLinq
         :rtype: AnLinq
         """
-        return AnLinq([i for i in self.iterable if predicate(i)])
+        return self._then('where', predicate)
+
+    def where_batch(self, predicate, size):
+        """
+        Returns items matching predicate, which is called once per list of up to size items, lazily, keeping order
+        :param predicate: Function which takes list of items and returns list (or any sized iterable) of bools,
+                          one per item
+        :param size: maximal number of items passed to predicate at once
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if size < 1:
+            raise AnLinq.AnLinqException("size must be positive")
+        return self._then('where_batch', predicate, size)
 
-    def distinct(self, key_selector=None):
+    def distinct(self, key_selector=None, max_memory=None):
         """
         Filters distinct values from enumerable
         :param key_selector: function which takes item and returns key for it
+        :param max_memory: approximate number of bytes of keys to keep in memory. When keys take more,
+                           items are deduplicated in hash partitions spilled to temporary files,
+                           keys must be hashable and items must be picklable then.
         :return: results wrapped with AnLinq
         :rtype: AnLinq
         """
-        key_selector = key_selector if key_selector is not None else lambda item: item
-        keys = set()
-        return AnLinq([i for i in self.iterable if key_selector(i) not in keys and not keys.add(key_selector(i))])
+        if self._parallel_stage() is not None:
+            # duplicates are dropped within every partition first, and then across partitions
+            return self._partition('distinct', key_selector, None)._then('distinct', key_selector, max_memory)
+        return self._then('distinct', key_selector, max_memory)
 
     def group_by(self, key_selector=None, value_selector=None):
         """
@@ -261,32 +1528,225 @@ class AnLinq(object):
         :return: Dictionary, where value if AnLinq for given key
         :rtype: dict
         """
-        key_selector = key_selector if key_selector is not None else lambda item: item
-        value_selector = value_selector if value_selector is not None else lambda item: item
+        if key_selector is None:
+            key_selector = _identity
+        if self._parallel_stage() is not None:
+            result = {}
+            for partial in self._partial_results(_group_partition, key_selector, value_selector):
+                for key, values in partial.items():
+                    if key in result:
+                        result[key].extend(values)
+                    else:
+                        result[key] = values
+            for key in result:
+                result[key] = AnLinq(result[key])
+            return result
 
-        result = {}
-        for i in self.iterable:
-            key = key_selector(i)
-            if result.__contains__(key):
-                result[key].append(value_selector(i))
-            else:
-                result[key] = [value_selector(i)]
+        result = _lookup(self.iterable, key_selector, value_selector)
         for key in result:
             result[key] = AnLinq(result[key])
         return result
 
-    def order_by(self, comparer=None, descending=False):
+    def aggregate_by(self, key_selector, func, value_selector=None, seed=None):
+        """
+        Groups items by keys and folds every value into per-key accumulator as it arrives,
+        so only one accumulator per key is kept in memory instead of all grouped values.
+        :param key_selector: function which takes item and returns key for it
+        :param func: one of 'count', 'sum', 'min', 'max', 'average',
+                     or function which takes accumulated value and this value and returns new accumulated value
+        :param value_selector: function which takes item and returns value to aggregate
+        :param seed: initial accumulated value of every key for func function, should be immutable
+        :return: Dictionary, where value is aggregated value for given key
+        :rtype: dict
+        """
+        key_selector, value_selector = _function(key_selector), _function(value_selector)
+        if func == 'count':
+            return dict(collections.Counter(map(key_selector, self.iterable)))
+
+        result = {}
+        if func in ('sum', 'average'):
+            counts = collections.Counter()
+            for i in self.iterable:
+                key = key_selector(i)
+                result[key] = result.get(key, 0) + (value_selector(i) if value_selector is not None else i)
+                counts[key] += 1
+            if func == 'average':
+                for key in result:
+                    result[key] = float(result[key]) / counts[key]
+        elif func in ('min', 'max'):
+            better = operator.lt if func == 'min' else operator.gt
+            for i in self.iterable:
+                key = key_selector(i)
+                value = value_selector(i) if value_selector is not None else i
+                current = result.get(key, _MISSING)
+                if current is _MISSING or better(value, current):
+                    result[key] = value
+        elif callable(func):
+            for i in self.iterable:
+                key = key_selector(i)
+                result[key] = func(result.get(key, seed), value_selector(i) if value_selector is not None else i)
+        else:
+            raise AnLinq.AnLinqException("Unknown aggregate " + repr(func))
+        return result
+
+    def group_adjacent(self, key_selector=None, value_selector=None):
         """
-        Orders items.
+        Groups runs of adjacent items with equal keys, lazily, for input which is already sorted by key.
+        Only current group is kept in memory, the same key may appear again if input is not sorted.
+        :param key_selector: function which takes item and returns key for it
         :param value_selector: function which takes item and returns value for it
+        :return: (key, AnLinq of values) pairs wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('group_adjacent', key_selector, value_selector)
+
+    def take_while(self, predicate):
+        """
+        Takes items while they match predicate, stops at the first item which does not
+        :param predicate: Function which takes item as argument and returns bool
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('take_while', predicate)
+
+    def skip_while(self, predicate):
+        """
+        Skips items while they match predicate, returns the first item which does not and all items after it
+        :param predicate: Function which takes item as argument and returns bool
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('skip_while', predicate)
+
+    def chunk(self, size):
+        """
+        Splits items into consecutive lists of given size, lazily, last list may be shorter
+        :param size: number of items in list
+        :return: lists wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if size < 1:
+            raise AnLinq.AnLinqException("size must be positive")
+        return self._then('chunk', size)
+
+    def batch(self, size):
+        """
+        Splits items into consecutive lists of given size, lazily, last list may be shorter
+        :param size: number of items in list
+        :return: lists wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self.chunk(size)
+
+    def window(self, size, step=1):
+        """
+        Returns windows of size consecutive items as tuples, lazily, starting every step items:
+        sliding windows for step less than size, tumbling for step equal to size, with gaps for step greater than size.
+        Only full windows are returned, keeping at most size items in memory.
+        :param size: number of items in window
+        :param step: number of items window moves by
+        :return: tuples wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if size < 1 or step < 1:
+            raise AnLinq.AnLinqException("size and step must be positive")
+        return self._then('window', size, step)
+
+    def pairwise(self):
+        """
+        Returns pairs of adjacent items: (first, second), (second, third) and so on
+        :return: tuples wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('pairwise')
+
+    def rolling(self, size, func='sum', selector=None):
+        """
+        Aggregates every sliding window of size items, lazily. Aggregates are updated incrementally
+        when window moves instead of being recalculated over the whole window.
+        :param size: number of items in window
+        :param func: one of 'sum', 'average', 'min', 'max'
+        :param selector: function which takes item and returns value to aggregate
+        :return: aggregated values wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if size < 1:
+            raise AnLinq.AnLinqException("size must be positive")
+        if func not in ('sum', 'average', 'min', 'max'):
+            raise AnLinq.AnLinqException("func must be one of 'sum', 'average', 'min', 'max'")
+        return self._then('rolling', size, func, selector)
+
+    def scan(self, func, seed=None):
+        """
+        Returns every intermediate value of aggregate, lazily
+        :param func: function which takes prev value, this value and index to aggregate one step
+        :param seed: initial value, will be used as prev on first iteration
+        :return: aggregated values wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('scan', func, seed)
+
+    def zip(self, iterable, result_selector=None):
+        """
+        Combines items with items of another iterable at the same positions, stops at the end of shorter one
+        :param iterable: Any iterable
+        :param result_selector: function which takes item and item of another iterable and returns result,
+                                (item, other) tuple by default
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('zip', _reiterable(iterable), result_selector)
+
+    def order_by(self, comparer=None, descending=False, key=None, max_memory=None):
+        """
+        Orders items. Sort is stable, key is preferable to comparer as it is called once per item.
+        When followed by take or first only needed items are selected with a heap instead of full sort.
         :param comparer: function which takes to items and compare them returning int
         :param descending: shows how items will be sorted
+        :param key: function which takes item and returns value to sort by
+        :param max_memory: approximate number of bytes of items to keep in memory. Larger input is sorted
+                           in runs of that size, which are spilled to temporary files and merged,
+                           items must be picklable then.
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
         """
-        if sys.version.startswith('2'):
-            return AnLinq(sorted(self.iterable, comparer, None, descending))
-        else:
-            key = functools.cmp_to_key(comparer) if comparer else None
-            return AnLinq(sorted(self.iterable, key=key, reverse=descending))
+        if comparer is not None:
+            if key is not None:
+                raise AnLinq.AnLinqException("Either comparer or key can be given, not both")
+            key = functools.cmp_to_key(comparer)
+        return self._then('order_by', ((key, descending),), None, max_memory)
+
+    def order_by_descending(self, key=None, max_memory=None):
+        """
+        Orders items in descending order.
+        :param key: function which takes item and returns value to sort by
+        :param max_memory: approximate number of bytes of items to keep in memory, see order_by
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self.order_by(descending=True, key=key, max_memory=max_memory)
+
+    def then_by(self, key=None, descending=False):
+        """
+        Adds subsequent ordering for items which are equal by previous order_by / then_by keys.
+        :param key: function which takes item and returns value to sort by
+        :param descending: shows how items will be sorted
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        stage = self._last_stage()
+        if stage is None or stage[0] != 'order_by' or stage[1][1] is not None:
+            raise AnLinq.AnLinqException("then_by must directly follow order_by or then_by")
+        return self._replace_last('order_by', stage[1][0] + ((key, descending),), None, stage[1][2])
+
+    def then_by_descending(self, key=None):
+        """
+        Adds subsequent descending ordering for items which are equal by previous keys.
+        :param key: function which takes item and returns value to sort by
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self.then_by(key, True)
 
     def take(self, number):
         """
@@ -295,15 +1755,9 @@ class AnLinq(object):
         :return: results wrapped with AnLinq
         :rtype: AnLinq
         """
-        def internal_take(iterable, number_arg):
-            count = 0
-            for i in iterable:
-                count += 1
-                if count > number_arg:
-                    break
-                yield i
-
-        return AnLinq(internal_take(self.iterable, number))
+        if self.iterable.__class__ is not _Query and _is_sequence(self.iterable):
+            return AnLinq(_view(self.iterable, slice(None, max(number, 0))))
+        return self._then('take', number)
 
     def skip(self, number):
         """
@@ -312,15 +1766,9 @@ class AnLinq(object):
         :return: results wrapped with AnLinq
         :rtype: AnLinq
         """
-        def internal_skip(iterable, number_arg):
-            count = 0
-            for i in iterable:
-                count += 1
-                if count <= number_arg:
-                    continue
-                yield i
-
-        return AnLinq(internal_skip(self.iterable, number))
+        if self.iterable.__class__ is not _Query and _is_sequence(self.iterable):
+            return AnLinq(_view(self.iterable, slice(max(number, 0), None)))
+        return self._then('skip', number)
 
     def select(self, selector):
         """
@@ -329,7 +1777,7 @@ class AnLinq(object):
         :return: results wrapped with AnLinq
         :rtype: AnLinq
         """
-        return AnLinq([selector(i) for i in self.iterable])
+        return self._then('select', selector)
 
     def map(self, selector):
         """
@@ -342,20 +1790,43 @@ class AnLinq(object):
 
     def select_many(self, selector):
         """
-        Converts items in list with given function
+        Converts items in list with given function and flattens results
         :param selector: Function which takes item and returns iterable
         :return: results wrapped with AnLinq
         :rtype: AnLinq
         """
-        return AnLinq([i for i in [selector(sub) for sub in self.iterable]])
+        return self._then('select_many', selector)
+
+    def select_batch(self, func, size):
+        """
+        Converts items in lists of up to size items with one call per list, lazily, keeping order.
+        Use it for functions which are cheaper per batch, like bulk queries or vectorized model calls.
+        :param func: Function which takes list of items and returns list (or any sized iterable) of results,
+                     one per item
+        :param size: maximal number of items passed to func at once
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if size < 1:
+            raise AnLinq.AnLinqException("size must be positive")
+        return self._then('select_batch', func, size)
 
-    def aggregate(self, func, seed=None):
+    def aggregate(self, func, seed=None, combine=None):
         """
         Reduces list to a single variable
         :param func: function which takes prev value, this value and index to aggregate one step
         :param seed: initial value, will be used as prev on first iteration
-        :return: reduced value
-        """
+        :param combine: function which takes two partial results and merges them.
+                        When given for parallel query, every partition is reduced separately starting from seed,
+                        with index local to partition, and partial results are merged with combine.
+                        Seed is applied once per partition, so it has to be identity like 0 for sums
+                        or 1 for products to get the same result as sequential query.
+        :return: reduced value, seed if there are no items
+        """
+        if combine is not None and self._parallel_stage() is not None:
+            partials = iter(self._partial_results(_aggregate_partition, func, seed))
+            return functools.reduce(combine, partials, next(partials, seed))
+
         for index, i in enumerate(self.iterable):
             seed = func(seed, i, index)
 
@@ -370,6 +1841,205 @@ class AnLinq(object):
         """
         return self.aggregate(func, seed)
 
+    def _selected(self, selector):
+        return self.iterable if selector is None else map(_function(selector), self.iterable)
+
+    def sum(self, selector=None):
+        """
+        Sums items or values returned by selector
+        :param selector: function which takes item and returns number for it
+        :return: sum, 0 if there are no items
+        """
+        return sum(self._selected(selector))
+
+    def min(self, selector=None):
+        """
+        Finds minimal item or minimal value returned by selector.
+        Raises exception, if there are no items.
+        :param selector: function which takes item and returns value for it
+        :return: minimal value
+        """
+        result = min(self._selected(selector), default=_MISSING)
+        if result is _MISSING:
+            raise AnLinq.AnLinqException('No items!')
+        return result
+
+    def max(self, selector=None):
+        """
+        Finds maximal item or maximal value returned by selector.
+        Raises exception, if there are no items.
+        :param selector: function which takes item and returns value for it
+        :return: maximal value
+        """
+        result = max(self._selected(selector), default=_MISSING)
+        if result is _MISSING:
+            raise AnLinq.AnLinqException('No items!')
+        return result
+
+    def min_by(self, key):
+        """
+        Finds first item with minimal key.
+        Raises exception, if there are no items.
+        :param key: function which takes item and returns value to compare by
+        :return: item
+        :rtype: object
+        """
+        result = min(self.iterable, key=key, default=_MISSING)
+        if result is _MISSING:
+            raise AnLinq.AnLinqException('No items!')
+        return result
+
+    def max_by(self, key):
+        """
+        Finds first item with maximal key.
+        Raises exception, if there are no items.
+        :param key: function which takes item and returns value to compare by
+        :return: item
+        :rtype: object
+        """
+        result = max(self.iterable, key=key, default=_MISSING)
+        if result is _MISSING:
+            raise AnLinq.AnLinqException('No items!')
+        return result
+
+    def average(self, selector=None):
+        """
+        Calculates arithmetic mean of items or values returned by selector in one pass.
+        Raises exception, if there are no items.
+        :param selector: function which takes item and returns number for it
+        :return: mean value
+        :rtype: float
+        """
+        total, count = _sum_count(self._selected(selector))
+        if not count:
+            raise AnLinq.AnLinqException('No items!')
+        return float(total) / count
+
+    def variance(self, selector=None, sample=False):
+        """
+        Calculates variance of items or values returned by selector in one pass with Welford's algorithm.
+        Raises exception, if there are not enough items.
+        :param selector: function which takes item and returns number for it
+        :param sample: if True calculates unbiased sample variance, otherwise population variance
+        :return: variance
+        :rtype: float
+        """
+        stats = self.stats(selector)
+        if stats.count < (2 if sample else 1):
+            raise AnLinq.AnLinqException('Not enough items!')
+        return stats.variance * stats.count / (stats.count - 1) if sample else stats.variance
+
+    def percentile(self, percent, selector=None):
+        """
+        Calculates percentile of items or values returned by selector, interpolating between closest ranks.
+        Raises exception, if there are no items.
+        :param percent: number from 0 to 100, 50 gives median
+        :param selector: function which takes item and returns number for it
+        :return: percentile value
+        """
+        if not 0 <= percent <= 100:
+            raise AnLinq.AnLinqException("percent must be between 0 and 100")
+        ordered = sorted(self._selected(selector))
+        if not ordered:
+            raise AnLinq.AnLinqException('No items!')
+        return _percentile(ordered, percent)
+
+    def stats(self, selector=None):
+        """
+        Calculates count, sum, min, max, mean and population variance in one pass.
+        Sum is compensated (Kahan-Neumaier) and variance uses Welford's algorithm, so both stay accurate.
+        :param selector: function which takes item and returns number for it
+        :return: AnLinq.Stats, where min, max, mean and variance are None if there are no items
+        :rtype: AnLinq.Stats
+        """
+        count, total, compensation, low, high, mean, m2 = 0, 0, 0, None, None, 0.0, 0.0
+        for x in self._selected(selector):
+            count += 1
+            new_total = total + x
+            if abs(total) >= abs(x):
+                compensation += (total - new_total) + x
+            else:
+                compensation += (x - new_total) + total
+            total = new_total
+            if count == 1:
+                low = high = x
+            elif x < low:
+                low = x
+            elif x > high:
+                high = x
+            delta = x - mean
+            mean += delta / count
+            m2 += delta * (x - mean)
+
+        if not count:
+            return AnLinq.Stats(0, 0, None, None, None, None)
+        return AnLinq.Stats(count, total + compensation, low, high, mean, m2 / count)
+
+    def _sketch(self, sketch_class, args, selector):
+        """
+        Summarizes items or values returned by selector with sketch from anlinq.sketches.
+        Partitions of parallel query are summarized in pool and their sketches are merged.
+        :return: sketch
+        """
+        query = self if selector is None else self.select(selector)
+        if query._parallel_stage() is not None:
+            return functools.reduce(lambda merged, partial: merged.merge(partial),
+                                    query._partial_results(_sketch_partition, sketch_class, args), sketch_class(*args))
+        return sketch_class(*args).update(query.iterable)
+
+    def approx_count_distinct(self, selector=None, precision=14):
+        """
+        Estimates number of distinct items or values returned by selector with HyperLogLog,
+        using 2 ** precision bytes instead of set of all items
+        :param selector: function which takes item and returns value for it
+        :param precision: from 4 to 18, relative error is about 1.04 / sqrt(2 ** precision), 0.8% by default
+        :return: estimated number of distinct items
+        :rtype: int
+        """
+        from anlinq.sketches import HyperLogLog
+        return self._sketch(HyperLogLog, (precision,), selector).count()
+
+    def approx_top_k(self, k, selector=None, capacity=None):
+        """
+        Finds most frequent items or values returned by selector with Space-Saving algorithm,
+        counting at most capacity values instead of all of them.
+        Counts are overestimated by at most number of items / capacity.
+        :param k: number of values
+        :param selector: function which takes item and returns value for it
+        :param capacity: number of counted values, 10 * k but at least 100 by default
+        :return: list of (value, estimated count) pairs, most frequent first
+        :rtype: list
+        """
+        from anlinq.sketches import SpaceSaving
+        return self._sketch(SpaceSaving, (capacity or max(10 * k, 100),), selector).top(k)
+
+    def approx_quantile(self, quantile, selector=None, k=200):
+        """
+        Estimates quantile of items or values returned by selector with KLL sketch,
+        which keeps about 3 * k values instead of sorting all of them.
+        Raises exception, if there are no items.
+        :param quantile: number from 0 to 1, 0.5 gives median
+        :param selector: function which takes item and returns number for it
+        :param k: accuracy parameter, rank error is about 1.7 / k, under 1% by default
+        :return: value of approximately given rank
+        """
+        if not 0 <= quantile <= 1:
+            raise AnLinq.AnLinqException("quantile must be between 0 and 1")
+        from anlinq.sketches import KllSketch
+        return self._sketch(KllSketch, (k,), selector).quantile(quantile)
+
+    def sample(self, n, seed=None):
+        """
+        Takes uniform random sample of n items without replacement in one pass with reservoir sampling.
+        All items are taken, if there are not more than n of them.
+        :param n: number of items
+        :param seed: seed of random generator
+        :return: sampled items in random order, wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        from anlinq.sketches import Reservoir
+        return AnLinq(self._sketch(Reservoir, (n, seed), None).items)
+
     def foreach(self, func):
         """
         Allows to perform some action for each object in iterable, but not allows to redefine items
@@ -389,7 +2059,7 @@ class AnLinq(object):
         :return: self
         :rtype: AnLinq
         """
-        return AnLinq(itertools.chain(self.iterable, iterable))
+        return self._then('concat', _reiterable(iterable))
 
     def concat_item(self, item):
         """
@@ -398,22 +2068,267 @@ class AnLinq(object):
         :return: self
         :rtype: AnLinq
         """
-        return AnLinq(itertools.chain(self.iterable, [item]))
+        return self._then('concat', (item,))
+
+    def as_parallel(self, workers=None, backend='process', chunk_size=1024):
+        """
+        Runs following where, select and select_many in a pool, chunk by chunk, and merges results in order.
+        count, distinct, group_by and aggregate with combine right after them are computed per chunk as well.
+        Process backend requires functions and items to be picklable, so lambdas need thread backend.
+        :param workers: number of workers, number of CPUs by default
+        :param backend: 'process' for CPU-bound functions or 'thread' for functions releasing GIL
+        :param chunk_size: number of items sent to worker at once
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if backend not in ('process', 'thread'):
+            raise AnLinq.AnLinqException("Unknown backend " + repr(backend))
+        if chunk_size < 1:
+            raise AnLinq.AnLinqException("chunk_size must be positive")
+        return self._then('parallel', workers, backend, chunk_size, True, ())
+
+    def as_unordered(self):
+        """
+        Allows parallel query to yield chunk results as soon as they are ready, instead of source order
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        parallel = self._parallel_stage()
+        if parallel is None:
+            raise AnLinq.AnLinqException("as_unordered must follow as_parallel")
+        workers, backend, chunk_size, ordered, stages = parallel
+        return self._replace_last('parallel', workers, backend, chunk_size, False, stages)
+
+    def as_columnar(self, vectorize=False):
+        """
+        Collects items into NumPy arrays for vectorized processing, dict items become dict of columns.
+        Dicts with different keys can not be stored as columns, they stay rows of regular AnLinq then.
+        Requires numpy.
+        :param vectorize: if True plain functions are applied to whole columns too, see ColumnarAnLinq
+        :return: results wrapped with ColumnarAnLinq, or AnLinq for dicts with different keys
+        :rtype: AnLinq
+        """
+        items = self.to_list()
+        if items and all(isinstance(i, dict) for i in items):
+            names = items[0].keys()
+            if any(i.keys() != names for i in items):
+                return AnLinq(items)
+            return AnLinq.from_array(dict((name, [i[name] for i in items]) for name in names), vectorize)
+        return AnLinq.from_array(items, vectorize)
+
+    def with_index(self, key, *keys):
+        """
+        Builds hash and sorted indexes by given keys, so where and first with equality, isin and range
+        expressions on these keys take O(1) or O(log n) instead of scanning all items.
+        List, tuple and ObservableList are indexed in place, other sources are collected to list first.
+        Indexes are rebuilt when ObservableList or length of the source changes, and items found by index
+        are checked again, so replaced items of plain list are never returned by their old keys.
+        :param key: key selector or expression, like F.id
+        :param keys: more keys to index by
+        :return: results wrapped with IndexedAnLinq
+        :rtype: anlinq.indexes.IndexedAnLinq
+        """
+        from anlinq.indexes import IndexedAnLinq
+        items = self.iterable
+        if not (items.__class__ in (list, tuple) or hasattr(items, 'version')):
+            items = self.to_list()
+        return IndexedAnLinq(items, (key,) + keys)
+
+    def memoize(self):
+        """
+        Buffers results of the query so far exactly once and shares them between all further consumers.
+        Use it to avoid re-running expensive upstream stages or to make one-shot source re-iterable.
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return AnLinq(_Memoized(self.iterable))
+
+    def cached(self, key=None, ttl=None, cache=None):
+        """
+        Serves results of the query so far from process-wide cache, so queries rebuilt with the same source
+        and the same operators are computed once. Operators are compared by identity of functions
+        and by text of expressions, pass key to name the query when it is built with new lambdas every time.
+        Entries of mutated source must be dropped with AnLinq.invalidate_cache, unless source has version attribute
+        which changes on every mutation.
+        :param key: hashable key, which replaces operator chain in cache key
+        :param ttl: seconds results stay valid, ttl of cache by default
+        :param cache: QueryCache to use, process-wide cache by default
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return AnLinq(_Cached(self.iterable, key, ttl, cache if cache is not None else _default_cache))
+
+    def materialize(self):
+        """
+        Keeps results of the query over ObservableList, updating them on every append or remove.
+        Query may consist of where, select and select_many only.
+        :return: list-like view of results
+        :rtype: anlinq.views.MaterializedList
+        """
+        from anlinq.views import MaterializedList
+        return MaterializedList(self.iterable)
+
+    def materialize_distinct(self):
+        """
+        Keeps distinct results of the query over ObservableList, updating them on every append or remove.
+        Query may consist of where, select and select_many only.
+        :return: set-like view of results
+        :rtype: anlinq.views.MaterializedSet
+        """
+        from anlinq.views import MaterializedSet
+        return MaterializedSet(self.iterable)
+
+    def materialize_by(self, key_selector, func='count', value_selector=None):
+        """
+        Keeps aggregated values by keys of the query over ObservableList, updating them on every append or remove.
+        Query may consist of where, select and select_many only.
+        :param key_selector: function which takes item and returns key for it
+        :param func: one of 'count', 'sum', 'average'
+        :param value_selector: function which takes item and returns number to aggregate
+        :return: dict-like view of aggregated values
+        :rtype: anlinq.views.MaterializedGroups
+        """
+        from anlinq.views import MaterializedGroups
+        return MaterializedGroups(self.iterable, key_selector, func, value_selector)
+
+    def materialize_lookup(self, key_selector, value_selector=None):
+        """
+        Keeps values by keys of the query over ObservableList, updating them on every append or remove.
+        Query may consist of where, select and select_many only.
+        :param key_selector: function which takes item and returns key for it
+        :param value_selector: function which takes item and returns value for it
+        :return: lookup-like view, where value is AnLinq for given key
+        :rtype: anlinq.views.MaterializedLookup
+        """
+        from anlinq.views import MaterializedLookup
+        return MaterializedLookup(self.iterable, key_selector, value_selector)
+
+    @staticmethod
+    def invalidate_cache(source=None, cache=None):
+        """
+        Drops cached results computed from given source, or all cached results
+        :param source: source collection, None to clear whole cache
+        :param cache: QueryCache to use, process-wide cache by default
+        """
+        (cache if cache is not None else _default_cache).invalidate(source)
+
+    @staticmethod
+    def cache_stats(cache=None):
+        """
+        :param cache: QueryCache to use, process-wide cache by default
+        :return: number of hits, misses, evictions, entries and estimated bytes
+        :rtype: QueryCache.Stats
+        """
+        return (cache if cache is not None else _default_cache).stats()
+
+    def except_for(self, iterable, key_selector=None):
+        """
+        Filters items except given iterable.
+        Keys of given iterable are hashed once, so each item is checked in O(1).
+        :param iterable: Any iterable
+        :param key_selector: function which takes item and returns key to compare by
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('except_for', _reiterable(iterable), key_selector)
 
-    def except_for(self, iterable):
+    def intersect(self, iterable, key_selector=None):
         """
-        Filters items except given iterable
+        Intersection between two iterables.
+        Keys of given iterable are hashed once, so each item is checked in O(1).
         :param iterable: Any iterable
-        :return: self
+        :param key_selector: function which takes item and returns key to compare by
+        :return: results wrapped with AnLinq
         :rtype: AnLinq
         """
-        return AnLinq([i for i in self.iterable if i not in iterable])
+        return self._then('intersect', _reiterable(iterable), key_selector)
 
-    def intersect(self, iterable):
+    def union(self, iterable, key_selector=None):
         """
-        Intersection between two iterables
+        Distinct items from both iterables, in order of their first appearance
         :param iterable: Any iterable
-        :return: self
+        :param key_selector: function which takes item and returns key to compare by
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('union', _reiterable(iterable), key_selector)
+
+    def symmetric_difference(self, iterable, key_selector=None):
+        """
+        Distinct items which are present only in one of two iterables
+        :param iterable: Any iterable
+        :param key_selector: function which takes item and returns key to compare by
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('symmetric_difference', _reiterable(iterable), key_selector)
+
+    def join(self, inner, outer_key, inner_key, result_selector=None):
+        """
+        Correlates items with items of inner iterable which have equal keys (inner equi-join).
+        Hash table is built once per iteration, on the smaller side when both sizes are known,
+        while the other side is streamed. Results follow order of the streamed side.
+        :param inner: Any iterable to join with
+        :param outer_key: function which takes item of this iterable and returns key for it
+        :param inner_key: function which takes item of inner iterable and returns key for it
+        :param result_selector: function which takes outer and inner items and returns result, (outer, inner) by default
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if result_selector is None:
+            result_selector = _pair
+        return self._then('join', _reiterable(inner), outer_key, inner_key, result_selector)
+
+    def left_join(self, inner, outer_key, inner_key, result_selector=None, default=None):
+        """
+        Same as join, but items without matches are kept and paired with default (left outer join)
+        :param inner: Any iterable to join with
+        :param outer_key: function which takes item of this iterable and returns key for it
+        :param inner_key: function which takes item of inner iterable and returns key for it
+        :param result_selector: function which takes outer and inner items and returns result, (outer, inner) by default
+        :param default: value used as inner item when there are no matches
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if result_selector is None:
+            result_selector = _pair
+        return self._then('left_join', _reiterable(inner), outer_key, inner_key, result_selector, default)
+
+    def group_join(self, inner, outer_key, inner_key, result_selector=None):
+        """
+        Correlates every item with AnLinq of all matching items of inner iterable
+        :param inner: Any iterable to join with
+        :param outer_key: function which takes item of this iterable and returns key for it
+        :param inner_key: function which takes item of inner iterable and returns key for it
+        :param result_selector: function which takes outer item and AnLinq of inner items, (outer, inners) by default
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        if result_selector is None:
+            result_selector = _pair
+        return self._then('group_join', _reiterable(inner), outer_key, inner_key, result_selector)
+
+    def semi_join(self, inner, outer_key, inner_key):
+        """
+        Filters items which have at least one match in inner iterable
+        :param inner: Any iterable to match with
+        :param outer_key: function which takes item of this iterable and returns key for it
+        :param inner_key: function which takes item of inner iterable and returns key for it
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return self._then('semi_join', _reiterable(inner), outer_key, inner_key)
+
+    def anti_join(self, inner, outer_key, inner_key):
+        """
+        Filters items which have no matches in inner iterable
+        :param inner: Any iterable to match with
+        :param outer_key: function which takes item of this iterable and returns key for it
+        :param inner_key: function which takes item of inner iterable and returns key for it
+        :return: results wrapped with AnLinq
         :rtype: AnLinq
         """
-        return AnLinq([i for i in self.iterable if i in iterable])
\ No newline at end of file
+        return self._then('anti_join', _reiterable(inner), outer_key, inner_key)
+
+
+from anlinq.async_anlinq import AsyncAnLinq  # noqa: E402
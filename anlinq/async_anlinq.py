@@ -0,0 +1,475 @@
+"""
+AnLinq methods for async iterables, requires python 3.7+
+"""
+
+import asyncio
+import collections
+import inspect
+
+from anlinq import AnLinq
+
+_MISSING = object()
+
+
+async def _resolve(value):
+    """
+    Awaits value if selector or predicate returned awaitable, so both sync and async functions are accepted
+    """
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+async def _from_iterable(iterable):
+    for i in iterable:
+        yield i
+
+
+def _aiter(iterable):
+    if hasattr(iterable, '__aiter__'):
+        return iterable
+    return _from_iterable(iterable)
+
+
+async def _where(iterable, predicate):
+    async for i in iterable:
+        if await _resolve(predicate(i)):
+            yield i
+
+
+async def _select(iterable, selector):
+    async for i in iterable:
+        yield await _resolve(selector(i))
+
+
+async def _select_many(iterable, selector):
+    async for i in iterable:
+        async for sub in _aiter(await _resolve(selector(i))):
+            yield sub
+
+
+async def _select_concurrent(iterable, selector, limit):
+    pending = collections.deque()
+    try:
+        async for i in iterable:
+            pending.append(asyncio.ensure_future(selector(i)))
+            if len(pending) >= limit:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _distinct(iterable, key_selector):
+    keys = set()
+    async for i in iterable:
+        key = await _resolve(key_selector(i)) if key_selector is not None else i
+        if key not in keys:
+            keys.add(key)
+            yield i
+
+
+async def _take(iterable, number):
+    if number <= 0:
+        return
+    count = 0
+    async for i in iterable:
+        yield i
+        count += 1
+        if count >= number:
+            return
+
+
+async def _skip(iterable, number):
+    count = 0
+    async for i in iterable:
+        count += 1
+        if count > number:
+            yield i
+
+
+async def _order_by(iterable, key, descending):
+    items = [i async for i in iterable]
+    if key is None:
+        items.sort(reverse=descending)
+    else:
+        keys = [await _resolve(key(i)) for i in items]
+        items = [items[index] for index in sorted(range(len(items)), key=keys.__getitem__, reverse=descending)]
+    for i in items:
+        yield i
+
+
+async def _concat(iterable, other):
+    async for i in iterable:
+        yield i
+    async for i in _aiter(other):
+        yield i
+
+
+class AsyncAnLinq(object):
+    """
+    Allows to apply AnLinq-like methods to wrapped async iterable.
+    Selectors and predicates may be plain functions or coroutine functions, terminal methods are awaitable.
+    """
+
+    def __init__(self, iterable, stages=()):
+        """
+        Instantiates AsyncAnLinq wrapper
+        :param iterable: async iterable or plain iterable to wrap
+        :param stages: recorded operator stages
+        """
+        if iterable is None:
+            raise AnLinq.AnLinqException("iterable is None")
+        if iterable.__class__ is AsyncAnLinq:
+            stages = iterable.stages + stages
+            iterable = iterable.iterable
+        self.iterable = iterable
+        self.stages = stages
+
+    def __aiter__(self):
+        """
+        Allows to iterate AsyncAnLinq object with async for, replaying stages from the source
+        """
+        iterable = _aiter(self.iterable)
+        for stage, args in self.stages:
+            iterable = stage(iterable, *args)
+        return iterable.__aiter__()
+
+    def _then(self, stage, *args):
+        return AsyncAnLinq(self.iterable, self.stages + ((stage, args),))
+
+    def where(self, predicate):
+        """
+        Returns items which matching predicate function
+        :param predicate: Function or coroutine function which takes item as argument and returns bool
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_where, predicate)
+
+    def select(self, selector):
+        """
+        Converts items with given function
+        :param selector: Function or coroutine function which takes item and returns other item
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_select, selector)
+
+    def map(self, selector):
+        """
+        Converts items with given function
+        :param selector: Function or coroutine function which takes item and returns other item
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self.select(selector)
+
+    def select_many(self, selector):
+        """
+        Converts items with given function and flattens results
+        :param selector: Function or coroutine function which takes item and returns iterable or async iterable
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_select_many, selector)
+
+    def select_concurrent(self, selector, limit):
+        """
+        Converts items with coroutine function keeping up to limit calls in flight, results keep source order
+        :param selector: Coroutine function which takes item and returns other item
+        :param limit: maximum number of concurrently awaited calls, also bounds number of buffered results
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        if limit < 1:
+            raise AnLinq.AnLinqException("limit must be positive")
+        return self._then(_select_concurrent, selector, limit)
+
+    def distinct(self, key_selector=None):
+        """
+        Filters distinct values
+        :param key_selector: Function or coroutine function which takes item and returns key for it
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_distinct, key_selector)
+
+    def take(self, number):
+        """
+        Takes only given number of items, of all available items if their count is less than number
+        :param number: number of items to get
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_take, number)
+
+    def skip(self, number):
+        """
+        Skips given number of items
+        :param number: number of items to skip
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_skip, number)
+
+    def order_by(self, key=None, descending=False):
+        """
+        Orders items. Sort is stable, items are collected before the first one is yielded.
+        :param key: function or coroutine function which takes item and returns value to sort by
+        :param descending: shows how items will be sorted
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_order_by, key, descending)
+
+    def order_by_descending(self, key=None):
+        """
+        Orders items in descending order.
+        :param key: function or coroutine function which takes item and returns value to sort by
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self.order_by(key, True)
+
+    def concat(self, iterable):
+        """
+        Concats with another iterable or async iterable
+        :param iterable: Any iterable or async iterable
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_concat, iterable)
+
+    def concat_item(self, item):
+        """
+        Concats with single item
+        :param item: Any item
+        :return: results wrapped with AsyncAnLinq
+        :rtype: AsyncAnLinq
+        """
+        return self._then(_concat, (item,))
+
+    async def to_list(self):
+        """
+        Converts AsyncAnLinq to list
+        :return: list
+        :rtype: list
+        """
+        return [i async for i in self]
+
+    async def to_anlinq(self):
+        """
+        Collects items and wraps them with synchronous AnLinq
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        return AnLinq(await self.to_list())
+
+    async def to_dictionary(self, key_selector=None, value_selector=None, unique=True):
+        """
+        Converts AsyncAnLinq to dictionary
+        :param key_selector: function which takes item and returns key for it
+        :param value_selector: function which takes item and returns value for it
+        :param unique: boolean, if True that will throw exception if keys are not unique
+        :return: dict
+        :rtype: dict
+        """
+        return (await self.to_anlinq()).to_dictionary(key_selector, value_selector, unique)
+
+    async def group_by(self, key_selector=None, value_selector=None):
+        """
+        Groups given items by keys.
+        :param key_selector: function which takes item and returns key for it
+        :param value_selector: function which takes item and returns value for it
+        :return: Dictionary, where value if AnLinq for given key
+        :rtype: dict
+        """
+        return (await self.to_anlinq()).group_by(key_selector, value_selector)
+
+    async def aggregate_by(self, key_selector, func, value_selector=None, seed=None):
+        """
+        Groups items by keys and folds every value into per-key accumulator.
+        :param key_selector: function which takes item and returns key for it
+        :param func: one of 'count', 'sum', 'min', 'max', 'average',
+                     or function which takes accumulated value and this value and returns new accumulated value
+        :param value_selector: function which takes item and returns value to aggregate
+        :param seed: initial accumulated value of every key for func function, should be immutable
+        :return: Dictionary, where value is aggregated value for given key
+        :rtype: dict
+        """
+        return (await self.to_anlinq()).aggregate_by(key_selector, func, value_selector, seed)
+
+    async def count(self):
+        """
+        Counts items
+        :return: number of items
+        :rtype: int
+        """
+        count = 0
+        async for _ in self:
+            count += 1
+        return count
+
+    async def any(self, predicate=None):
+        """
+        Returns true if there any item which matches given predicate.
+        If no predicate given returns True if there is any item at all.
+        :param predicate: Function or coroutine function which takes item as argument and returns bool
+        :return: True, if there any item matching predicate
+        :rtype: bool
+        """
+        async for i in self:
+            if predicate is None or await _resolve(predicate(i)):
+                return True
+        return False
+
+    async def all(self, predicate):
+        """
+        Returns true if all items match given predicate.
+        :param predicate: Function or coroutine function which takes item as argument and returns bool
+        :return: Boolean
+        :rtype: bool
+        """
+        async for i in self:
+            if not await _resolve(predicate(i)):
+                return False
+        return True
+
+    async def first(self, predicate=None):
+        """
+        Returns first item which matches predicate or first item if no predicate given.
+        Raises exception, if no matching items found.
+        :param predicate: Function or coroutine function which takes item as argument and returns bool
+        :return: item
+        :rtype: object
+        """
+        async for i in self:
+            if predicate is None or await _resolve(predicate(i)):
+                return i
+        raise AnLinq.AnLinqException('No matching items!')
+
+    async def first_or_none(self, predicate=None):
+        """
+        Returns first item which matches predicate or first item if no predicate given.
+        Returns None, if no matching items found.
+        :param predicate: Function or coroutine function which takes item as argument and returns bool
+        :return: item
+        :rtype: object
+        """
+        try:
+            return await self.first(predicate)
+        except AnLinq.AnLinqException:
+            return None
+
+    async def last(self, predicate=None):
+        """
+        Returns last item which matches predicate or last item if no predicate given.
+        Raises exception, if no matching items found.
+        :param predicate: Function or coroutine function which takes item as argument and returns bool
+        :return: item
+        :rtype: object
+        """
+        last_item = None
+        last_item_set = False
+        async for i in self:
+            if predicate is None or await _resolve(predicate(i)):
+                last_item = i
+                last_item_set = True
+
+        if not last_item_set:
+            raise AnLinq.AnLinqException('No matching items!')
+        return last_item
+
+    async def last_or_none(self, predicate=None):
+        """
+        Returns last item which matches predicate or last item if no predicate given.
+        Returns None, if no matching items found.
+        :param predicate: Function or coroutine function which takes item as argument and returns bool
+        :return: item
+        :rtype: object
+        """
+        try:
+            return await self.last(predicate)
+        except AnLinq.AnLinqException:
+            return None
+
+    async def aggregate(self, func, seed=None):
+        """
+        Reduces items to a single variable
+        :param func: function or coroutine function which takes prev value, this value and index
+        :param seed: initial value, will be used as prev on first iteration
+        :return: reduced value
+        """
+        index = 0
+        async for i in self:
+            seed = await _resolve(func(seed, i, index))
+            index += 1
+        return seed
+
+    async def reduce(self, func, seed=None):
+        """
+        Reduces items to a single variable
+        :param func: function or coroutine function which takes prev value, this value and index
+        :param seed: initial value, will be used as prev on first iteration
+        :return: reduced value
+        """
+        return await self.aggregate(func, seed)
+
+    def _selected(self, selector):
+        return self if selector is None else self.select(selector)
+
+    async def sum(self, selector=None):
+        """
+        Sums items or values returned by selector
+        :param selector: function or coroutine function which takes item and returns number for it
+        :return: sum, 0 if there are no items
+        """
+        total = 0
+        async for i in self._selected(selector):
+            total += i
+        return total
+
+    async def min(self, selector=None):
+        """
+        Finds minimal item or minimal value returned by selector.
+        Raises exception, if there are no items.
+        :param selector: function or coroutine function which takes item and returns value for it
+        :return: minimal value
+        """
+        result = _MISSING
+        async for i in self._selected(selector):
+            if result is _MISSING or i < result:
+                result = i
+        if result is _MISSING:
+            raise AnLinq.AnLinqException('No items!')
+        return result
+
+    async def max(self, selector=None):
+        """
+        Finds maximal item or maximal value returned by selector.
+        Raises exception, if there are no items.
+        :param selector: function or coroutine function which takes item and returns value for it
+        :return: maximal value
+        """
+        result = _MISSING
+        async for i in self._selected(selector):
+            if result is _MISSING or i > result:
+                result = i
+        if result is _MISSING:
+            raise AnLinq.AnLinqException('No items!')
+        return result
+
+    async def foreach(self, func):
+        """
+        Allows to perform some action for each item, iteration stops if func returns True
+        :param func: Function or coroutine function which takes item as argument
+        :return: self
+        :rtype: AsyncAnLinq
+        """
+        async for i in self:
+            if await _resolve(func(i)) == True:
+                break
+        return self
@@ -0,0 +1,260 @@
+"""
+Compact columnar binary layout for handing query results to other processes without pickling every item:
+
+    data = AnLinq(orders).select(lambda o: {'id': o.id, 'amount': o.amount}).to_buffer()
+    block = AnLinq(orders).where(F.paid).to_shared_memory()      # consumer: AnLinq.from_buffer(SharedMemory(name))
+    AnLinq.from_buffer(mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)).sum(F['amount'])
+
+Items are plain values (single column), dicts with the same string keys (named columns) or tuples of equal length,
+other items, like dicts with different keys, are stored as plain values of object column.
+Layout is magic bytes, uint32 little-endian header length, JSON header, then column buffers aligned to 8 bytes:
+
+    bool       one byte per item
+    int        int64 array, used when all values fit
+    float      float64 array, used for mixed ints and floats
+    str, bytes int64 array of n + 1 offsets and concatenated (utf-8) bytes
+    object     pickled list, for any other values
+
+Columns with None values also have one byte per item validity mask.
+Reader maps numeric columns to memoryviews of the buffer itself, so nothing is copied until items are pulled,
+and column returns them directly, for example for numpy.frombuffer.
+"""
+
+import array
+import collections.abc
+import itertools
+import json
+import pickle
+import struct
+import sys
+
+from anlinq import AnLinq
+
+MAGIC = b'ANLQCOL1'
+_ALIGNMENT = 8
+_NUMERIC = {'bool': 'B', 'int': 'q', 'float': 'd'}
+_INT64 = (-1 << 63, (1 << 63) - 1)
+_FLOAT_INTEGER = 1 << 53
+
+
+def _aligned(offset):
+    return offset + -offset % _ALIGNMENT
+
+
+def _column_type(values):
+    types = set(map(type, values))
+    types.discard(type(None))
+    if types == set([bool]):
+        return 'bool'
+    if types == set([int]):
+        return 'int' if _INT64[0] <= min(v for v in values if v is not None) and \
+            max(v for v in values if v is not None) <= _INT64[1] else 'object'
+    if types == set([float]):
+        return 'float'
+    if types == set([int, float]):
+        # larger integers would be rounded by float
+        return 'float' if all(-_FLOAT_INTEGER <= v <= _FLOAT_INTEGER for v in values if v.__class__ is int) \
+            else 'object'
+    if types == set([str]):
+        return 'str'
+    if types == set([bytes]):
+        return 'bytes'
+    return 'object'
+
+
+def _encode_column(values):
+    """
+    :return: column type and dict of buffer role to bytes
+    """
+    kind = _column_type(values)
+    buffers = {}
+    if kind != 'object' and None in values:
+        buffers['mask'] = bytes(bytearray(0 if v is None else 1 for v in values))
+        empty = '' if kind == 'str' else b'' if kind == 'bytes' else 0
+        values = [empty if v is None else v for v in values]
+    if kind in _NUMERIC:
+        buffers['data'] = array.array(_NUMERIC[kind], values).tobytes()
+    elif kind in ('str', 'bytes'):
+        encoded = [v.encode('utf-8') for v in values] if kind == 'str' else values
+        offsets = array.array('q', [0])
+        offsets.extend(itertools.accumulate(map(len, encoded)))
+        buffers['offsets'] = offsets.tobytes()
+        buffers['data'] = b''.join(encoded)
+    else:
+        buffers['data'] = pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+    return kind, buffers
+
+
+def encode(items):
+    """
+    Encodes items to columnar layout
+    :param items: any iterable of plain values, dicts with the same string keys or tuples of equal length
+    :return: encoded items
+    :rtype: bytearray
+    """
+    items = items if isinstance(items, list) else list(items)
+    if items and all(type(i) is dict for i in items) and all(isinstance(k, str) for k in items[0]) and \
+            all(i.keys() == items[0].keys() for i in items):
+        shape, names = 'dict', list(items[0])
+        columns = [[i[name] for i in items] for name in names]
+    elif items and all(type(i) is tuple for i in items) and len(set(map(len, items))) == 1:
+        shape, names = 'tuple', list(range(len(items[0])))
+        columns = [list(column) for column in zip(*items)]
+    else:
+        shape, names, columns = 'scalar', [None], [items]
+
+    specs, parts, offset = [], [], 0
+    for name, values in zip(names, columns):
+        kind, buffers = _encode_column(values)
+        spec = {'name': name, 'type': kind}
+        for role in sorted(buffers):
+            spec[role] = [offset, len(buffers[role])]
+            parts.append(buffers[role])
+            parts.append(b'\0' * (_aligned(offset + len(buffers[role])) - offset - len(buffers[role])))
+            offset = _aligned(offset + len(buffers[role]))
+        specs.append(spec)
+    header = json.dumps({'rows': len(items), 'shape': shape, 'byteorder': sys.byteorder,
+                         'columns': specs}).encode('utf-8')
+    prefix = MAGIC + struct.pack('<I', len(header)) + header
+    result = bytearray(prefix + b'\0' * (_aligned(len(prefix)) - len(prefix)))
+    for part in parts:
+        result += part
+    return result
+
+
+class _Column(object):
+    """
+    Column decoded over memoryview of the buffer
+    """
+
+    def __init__(self, view, base, spec, swap):
+        self.kind = spec['type']
+        self.mask = self._slice(view, base, spec.get('mask'))
+        data = self._slice(view, base, spec['data'])
+        if self.kind in _NUMERIC:
+            data = data.cast(_NUMERIC[self.kind])
+            if swap and self.kind != 'bool':
+                data = array.array(_NUMERIC[self.kind], data.tobytes())
+                data.byteswap()
+        elif self.kind in ('str', 'bytes'):
+            self.offsets = self._slice(view, base, spec['offsets']).cast('q')
+            if swap:
+                self.offsets = array.array('q', self.offsets.tobytes())
+                self.offsets.byteswap()
+        self.data = data
+        self._values = None
+
+    @staticmethod
+    def _slice(view, base, bounds):
+        return None if bounds is None else view[base + bounds[0]:base + bounds[0] + bounds[1]]
+
+    def _text(self, data, index):
+        value = data[self.offsets[index]:self.offsets[index + 1]]
+        if value.__class__ is memoryview:
+            value = value.tobytes()
+        return value.decode('utf-8') if self.kind == 'str' else value
+
+    def values(self):
+        """
+        :return: list of all values, decoded once
+        """
+        if self._values is None:
+            if self.kind == 'object':
+                values = pickle.loads(self.data)
+            elif self.kind in ('str', 'bytes'):
+                data = self.data.tobytes()
+                if self.kind == 'str':
+                    text = data.decode('utf-8')
+                    # ascii text has the same character and byte offsets, so it is decoded at once
+                    data = text if len(text) == len(data) else data
+                offsets = self.offsets.tolist()
+                values = list(map(data.__getitem__, map(slice, offsets[:-1], offsets[1:])))
+                if data.__class__ is bytes and self.kind == 'str':
+                    values = [value.decode('utf-8') for value in values]
+            else:
+                values = self.data.tolist()
+                if self.kind == 'bool':
+                    values = [value == 1 for value in values]
+            if self.mask is not None:
+                values = [value if valid else None for value, valid in zip(values, self.mask)]
+            self._values = values
+        return self._values
+
+    def __getitem__(self, index):
+        if self._values is not None or self.kind == 'object':
+            return self.values()[index]
+        if self.mask is not None and not self.mask[index]:
+            return None
+        if self.kind in ('str', 'bytes'):
+            return self._text(self.data, index)
+        return self.data[index] == 1 if self.kind == 'bool' else self.data[index]
+
+    def release(self):
+        for view in (self.data, self.mask, getattr(self, 'offsets', None)):
+            if isinstance(view, memoryview):
+                view.release()
+
+
+class BufferTable(collections.abc.Sequence):
+    """
+    Read-only sequence of items decoded from columnar layout on access
+    """
+
+    def __init__(self, buffer):
+        """
+        :param buffer: bytes, bytearray, memoryview, mmap or multiprocessing.shared_memory.SharedMemory
+        """
+        view = memoryview(getattr(buffer, 'buf', buffer)).cast('B')
+        if view[:len(MAGIC)].tobytes() != MAGIC:
+            raise AnLinq.AnLinqException("Buffer is not in AnLinq columnar layout")
+        length = struct.unpack('<I', view[len(MAGIC):len(MAGIC) + 4])[0]
+        start = len(MAGIC) + 4
+        header = json.loads(view[start:start + length].tobytes().decode('utf-8'))
+        swap = header['byteorder'] != sys.byteorder
+        self.rows, self.shape = header['rows'], header['shape']
+        self.names = [spec['name'] for spec in header['columns']]
+        self.columns = [_Column(view, _aligned(start + length), spec, swap) for spec in header['columns']]
+        self._view = view
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.rows))]
+        if index < 0:
+            index += self.rows
+        if not 0 <= index < self.rows:
+            raise IndexError("table index out of range")
+        if self.shape == 'scalar':
+            return self.columns[0][index]
+        row = [column[index] for column in self.columns]
+        return dict(zip(self.names, row)) if self.shape == 'dict' else tuple(row)
+
+    def __iter__(self):
+        if self.shape == 'scalar':
+            return iter(self.columns[0].values())
+        rows = zip(*[column.values() for column in self.columns])
+        if self.shape == 'dict':
+            return map(dict, map(zip, itertools.repeat(self.names), rows))
+        return iter(rows)
+
+    def column(self, name=None):
+        """
+        Returns column without decoding items: memoryview over the buffer for bool, int and float columns,
+        list of values for others
+        :param name: key of dict items, position of tuple items, None for plain items
+        :return: memoryview or list
+        """
+        if name not in self.names:
+            raise AnLinq.AnLinqException("There is no column " + repr(name))
+        column = self.columns[self.names.index(name)]
+        return column.data if column.kind in _NUMERIC and column.mask is None else column.values()
+
+    def release(self):
+        """
+        Releases views of the buffer, required before closing shared memory or mmap
+        """
+        for column in self.columns:
+            column.release()
+        self._view.release()
@@ -0,0 +1,123 @@
+"""
+Process-wide cache of query results with LRU, TTL and memory size eviction
+"""
+
+import collections
+import sys
+import threading
+import time
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+def estimate_size(items):
+    """
+    Estimates memory used by list of items: list itself plus shallow size of every item
+    :param items: list
+    :return: size in bytes
+    :rtype: int
+    """
+    return sys.getsizeof(items) + sum(sys.getsizeof(i) for i in items)
+
+
+class QueryCache(object):
+    """
+    Thread-safe LRU cache of query results.
+    Entries expire after ttl seconds, least recently used entries are evicted when there are more than
+    maxsize entries or their estimated size is more than max_bytes.
+    Every entry remembers its source, so all results computed from a source may be invalidated at once.
+    """
+
+    Stats = collections.namedtuple('Stats', ['hits', 'misses', 'evictions', 'size', 'bytes'])
+
+    def __init__(self, maxsize=128, ttl=None, max_bytes=None, clock=_clock):
+        """
+        :param maxsize: maximal number of entries, None for unlimited
+        :param ttl: seconds entry stays valid, None for no expiration
+        :param max_bytes: maximal estimated size of all entries, None for unlimited
+        :param clock: function returning current time in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self._by_source = {}
+        self._bytes = 0
+        self._hits = self._misses = self._evictions = 0
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        """
+        Finds valid entry and marks it as recently used
+        :param key: hashable key
+        :return: (True, value) for hit or (False, None) for miss
+        :rtype: tuple
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= self.clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return True, entry[0]
+
+    def put(self, key, value, source=None, ttl=None):
+        """
+        Stores entry, evicting least recently used entries if limits are exceeded
+        :param key: hashable key
+        :param value: list of items
+        :param source: object entry is computed from, used by invalidate
+        :param ttl: seconds entry stays valid, cache ttl by default
+        """
+        ttl = ttl if ttl is not None else self.ttl
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            # entry keeps source alive, so its id can not be reused by other object while entry exists
+            self._entries[key] = (value, source, None if ttl is None else self.clock() + ttl, size)
+            self._by_source.setdefault(id(source), set()).add(key)
+            self._bytes += size
+            while self._entries and ((self.maxsize is not None and len(self._entries) > self.maxsize) or
+                                     (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self, source=None):
+        """
+        Removes entries computed from given source, or all entries when source is None.
+        Call it after mutating source which has no version attribute.
+        :param source: source object
+        """
+        with self._lock:
+            if source is None:
+                self._entries.clear()
+                self._by_source.clear()
+                self._bytes = 0
+                return
+            for key in list(self._by_source.get(id(source), ())):
+                self._remove(key)
+
+    def stats(self):
+        """
+        :return: number of hits, misses, evictions, entries and estimated bytes
+        :rtype: QueryCache.Stats
+        """
+        with self._lock:
+            return QueryCache.Stats(self._hits, self._misses, self._evictions, len(self._entries), self._bytes)
+
+    def _remove(self, key):
+        value, source, expires, size = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._by_source[id(source)]
+        keys.discard(key)
+        if not keys:
+            del self._by_source[id(source)]
+
+
+default_cache = QueryCache()
@@ -0,0 +1,370 @@
+"""
+Columnar AnLinq mode which keeps items in NumPy arrays, requires numpy
+"""
+
+import numpy as np
+
+from anlinq import AnLinq, Expression
+
+# int64 sums below this bound can not wrap around even when estimated in float64
+_SAFE_INTEGER = 2 ** 62
+
+
+def _length(columns):
+    if isinstance(columns, dict):
+        return len(next(iter(columns.values()))) if columns else 0
+    return len(columns)
+
+
+def _is_columns(value, length):
+    """
+    Checks whether value is a column (array) or dict of columns with given number of rows
+    """
+    if isinstance(value, np.ndarray):
+        return value.ndim > 0 and value.shape[0] == length
+    if isinstance(value, dict):
+        return bool(value) and all(isinstance(column, np.ndarray) and column.ndim > 0 and column.shape[0] == length
+                                   for column in value.values())
+    return False
+
+
+def _is_flat(columns):
+    if isinstance(columns, dict):
+        return all(column.ndim == 1 for column in columns.values())
+    return columns.ndim == 1
+
+
+def _has_integers(columns):
+    if isinstance(columns, dict):
+        return any(column.dtype.kind in 'biu' for column in columns.values())
+    return columns.dtype.kind in 'biu'
+
+
+def _as_float(columns):
+    if isinstance(columns, dict):
+        return dict((name, column.astype(np.float64) if column.dtype.kind in 'biu' else column)
+                    for name, column in columns.items())
+    return columns.astype(np.float64)
+
+
+def _agrees(result, probe):
+    """
+    Checks that numeric columns of result are equal to the same computation over float64 copies of columns
+    """
+    if isinstance(result, dict):
+        return isinstance(probe, dict) and all(_agrees(column, probe.get(name)) for name, column in result.items())
+    if isinstance(result, np.ndarray) and result.dtype.kind in 'biuf':
+        return isinstance(probe, np.ndarray) and probe.shape == result.shape and \
+            np.array_equal(result, probe, equal_nan=result.dtype.kind == 'f')
+    return True
+
+
+def _vectorized(func, columns, functions=False):
+    """
+    Tries to apply func to whole columns at once.
+    Expressions are compiled with & | ~ and numpy.isin, so they always work on columns.
+    Plain functions are applied to columns only if functions is True, as only functions built from arithmetic,
+    comparisons and column access, like lambda x: x['price'] * 2, give the same results for columns,
+    while lambda s: s[::-1] would reverse the whole column instead of every string.
+    Floating point errors are raised instead of producing inf or nan, so such items take row path as well.
+    Integer arithmetic silently wraps around on overflow, so with integer or boolean columns the computation
+    is repeated over their float64 copies and result is used only if both agree.
+    Only 1-D arrays and dicts of 1-D columns are vectorized: for 2-D array item[0] would take
+    the first row instead of the first column, so rows of such arrays always take row path.
+    :return: result of func or None if func can not be applied to columns
+    """
+    if not _is_flat(columns):
+        return None
+    if func.__class__ is Expression:
+        func = func.compile(vectorized=True, isin=np.isin)
+    elif not functions:
+        return None
+    try:
+        with np.errstate(all='raise'):
+            result = func(columns)
+            if _has_integers(columns) and not _agrees(result, func(_as_float(columns))):
+                return None
+            return result
+    except Exception:
+        return None
+
+
+def _exact(values, sums):
+    """
+    :param values: integer column which is summed, possibly by groups
+    :param sums: function which sums column
+    :return: values, or values as python ints if int64 sum may wrap around
+    """
+    if values.dtype.kind in 'iu' and np.max(sums(np.absolute(values, dtype=np.float64)), initial=0) >= _SAFE_INTEGER:
+        return values.astype(object)
+    return values
+
+
+def _take_rows(columns, index):
+    if isinstance(columns, dict):
+        return dict((name, column[index]) for name, column in columns.items())
+    return columns[index]
+
+
+def _to_python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class _ColumnRows(object):
+    """
+    Iterates columns row by row as plain python values, dict per row for dict of columns
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return _length(self.columns)
+
+    def __iter__(self):
+        if isinstance(self.columns, dict):
+            names = list(self.columns)
+            return (dict(zip(names, row)) for row in zip(*[self.columns[name].tolist() for name in names]))
+        return iter(self.columns.tolist())
+
+
+class ColumnarAnLinq(AnLinq):
+    """
+    AnLinq over NumPy array or dict of equally sized column arrays.
+    where, select, take, skip and numeric aggregates apply expressions like F['price'] * 2 to whole columns,
+    which runs as vectorized masks and ufuncs. Plain functions are applied to whole columns only when
+    vectorize is enabled. If function can not be applied to columns, the method transparently falls back
+    to regular row by row AnLinq.
+    """
+
+    def __init__(self, columns, vectorize=False):
+        """
+        Instantiates ColumnarAnLinq wrapper
+        :param columns: array-like or dict of array-likes with equal lengths
+        :param vectorize: if True plain functions are applied to whole columns too, only functions built from
+                          arithmetic, comparisons and column access give the same results for columns
+        """
+        if columns is None:
+            raise AnLinq.AnLinqException("iterable is None")
+        if isinstance(columns, dict):
+            columns = dict((name, np.asarray(column)) for name, column in columns.items())
+            if len(set(len(column) for column in columns.values())) > 1:
+                raise AnLinq.AnLinqException("Columns must have equal lengths")
+        else:
+            columns = np.asarray(columns)
+        self.columns = columns
+        self.vectorize = vectorize
+        AnLinq.__init__(self, _ColumnRows(columns))
+
+    def __getitem__(self, index):
+        """
+        Defines operator[], slices are returned as columnar views without copying
+        :param index: numeric index of item or slice
+        :return: item or slice wrapped with ColumnarAnLinq
+        :rtype: object
+        """
+        if isinstance(index, slice):
+            return ColumnarAnLinq(_take_rows(self.columns, index), self.vectorize)
+        length = _length(self.columns)
+        if not -length <= index < length:
+            raise AnLinq.AnLinqException("Index " + repr(index) + " is out of range (" + repr(length) + ")")
+        if isinstance(self.columns, dict):
+            return dict((name, _to_python(column[index])) for name, column in self.columns.items())
+        item = self.columns[index]
+        return item.tolist() if isinstance(item, np.ndarray) else _to_python(item)
+
+    def to_list(self):
+        """
+        Converts ColumnarAnLinq to list of python values, or list of dicts for dict of columns
+        :return: list
+        :rtype: list
+        """
+        return list(self.iterable)
+
+    def to_array(self, typecode=None):
+        """
+        Returns underlying array or dict of arrays without copying
+        :param typecode: array type code, if given items are converted to array.array like AnLinq.to_array does
+        :return: numpy array or dict of arrays, array.array if typecode is given
+        """
+        if typecode is not None:
+            return AnLinq.to_array(self, typecode)
+        return self.columns
+
+    def where(self, predicate):
+        """
+        Returns items which matching predicate function, as boolean mask if predicate is vectorizable
+        :param predicate: Function which takes item (or whole columns) and returns bool (or boolean array)
+        :return: results wrapped with ColumnarAnLinq or AnLinq
+        :rtype: AnLinq
+        """
+        mask = _vectorized(predicate, self.columns, self.vectorize)
+        if isinstance(mask, np.ndarray) and mask.dtype == np.bool_ and mask.shape == (_length(self.columns),):
+            return ColumnarAnLinq(_take_rows(self.columns, mask), self.vectorize)
+        return AnLinq.where(self, predicate)
+
+    def select(self, selector):
+        """
+        Converts items with given function, as ufuncs over whole columns if selector is vectorizable
+        :param selector: Function which takes item (or whole columns) and returns other item (or columns)
+        :return: results wrapped with ColumnarAnLinq or AnLinq
+        :rtype: AnLinq
+        """
+        columns = _vectorized(selector, self.columns, self.vectorize)
+        if _is_columns(columns, _length(self.columns)):
+            return ColumnarAnLinq(columns, self.vectorize)
+        return AnLinq.select(self, selector)
+
+    def take(self, number):
+        """
+        Takes only given number of items as columnar view
+        :param number: number of items to get
+        :return: results wrapped with ColumnarAnLinq
+        :rtype: ColumnarAnLinq
+        """
+        return self[:max(number, 0)]
+
+    def skip(self, number):
+        """
+        Skips given number of items, returns columnar view
+        :param number: number of items to skip
+        :return: results wrapped with ColumnarAnLinq
+        :rtype: ColumnarAnLinq
+        """
+        return self[max(number, 0):]
+
+    def _values(self, selector):
+        """
+        :return: column to aggregate, or None if selector is not vectorizable
+        """
+        values = self.columns if selector is None else _vectorized(selector, self.columns, self.vectorize)
+        if isinstance(values, np.ndarray) and values.ndim == 1 and values.shape[0] == _length(self.columns):
+            return values
+        return None
+
+    def sum(self, selector=None):
+        """
+        Sums items or values returned by selector
+        :param selector: function which takes item and returns number for it
+        :return: sum
+        """
+        values = self._values(selector)
+        if values is None:
+            return AnLinq.sum(self, selector)
+        return _to_python(_exact(values, np.sum).sum())
+
+    def min(self, selector=None):
+        """
+        Finds minimal item or minimal value returned by selector.
+        Raises exception, if there are no items.
+        :param selector: function which takes item and returns value for it
+        :return: minimal value
+        """
+        values = self._values(selector)
+        if values is None:
+            return AnLinq.min(self, selector)
+        if not len(values):
+            raise AnLinq.AnLinqException('No items!')
+        return _to_python(values.min())
+
+    def max(self, selector=None):
+        """
+        Finds maximal item or maximal value returned by selector.
+        Raises exception, if there are no items.
+        :param selector: function which takes item and returns value for it
+        :return: maximal value
+        """
+        values = self._values(selector)
+        if values is None:
+            return AnLinq.max(self, selector)
+        if not len(values):
+            raise AnLinq.AnLinqException('No items!')
+        return _to_python(values.max())
+
+    def average(self, selector=None):
+        """
+        Calculates arithmetic mean of items or values returned by selector.
+        Raises exception, if there are no items.
+        :param selector: function which takes item and returns number for it
+        :return: mean value
+        :rtype: float
+        """
+        values = self._values(selector)
+        if values is None:
+            return AnLinq.average(self, selector)
+        if not len(values):
+            raise AnLinq.AnLinqException('No items!')
+        return _to_python(values.mean())
+
+    def variance(self, selector=None, sample=False):
+        """
+        Calculates variance of items or values returned by selector.
+        Raises exception, if there are not enough items.
+        :param selector: function which takes item and returns number for it
+        :param sample: if True calculates unbiased sample variance, otherwise population variance
+        :return: variance
+        :rtype: float
+        """
+        values = self._values(selector)
+        if values is None:
+            return AnLinq.variance(self, selector, sample)
+        if len(values) < (2 if sample else 1):
+            raise AnLinq.AnLinqException('Not enough items!')
+        return _to_python(values.var(ddof=1 if sample else 0))
+
+    def percentile(self, percent, selector=None):
+        """
+        Calculates percentile of items or values returned by selector, interpolating between closest ranks.
+        Raises exception, if there are no items.
+        :param percent: number from 0 to 100, 50 gives median
+        :param selector: function which takes item and returns number for it
+        :return: percentile value
+        """
+        values = self._values(selector)
+        if values is None or not 0 <= percent <= 100:
+            return AnLinq.percentile(self, percent, selector)
+        if not len(values):
+            raise AnLinq.AnLinqException('No items!')
+        return _to_python(np.percentile(values, percent))
+
+    def aggregate_by(self, key_selector, func, value_selector=None, seed=None):
+        """
+        Groups items by keys and reduces values of every group with np.unique and ufunc.reduceat.
+        Custom func functions are folded row by row.
+        :param key_selector: function which takes item and returns key for it
+        :param func: one of 'count', 'sum', 'min', 'max', 'average',
+                     or function which takes accumulated value and this value and returns new accumulated value
+        :param value_selector: function which takes item and returns value to aggregate
+        :param seed: initial accumulated value of every key for func function, should be immutable
+        :return: Dictionary, where value is aggregated value for given key
+        :rtype: dict
+        """
+        if func not in ('count', 'sum', 'min', 'max', 'average'):
+            return AnLinq.aggregate_by(self, key_selector, func, value_selector, seed)
+        keys = self._values(key_selector)
+        values = self._values(value_selector) if func != 'count' else keys
+        if keys is None or values is None:
+            rows = self.to_list()
+            keys = np.asarray([key_selector(i) for i in rows])
+            values = np.asarray([value_selector(i) for i in rows] if value_selector is not None else rows)
+        if not len(keys):
+            return {}
+
+        unique, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        counts = np.bincount(inverse.ravel())
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        if func == 'count':
+            result = counts
+        else:
+            ordered = values[order]
+            if func == 'min':
+                result = np.minimum.reduceat(ordered, starts)
+            elif func == 'max':
+                result = np.maximum.reduceat(ordered, starts)
+            else:
+                ordered = _exact(ordered, lambda column: np.add.reduceat(column, starts))
+                result = np.add.reduceat(ordered, starts)
+                if func == 'average':
+                    result = result / counts
+        return dict(zip(unique.tolist(), result.tolist()))
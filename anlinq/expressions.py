@@ -0,0 +1,242 @@
+"""
+Inspectable expressions, usable anywhere AnLinq expects selector or predicate:
+
+    F.price > 10            # attribute of item
+    F['user']['id']         # key or index of item
+    (F.a + F.b) * 2
+    (F.qty > 0) & F.region.isin(['eu', 'us'])
+
+Expressions compile to operator.attrgetter / itemgetter for plain field access
+and to a single generated function otherwise, and keep their tree for optimizers.
+Use &, | and ~ to combine conditions, as python does not allow to override and, or and not.
+Over values which are not conditions, like integers, they are bitwise operators as in python.
+Attributes named like Expression members (op, args, attr, function, compile, field_path, isin)
+and names which are not identifiers are accessed with F.attr('op'). Names never become code,
+so expressions may be safely built from untrusted field names with F.attr(name) or getattr(F, name).
+"""
+
+import keyword
+import operator
+
+_BINARY = {
+    'eq': '==', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>=',
+    'add': '+', 'sub': '-', 'mul': '*', 'truediv': '/', 'floordiv': '//', 'mod': '%', 'pow': '**',
+    'and': '&', 'or': '|',
+}
+
+_LOGICAL = {'and': 'and', 'or': 'or'}
+_CONDITIONS = ('eq', 'ne', 'lt', 'le', 'gt', 'ge', 'isin')
+
+
+def _is_identifier(name):
+    return isinstance(name, str) and name.isidentifier() and not keyword.iskeyword(name)
+
+
+def _is_condition(node):
+    """
+    Checks whether node evaluates to bool for row, so & | ~ over it may run as and, or, not.
+    For other values, like integers, & | ~ are bitwise operators both in python and on columns.
+    """
+    if node.op in _CONDITIONS:
+        return True
+    if node.op in _LOGICAL:
+        return _is_condition(node.args[0]) and _is_condition(node.args[1])
+    if node.op == 'not':
+        return _is_condition(node.args[0])
+    return node.op == 'const' and isinstance(node.args[0], bool)
+
+
+def _expression(value):
+    return value if value.__class__ is Expression else Expression('const', (value,))
+
+
+def _binary(op, reverse=False):
+    def method(self, other):
+        if reverse:
+            return Expression(op, (_expression(other), self))
+        return Expression(op, (self, _expression(other)))
+    method.__name__ = '__' + ('r' if reverse else '') + op + '__'
+    return method
+
+
+class Expression(object):
+    """
+    Node of expression tree: op name and operands, root node F stands for the item itself
+    """
+    __slots__ = ('op', 'args', '_function')
+
+    def __init__(self, op, args):
+        self.op = op
+        self.args = args
+        self._function = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return Expression('attr', (self, name))
+
+    def __getitem__(self, key):
+        return Expression('item', (self, key))
+
+    def __reduce__(self):
+        return Expression, (self.op, self.args)
+
+    def __bool__(self):
+        raise TypeError("Expression has no truth value, use & | ~ instead of and, or, not")
+
+    __hash__ = object.__hash__
+
+    __eq__, __ne__ = _binary('eq'), _binary('ne')
+    __lt__, __le__, __gt__, __ge__ = _binary('lt'), _binary('le'), _binary('gt'), _binary('ge')
+    __add__, __radd__ = _binary('add'), _binary('add', True)
+    __sub__, __rsub__ = _binary('sub'), _binary('sub', True)
+    __mul__, __rmul__ = _binary('mul'), _binary('mul', True)
+    __truediv__, __rtruediv__ = _binary('truediv'), _binary('truediv', True)
+    __floordiv__, __rfloordiv__ = _binary('floordiv'), _binary('floordiv', True)
+    __mod__, __rmod__ = _binary('mod'), _binary('mod', True)
+    __pow__, __rpow__ = _binary('pow'), _binary('pow', True)
+    __and__, __rand__ = _binary('and'), _binary('and', True)
+    __or__, __ror__ = _binary('or'), _binary('or', True)
+
+    def __neg__(self):
+        return Expression('neg', (self,))
+
+    def __invert__(self):
+        return Expression('not', (self,))
+
+    def attr(self, name):
+        """
+        Accesses attribute by any name, including names of Expression members, like op or args
+        :param name: attribute name
+        :return: expression
+        :rtype: Expression
+        """
+        return Expression('attr', (self, name))
+
+    def isin(self, values):
+        """
+        Checks whether value is one of given values
+        :param values: any iterable
+        :return: expression
+        :rtype: Expression
+        """
+        return Expression('isin', (self, tuple(values)))
+
+    def __call__(self, item):
+        return self.function(item)
+
+    def __repr__(self):
+        return self._text()
+
+    @property
+    def function(self):
+        """
+        Compiled row function, built once on first use
+        """
+        if self._function is None:
+            self._function = self.compile()
+        return self._function
+
+    def field_path(self):
+        """
+        :return: list of ('attr' or 'item', name) steps if expression is plain field access, otherwise None
+        :rtype: list
+        """
+        path = []
+        node = self
+        while node.op in ('attr', 'item'):
+            path.append((node.op, node.args[1]))
+            node = node.args[0]
+        return path[::-1] if node.op == 'root' else None
+
+    def compile(self, vectorized=False, isin=None):
+        """
+        Compiles expression to function of one argument
+        :param vectorized: if True, conditions are combined with & | ~ so function works on whole columns,
+                           otherwise & | ~ over comparisons run as and, or, not, and stay bitwise for other values
+        :param isin: function(values, candidates) used for isin in vectorized mode, like numpy.isin
+        :return: function
+        """
+        path = self.field_path()
+        if path == []:
+            return _identity
+        if path is not None and all(kind == 'attr' and _is_identifier(name) for kind, name in path):
+            return operator.attrgetter('.'.join(name for kind, name in path))
+        if path is not None and len(path) == 1:
+            return operator.itemgetter(path[0][1])
+
+        namespace = {'isin': isin}
+        source = self._source(namespace, vectorized)
+        return eval('lambda item: ' + source, namespace)
+
+    def _source(self, namespace, vectorized):
+        op, args = self.op, self.args
+        if op == 'root':
+            return 'item'
+        if op == 'attr':
+            if _is_identifier(args[1]):
+                return args[0]._source(namespace, vectorized) + '.' + args[1]
+            # other names are passed as constants, so they can not inject code
+            return 'getattr(' + args[0]._source(namespace, vectorized) + ', ' + _constant(namespace, args[1]) + ')'
+        if op == 'item':
+            return args[0]._source(namespace, vectorized) + '[' + _constant(namespace, args[1]) + ']'
+        if op == 'const':
+            return _constant(namespace, args[0])
+        if op == 'neg':
+            return '(-' + args[0]._source(namespace, vectorized) + ')'
+        if op == 'not':
+            logical = not vectorized and _is_condition(args[0])
+            return ('(not ' if logical else '(~') + args[0]._source(namespace, vectorized) + ')'
+        if op == 'isin':
+            operand = args[0]._source(namespace, vectorized)
+            if vectorized:
+                return 'isin(' + operand + ', ' + _constant(namespace, list(args[1])) + ')'
+            try:
+                candidates = frozenset(args[1])
+            except TypeError:
+                candidates = args[1]
+            return '(' + operand + ' in ' + _constant(namespace, candidates) + ')'
+        logical = not vectorized and op in _LOGICAL and _is_condition(self)
+        symbol = _LOGICAL[op] if logical else _BINARY[op]
+        return '(' + args[0]._source(namespace, vectorized) + ' ' + symbol + ' ' + \
+               args[1]._source(namespace, vectorized) + ')'
+
+    def _text(self):
+        op, args = self.op, self.args
+        if op == 'root':
+            return 'F'
+        if op == 'attr':
+            if _is_identifier(args[1]) and not hasattr(Expression, args[1]):
+                return args[0]._text() + '.' + args[1]
+            return args[0]._text() + '.attr(' + repr(args[1]) + ')'
+        if op == 'item':
+            return args[0]._text() + '[' + repr(args[1]) + ']'
+        if op == 'const':
+            return repr(args[0])
+        if op == 'neg':
+            return '(-' + args[0]._text() + ')'
+        if op == 'not':
+            return '(~' + args[0]._text() + ')'
+        if op == 'isin':
+            return args[0]._text() + '.isin(' + repr(list(args[1])) + ')'
+        return '(' + args[0]._text() + ' ' + _BINARY[op] + ' ' + args[1]._text() + ')'
+
+
+def _constant(namespace, value):
+    name = 'c' + str(len(namespace))
+    namespace[name] = value
+    return name
+
+
+def _identity(item):
+    return item
+
+
+def function(selector):
+    """
+    Unwraps expression to its compiled function, other callables are returned as is
+    """
+    return selector.function if selector.__class__ is Expression else selector
+
+
+F = Expression('root', ())
@@ -0,0 +1,270 @@
+"""
+Secondary indexes over in-memory collections for repeated lookups:
+
+    table = AnLinq(rows).with_index(F.id, F.region)
+    table.first(F.id == 42)                         # hash index, O(1)
+    table.where(F.region.isin(['eu', 'us']))        # hash index
+    table.where((F.id >= 10) & (F.id < 20))         # sorted index, O(log n) plus matches
+    table.get(42, F.id), table.get_range(10, 20, F.id)
+
+Expressions are matched to indexes by their field, so F.id == 42 uses index built with F.id key.
+Lambda keys can not be matched inside predicates, use get, get_many and get_range for them.
+Results keep source order. Indexes are rebuilt on the next lookup after source changes,
+changes are detected by version of ObservableList or by changed length of the source.
+Candidate items found by index are always checked by predicate again, so index which is stale after
+items of plain list were replaced in place never gives wrong items, but may miss new ones until reindex.
+"""
+
+import bisect
+import itertools
+
+from anlinq import AnLinq, Expression, _function
+
+_RANGES = {
+    'lt': lambda value: (None, value, True, False),
+    'le': lambda value: (None, value, True, True),
+    'gt': lambda value: (value, None, False, True),
+    'ge': lambda value: (value, None, True, True),
+}
+
+
+class _Index(object):
+    """
+    Hash index of key to ascending positions of items, and sorted index of keys built on first range lookup
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.name = repr(key) if key.__class__ is Expression else None
+        self.selector = _function(key)
+        self.positions = None
+        self.keys = self.sorted_positions = None
+
+    def build(self, items):
+        positions = {}
+        try:
+            for position, item in enumerate(items):
+                positions.setdefault(self.selector(item), []).append(position)
+        except TypeError:
+            raise AnLinq.AnLinqException("Index keys must be hashable")
+        self.positions = positions
+        self.keys = self.sorted_positions = None
+
+    def matches(self, key):
+        """
+        Checks whether key given to lookup refers to this index: the same object or equal expression
+        """
+        return key is self.key or (self.name is not None and key.__class__ is Expression and repr(key) == self.name)
+
+    def equal(self, values):
+        """
+        :return: ascending positions of items with key equal to one of values
+        """
+        # repeated and equal values, like 1 and True, find the same positions once
+        found = {}
+        for value in values:
+            positions = self.positions.get(value)
+            if positions is not None:
+                found[id(positions)] = positions
+        found = list(found.values())
+        if len(found) == 1:
+            return found[0]
+        return sorted(itertools.chain.from_iterable(found))
+
+    def between(self, low, high, include_low, include_high):
+        """
+        :return: ascending positions of items with key in range, None means unbounded, None keys never match
+        """
+        if self.keys is None:
+            try:
+                pairs = sorted((key, position) for key, positions in self.positions.items() if key is not None
+                               for position in positions)
+            except TypeError:
+                raise AnLinq.AnLinqException("Index keys are not orderable")
+            self.keys = [pair[0] for pair in pairs]
+            self.sorted_positions = [pair[1] for pair in pairs]
+        start = 0 if low is None else (bisect.bisect_left if include_low else bisect.bisect_right)(self.keys, low)
+        stop = len(self.keys) if high is None else \
+            (bisect.bisect_right if include_high else bisect.bisect_left)(self.keys, high)
+        return sorted(self.sorted_positions[start:stop])
+
+    def equal_check(self, values):
+        """
+        :return: predicate which checks that key of item is equal to one of values
+        """
+        selector = self.selector
+        return lambda item: selector(item) in values
+
+    def between_check(self, low, high, include_low, include_high):
+        """
+        :return: predicate which checks that key of item is in range, the same way as between
+        """
+        selector = self.selector
+
+        def check(item):
+            key = selector(item)
+            return key is not None and \
+                (low is None or (low <= key if include_low else low < key)) and \
+                (high is None or (key <= high if include_high else key < high))
+        return check
+
+
+class _Lookup(object):
+    """
+    Deferred index lookup: positions are found when iterated, so changes of the source are seen
+    """
+
+    def __init__(self, indexed, find, predicate):
+        """
+        :param indexed: IndexedAnLinq
+        :param find: function returning ascending positions of candidate items
+        :param predicate: function which checks candidate item, as index may be stale
+        """
+        self.indexed = indexed
+        self.find = find
+        self.predicate = predicate
+
+    def __iter__(self):
+        self.indexed._refresh()
+        items, predicate = self.indexed.iterable, self.predicate
+        for position in self.find():
+            item = items[position]
+            if predicate(item):
+                yield item
+
+
+class IndexedAnLinq(AnLinq):
+    """
+    AnLinq over list, tuple or ObservableList with hash and sorted indexes by given keys.
+    where, first and first_or_none answer equality, isin and range expressions on indexed keys by index lookups,
+    other predicates are applied to every item as usual.
+    """
+
+    def __init__(self, items, keys):
+        """
+        Instantiates IndexedAnLinq wrapper and builds indexes
+        :param items: list, tuple or ObservableList
+        :param keys: key selectors or expressions to index by
+        """
+        AnLinq.__init__(self, items)
+        self.indexes = [_Index(key) for key in keys]
+        self._state = None
+        self._refresh()
+
+    def _refresh(self):
+        state = (getattr(self.iterable, 'version', None), len(self.iterable))
+        if state != self._state:
+            for index in self.indexes:
+                index.build(self.iterable)
+            self._state = state
+
+    def reindex(self):
+        """
+        Rebuilds indexes, required only if items of plain list were replaced without changing its length,
+        otherwise lookups may miss replaced items
+        :return: self
+        :rtype: IndexedAnLinq
+        """
+        self._state = None
+        self._refresh()
+        return self
+
+    def _index(self, key):
+        if key is None:
+            return self.indexes[0]
+        for index in self.indexes:
+            if index.matches(key):
+                return index
+        raise AnLinq.AnLinqException("There is no index by " + repr(key))
+
+    def _plan(self, expression):
+        """
+        Finds condition of predicate expression which can be answered by index
+        :return: function returning ascending positions of candidate items, or None
+        """
+        op, args = expression.op, expression.args
+        if op == 'and':
+            return self._plan(args[0]) or self._plan(args[1])
+        if op not in _RANGES and op not in ('eq', 'isin'):
+            return None
+        index = next((index for index in self.indexes if index.name == repr(args[0])), None)
+        if index is None:
+            return None
+        if op == 'isin':
+            values = args[1]
+        elif args[1].op != 'const' or args[1].args[0] is None:
+            return None
+        elif op == 'eq':
+            values = args[1].args
+        else:
+            bounds = _RANGES[op](args[1].args[0])
+            return lambda: index.between(*bounds)
+        try:
+            # unhashable values can not be looked up
+            set(values)
+        except TypeError:
+            return None
+        return lambda: index.equal(values)
+
+    def where(self, predicate):
+        """
+        Filters items by predicate, using index if predicate is expression with equality, isin or range
+        condition on indexed key, possibly combined with other conditions by &
+        :param predicate: Function or expression which takes item and returns bool
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        find = self._plan(predicate) if predicate.__class__ is Expression else None
+        if find is None:
+            return AnLinq.where(self, predicate)
+        # candidates are checked by the whole predicate: other conditions of & and stale index entries
+        return AnLinq(_Lookup(self, find, predicate.function))
+
+    def first(self, predicate=None):
+        """
+        Returns first item which matches predicate or first item if no predicate given, using index if possible.
+        Raises exception, if no matching items found.
+        :param predicate: Function or expression which takes item as argument and returns bool
+        :return: item
+        :rtype: object
+        """
+        if predicate is None:
+            return AnLinq.first(self)
+        return AnLinq.first(self.where(predicate))
+
+    def get(self, value, key=None):
+        """
+        Finds items with given key
+        :param value: key value
+        :param key: key selector or expression given to with_index, the first index by default
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        index = self._index(key)
+        return AnLinq(_Lookup(self, lambda: index.equal((value,)), index.equal_check((value,))))
+
+    def get_many(self, values, key=None):
+        """
+        Finds items with key equal to one of values
+        :param values: any iterable of key values
+        :param key: key selector or expression given to with_index, the first index by default
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        index, values = self._index(key), tuple(values)
+        return AnLinq(_Lookup(self, lambda: index.equal(values), index.equal_check(values)))
+
+    def get_range(self, low=None, high=None, key=None, include_low=True, include_high=False):
+        """
+        Finds items with key in range, using sorted index
+        :param low: lower bound, None for unbounded
+        :param high: upper bound, None for unbounded
+        :param key: key selector or expression given to with_index, the first index by default
+        :param include_low: if True, items with key equal to low are included
+        :param include_high: if True, items with key equal to high are included
+        :return: results wrapped with AnLinq
+        :rtype: AnLinq
+        """
+        index = self._index(key)
+        return AnLinq(_Lookup(self, lambda: index.between(low, high, include_low, include_high),
+                              index.between_check(low, high, include_low, include_high)))
@@ -0,0 +1,174 @@
+"""
+Per-stage profiling of AnLinq queries.
+
+Instrumented query counts items leaving the source and every stage, and measures wall time, CPU time and,
+optionally, memory allocated while pulling them. Time of a stage is its own time, without upstream stages.
+Reports are passed to callbacks when iteration finishes or stops:
+
+    AnLinq(orders).where(F.paid).order_by(key=F.amount).instrument(print).to_list()
+    report = AnLinq(orders).where(F.paid).select(F.amount).profile()
+
+    add_hook(send_to_metrics)   # every query of the process is instrumented until remove_hook
+
+Queries are not instrumented when there are no hooks, which costs a single check per iteration.
+"""
+
+import collections
+import functools
+import threading
+import time
+
+_wall_clock, _cpu_clock = time.perf_counter, time.process_time
+
+hooks = []
+_local = threading.local()
+
+StageStats = collections.namedtuple('StageStats', ['stage', 'items_in', 'items_out', 'selectivity',
+                                                   'wall_time', 'cpu_time', 'allocated_bytes'])
+
+
+def add_hook(callback):
+    """
+    Instruments all queries of the process
+    :param callback: function which takes Report of every finished query iteration
+    """
+    hooks.append(callback)
+
+
+def remove_hook(callback):
+    """
+    Stops passing reports to callback
+    :param callback: function previously passed to add_hook
+    """
+    hooks.remove(callback)
+
+
+def is_reporting():
+    """
+    :return: True while callbacks of current thread are running, so queries they run are not instrumented again
+    :rtype: bool
+    """
+    return getattr(_local, 'reporting', False)
+
+
+class Report(object):
+    """
+    Statistics of one query iteration: source first, then every executed stage in order
+    """
+
+    def __init__(self, stages):
+        """
+        :param stages: list of StageStats
+        """
+        self.stages = stages
+        self.items_out = stages[-1].items_out
+        self.wall_time = sum(stage.wall_time for stage in stages)
+        self.cpu_time = sum(stage.cpu_time for stage in stages)
+
+    def to_list(self):
+        """
+        :return: list of dicts, one per stage
+        :rtype: list
+        """
+        return [dict(stage._asdict()) for stage in self.stages]
+
+    def __str__(self):
+        lines = ['%-40s %10s %10s %11s %10s %10s %12s' % ('stage', 'in', 'out', 'selectivity', 'wall ms', 'cpu ms',
+                                                          'alloc bytes')]
+        for stage in self.stages:
+            lines.append('%-40s %10s %10d %11s %10.3f %10.3f %12s' % (
+                stage.stage[:40], '' if stage.items_in is None else stage.items_in, stage.items_out,
+                '' if stage.selectivity is None else '%.1f%%' % (stage.selectivity * 100),
+                stage.wall_time * 1000, stage.cpu_time * 1000,
+                '' if stage.allocated_bytes is None else stage.allocated_bytes))
+        return '\n'.join(lines)
+
+    __repr__ = __str__
+
+
+class _Probe(object):
+    """
+    Iterator which counts items pulled through it and accumulates time spent to pull them,
+    including time of upstream stages. Stage is built on the first pull, so eager stages,
+    like order_by sorting its input, are measured too.
+    """
+
+    def __init__(self, build, memory):
+        self.build = build
+        self.iterator = None
+        self.memory = memory
+        self.count = 0
+        self.wall = self.cpu = 0.0
+        self.allocated = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        memory = self.memory() if self.memory is not None else 0
+        wall, cpu = _wall_clock(), _cpu_clock()
+        try:
+            if self.iterator is None:
+                self.iterator = iter(self.build())
+            item = next(self.iterator)
+        finally:
+            self.wall += _wall_clock() - wall
+            self.cpu += _cpu_clock() - cpu
+            if self.memory is not None:
+                self.allocated += self.memory() - memory
+        self.count += 1
+        return item
+
+
+def _report(names, probes, measure_memory):
+    stages = []
+    previous = None
+    for name, probe in zip(names, probes):
+        items_in = None if previous is None else previous.count
+        stages.append(StageStats(
+            name, items_in, probe.count,
+            float(probe.count) / items_in if items_in else None,
+            probe.wall - (previous.wall if previous is not None else 0),
+            probe.cpu - (previous.cpu if previous is not None else 0),
+            probe.allocated - (previous.allocated if previous is not None else 0) if measure_memory else None))
+        previous = probe
+    return Report(stages)
+
+
+def run(source, plan, callbacks, allocations=False):
+    """
+    Iterates optimized stages over source with probe after source and after every stage,
+    passes Report to callbacks when iteration finishes, fails or is closed
+    :param source: source iterable
+    :param plan: optimized stages
+    :param callbacks: functions which take Report
+    :param allocations: if True, net memory allocated by every stage is measured with tracemalloc
+    :return: iterator of query results
+    """
+    from anlinq import _STAGES, _describe_plan
+
+    memory, started = None, False
+    if allocations:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started = True
+        memory = lambda: tracemalloc.get_traced_memory()[0]
+
+    names = [line for line in _describe_plan(source, plan, '') if not line.startswith(' ')]
+    probes = [_Probe(functools.partial(iter, source), memory)]
+    for name, args in plan:
+        probes.append(_Probe(functools.partial(_STAGES[name], probes[-1], *args), memory))
+    try:
+        for item in probes[-1]:
+            yield item
+    finally:
+        if started:
+            tracemalloc.stop()
+        report = _report(names, probes, allocations)
+        _local.reporting = True
+        try:
+            for callback in callbacks:
+                callback(report)
+        finally:
+            _local.reporting = False
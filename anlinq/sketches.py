@@ -0,0 +1,394 @@
+"""
+Mergeable sketches which summarize a stream in one pass with bounded memory:
+
+    HyperLogLog     number of distinct items, relative error about 1.04 / sqrt(2 ** precision)
+    SpaceSaving     most frequent items, counts overestimated by at most count / capacity
+    KllSketch       quantiles, rank error about 1.7 / k
+    Reservoir       uniform random sample without replacement
+
+Every sketch has update(iterable) and merge(other), both returning the sketch itself,
+so partitions of a stream may be summarized separately and combined afterwards.
+"""
+
+import hashlib
+import heapq
+import itertools
+import math
+import random
+import struct
+
+from anlinq import AnLinq
+
+_MASK = (1 << 64) - 1
+_SIGNED = 1 << 63
+
+
+def _mix(value):
+    # splitmix64 finalizer spreads consecutive numbers over all 64 bits
+    value = (value + 0x9E3779B97F4A7C15) & _MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK
+    return value ^ (value >> 31)
+
+
+def hash64(value):
+    """
+    64-bit hash which is the same in every process, unlike hash() of strings,
+    so sketches built in different processes can be merged
+    :param value: number, string, bytes or any value with stable repr
+    :return: hash
+    :rtype: int
+    """
+    if isinstance(value, float) and value.is_integer():
+        # equal numbers have equal hashes, like 1 and 1.0
+        value = int(value)
+    if isinstance(value, int):
+        if -_SIGNED <= value < _SIGNED:
+            return _mix(value & _MASK)
+        # hash() of python reduces numbers modulo 2 ** 61 - 1, so whole value is hashed
+        data = b'i' + value.to_bytes((value.bit_length() + 8) // 8, 'big', signed=True)
+    elif isinstance(value, float):
+        data = b'f' + struct.pack('<d', value)
+    elif isinstance(value, bytes):
+        data = value
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+    else:
+        data = repr(value).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+class HyperLogLog(object):
+    """
+    Estimates number of distinct items with 2 ** precision one-byte registers
+    """
+
+    def __init__(self, precision=14):
+        """
+        :param precision: number of index bits, from 4 to 18
+        """
+        if not 4 <= precision <= 18:
+            raise AnLinq.AnLinqException("precision must be from 4 to 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        """
+        Adds item
+        :return: self
+        """
+        return self.update((item,))
+
+    def update(self, iterable):
+        """
+        Adds all items of iterable
+        :return: self
+        """
+        registers, width = self.registers, 64 - self.precision
+        low = (1 << width) - 1
+        for item in iterable:
+            value = hash64(item)
+            # rank is position of the first set bit in bits which are not used for index
+            index, rank = value >> width, width - (value & low).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+        return self
+
+    def merge(self, other):
+        """
+        Merges sketch of another stream with the same precision
+        :return: self
+        """
+        if other.precision != self.precision:
+            raise AnLinq.AnLinqException("Sketches with different precision can not be merged")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """
+        :return: estimated number of distinct items
+        :rtype: int
+        """
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # linear counting is more precise for small cardinalities
+            estimate = size * math.log(float(size) / zeros)
+        return int(round(estimate))
+
+
+class SpaceSaving(object):
+    """
+    Counts at most capacity items, new item replaces the least counted one and inherits its count as error.
+    Any item occurring more than count / capacity times is guaranteed to be kept.
+    """
+
+    def __init__(self, capacity=1000):
+        """
+        :param capacity: number of counted items
+        """
+        if capacity < 1:
+            raise AnLinq.AnLinqException("capacity must be positive")
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.count = 0
+        self._heap = []
+        self._order = itertools.count()
+
+    def add(self, item, weight=1):
+        """
+        Adds item
+        :param weight: number of occurrences
+        :return: self
+        """
+        self.count += weight
+        counts = self.counts
+        if item in counts:
+            # heap entry becomes stale and is fixed when it reaches the top
+            counts[item] += weight
+            return self
+        error = 0
+        if len(counts) >= self.capacity:
+            error, victim = self._pop_min()
+            del counts[victim], self.errors[victim]
+        counts[item] = error + weight
+        self.errors[item] = error
+        heapq.heappush(self._heap, (error + weight, next(self._order), item))
+        return self
+
+    def _pop_min(self):
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            if self.counts[item] == count:
+                return count, item
+            heapq.heappush(self._heap, (self.counts[item], next(self._order), item))
+
+    def update(self, iterable):
+        """
+        Adds all items of iterable
+        :return: self
+        """
+        counts, hits = self.counts, 0
+        for item in iterable:
+            if item in counts:
+                counts[item] += 1
+                hits += 1
+            else:
+                self.add(item)
+        self.count += hits
+        return self
+
+    def merge(self, other):
+        """
+        Merges sketch of another stream, items missing in one of sketches are assumed to have its minimal count
+        :return: self
+        """
+        own_min = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        other_min = min(other.counts.values()) if len(other.counts) >= other.capacity else 0
+        counts, errors = {}, {}
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, own_min) + other.counts.get(item, other_min)
+            errors[item] = self.errors.get(item, own_min) + other.errors.get(item, other_min)
+        kept = heapq.nlargest(self.capacity, counts, key=counts.get)
+        self.counts = dict((item, counts[item]) for item in kept)
+        self.errors = dict((item, errors[item]) for item in kept)
+        self.count += other.count
+        self._heap = [(count, next(self._order), item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def top(self, k):
+        """
+        :param k: number of items
+        :return: list of (item, estimated count) pairs of k most frequent items, most frequent first
+        :rtype: list
+        """
+        return heapq.nlargest(k, self.counts.items(), key=lambda pair: pair[1])
+
+
+class KllSketch(object):
+    """
+    Keeps items in levels of compactors, item of level h stands for 2 ** h items.
+    Full level is sorted and every second item is promoted to the next level.
+    """
+
+    def __init__(self, k=200, seed=None):
+        """
+        :param k: size of the top level, larger k gives smaller error
+        :param seed: seed of random choice of promoted items
+        """
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.random = random.Random(seed)
+        self._free = self._capacity(0)
+
+    def _capacity(self, level):
+        return int(math.ceil(self.k * (2.0 / 3) ** (len(self.levels) - level - 1))) + 1
+
+    def _compress(self):
+        size = sum(len(items) for items in self.levels)
+        while size >= sum(self._capacity(level) for level in range(len(self.levels))):
+            for level, items in enumerate(self.levels):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.levels):
+                        self.levels.append([])
+                    items.sort()
+                    # odd item stays on its level
+                    kept = [items.pop()] if len(items) % 2 else []
+                    promoted = items[self.random.random() < 0.5::2]
+                    self.levels[level + 1].extend(promoted)
+                    self.levels[level] = kept
+                    size -= len(items) - len(promoted)
+                    break
+        # items may be added without compression until sketch is full
+        self._free = sum(self._capacity(level) for level in range(len(self.levels))) - size
+
+    def add(self, item):
+        """
+        Adds item
+        :return: self
+        """
+        return self.update((item,))
+
+    def update(self, iterable):
+        """
+        Adds all items of iterable
+        :return: self
+        """
+        iterator = iter(iterable)
+        while True:
+            bottom = self.levels[0]
+            added = len(bottom)
+            bottom.extend(itertools.islice(iterator, self._free))
+            added = len(bottom) - added
+            self.count += added
+            self._free -= added
+            if self._free > 0:
+                return self
+            self._compress()
+
+    def merge(self, other):
+        """
+        Merges sketch of another stream
+        :return: self
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantile(self, quantile):
+        """
+        :param quantile: number from 0 to 1, 0.5 gives median
+        :return: item of approximately given rank
+        """
+        weighted = sorted((item, 1 << level) for level, items in enumerate(self.levels) for item in items)
+        if not weighted:
+            raise AnLinq.AnLinqException('No items!')
+        target, rank = quantile * sum(weight for item, weight in weighted), 0
+        for item, weight in weighted:
+            rank += weight
+            if rank >= target:
+                return item
+        return weighted[-1][0]
+
+
+class Reservoir(object):
+    """
+    Uniform sample of at most size items, collected with Algorithm L:
+    number of items to skip before the next replacement is drawn at once, so skipped items cost nothing
+    """
+
+    def __init__(self, size, seed=None):
+        """
+        :param size: number of sampled items
+        :param seed: seed of random generator
+        """
+        if size < 1:
+            raise AnLinq.AnLinqException("size must be positive")
+        self.size = size
+        self.items = []
+        self.count = 0
+        self.random = random.Random(seed)
+        self._weight = None
+        self._next = None
+
+    def _uniform(self):
+        value = 0.0
+        while value == 0.0:
+            value = self.random.random()
+        return value
+
+    def _schedule(self, index):
+        self._weight *= math.exp(math.log(self._uniform()) / self.size)
+        self._next = index + 1 + int(math.log(self._uniform()) / math.log(1 - self._weight))
+
+    def add(self, item):
+        """
+        Adds item
+        :return: self
+        """
+        return self.update((item,))
+
+    def update(self, iterable):
+        """
+        Adds all items of iterable
+        :return: self
+        """
+        counter = itertools.count(self.count)
+        # zip pulls counter once per item, so counter stops at number of consumed items
+        pairs = zip(iterable, counter)
+        position = self.count
+        for item, index in pairs:
+            if len(self.items) >= self.size:
+                pairs = itertools.chain(((item, index),), pairs)
+                break
+            self.items.append(item)
+            position = index + 1
+        if len(self.items) == self.size:
+            if self._next is None:
+                self._weight = 1.0
+                self._schedule(self.size - 1)
+            while True:
+                pair = next(itertools.islice(pairs, self._next - position, None), None)
+                if pair is None:
+                    break
+                item, index = pair
+                self.items[self.random.randrange(self.size)] = item
+                position = index + 1
+                self._schedule(index)
+        self.count = next(counter)
+        return self
+
+    def merge(self, other):
+        """
+        Merges sample of another stream: every item is drawn from either sample
+        in proportion to number of not yet drawn items of its stream
+        :return: self
+        """
+        own, others = list(self.items), list(other.items)
+        self.random.shuffle(own)
+        self.random.shuffle(others)
+        own_count, other_count = self.count, other.count
+        items = []
+        while len(items) < self.size and (own or others):
+            if own and (not others or self.random.random() * (own_count + other_count) < own_count):
+                items.append(own.pop())
+                own_count -= 1
+            else:
+                items.append(others.pop())
+                other_count -= 1
+        self.items = items
+        self.count += other.count
+        self._weight = self._next = None
+        if len(items) == self.size:
+            self._weight = 1.0
+            self._schedule(self.count - 1)
+        return self
@@ -0,0 +1,152 @@
+"""
+Re-iterable file sources for AnLinq: every iteration reopens the file and reads it lazily.
+Sources may be limited to byte range [start, end), so one file can be split between workers.
+"""
+
+import csv
+import mmap
+import os
+import struct
+
+BUFFER_SIZE = 1 << 20
+
+
+def byte_ranges(path, parts):
+    """
+    Splits file into given number of byte ranges of about equal size.
+    Ranges do not need to be aligned, sources skip partial first line or record of the range.
+    :param path: path to file
+    :param parts: number of ranges
+    :return: list of (start, end) tuples
+    :rtype: list
+    """
+    size = os.path.getsize(path)
+    bounds = [size * part // parts for part in range(parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class LineSource(object):
+    """
+    Lines of a file as bytes, read with large buffer.
+    Range contains lines which start within [start, end), so adjacent ranges never share or lose lines.
+    """
+
+    def __init__(self, path, start=0, end=None, raw_filter=None, keep_ends=False):
+        """
+        :param path: path to file
+        :param start: first byte of range
+        :param end: byte after the range, end of file by default
+        :param raw_filter: function which takes raw line bytes and returns bool, applied before decoding
+        :param keep_ends: if True line terminators are kept
+        """
+        self.path = path
+        self.start = start
+        self.end = end
+        self.raw_filter = raw_filter
+        self.keep_ends = keep_ends
+
+    def __iter__(self):
+        with open(self.path, 'rb', BUFFER_SIZE) as stream:
+            position = self.start
+            if position > 0:
+                # line which starts exactly at start belongs to this range, otherwise it belongs to previous one
+                stream.seek(position - 1)
+                position += len(stream.readline()) - 1
+            for line in stream:
+                if self.end is not None and position >= self.end:
+                    return
+                position += len(line)
+                if not self.keep_ends:
+                    line = line.rstrip(b'\r\n')
+                if self.raw_filter is None or self.raw_filter(line):
+                    yield line
+
+
+class CsvSource(object):
+    """
+    Rows of CSV file, as dicts when file has header or as lists otherwise.
+    Quoted values must not contain line breaks when file is split into byte ranges.
+    """
+
+    def __init__(self, path, start=0, end=None, raw_filter=None, header=True, encoding='utf-8', **fmtparams):
+        """
+        :param path: path to file
+        :param start: first byte of range
+        :param end: byte after the range, end of file by default
+        :param raw_filter: function which takes raw line bytes and returns bool, applied before parsing
+        :param header: if True first line of file contains field names
+        :param encoding: encoding of file
+        :param fmtparams: csv.reader formatting parameters, like delimiter
+        """
+        self.path = path
+        self.start = start
+        self.end = end
+        self.raw_filter = raw_filter
+        self.header = header
+        self.encoding = encoding
+        self.fmtparams = fmtparams
+
+    def __iter__(self):
+        start, names = self.start, None
+        if self.header:
+            with open(self.path, 'rb') as stream:
+                first_line = stream.readline()
+            names = next(csv.reader([first_line.decode(self.encoding)], **self.fmtparams), [])
+            start = max(start, len(first_line))
+        lines = LineSource(self.path, start, self.end, self.raw_filter, keep_ends=True)
+        rows = csv.reader((line.decode(self.encoding) for line in lines), **self.fmtparams)
+        if names is None:
+            return rows
+        return (dict(zip(names, row)) for row in rows)
+
+
+class RecordSource(object):
+    """
+    Fixed size binary records of a memory-mapped file, unpacked with struct.
+    Range contains records which start within [start, end).
+    """
+
+    def __init__(self, path, struct_format, start=0, end=None):
+        """
+        :param path: path to file
+        :param struct_format: struct format of one record, like '<id'
+        :param start: first byte of range
+        :param end: byte after the range, end of file by default
+        """
+        self.path = path
+        self.struct = struct.Struct(struct_format)
+        self.start = start
+        self.end = end
+
+    def _bounds(self):
+        """
+        :return: first byte of the first record and byte after the last record in range
+        """
+        size = self.struct.size
+        file_size = os.path.getsize(self.path)
+        end = file_size if self.end is None else min(self.end, file_size)
+        first = -(-self.start // size)
+        last = max(first, -(-end // size))
+        return first * size, min(last * size, file_size // size * size)
+
+    def __len__(self):
+        first, last = self._bounds()
+        return max(last - first, 0) // self.struct.size
+
+    def __iter__(self):
+        first, last = self._bounds()
+        if last <= first:
+            return
+        single = len(self.struct.unpack(b'\0' * self.struct.size)) == 1
+        with open(self.path, 'rb') as stream:
+            mapping = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                records = self.struct.iter_unpack(memoryview(mapping)[first:last])
+                try:
+                    for record in records:
+                        yield record[0] if single else record
+                finally:
+                    # unpacker holds the view of mapping, it must go before mapping is closed
+                    del records
+            finally:
+                mapping.close()
@@ -0,0 +1,159 @@
+"""
+Out-of-core order_by and distinct: items are spilled to temporary files in pickled batches,
+so memory stays bounded by max_memory while files are written and read sequentially.
+Memory is estimated with sys.getsizeof of items or keys, which does not count objects they refer to.
+"""
+
+import heapq
+import itertools
+import pickle
+import sys
+import tempfile
+
+BATCH_SIZE = 1024
+PARTITIONS = 64
+
+
+class SpillFile(object):
+    """
+    Temporary file of pickled items, deleted when closed
+    """
+
+    def __init__(self):
+        self.stream = tempfile.TemporaryFile()
+
+    def write(self, items):
+        """
+        Appends items in batches
+        :param items: any iterable
+        """
+        iterator = iter(items)
+        for batch in iter(lambda: list(itertools.islice(iterator, BATCH_SIZE)), []):
+            pickle.dump(batch, self.stream, pickle.HIGHEST_PROTOCOL)
+
+    def __iter__(self):
+        self.stream.seek(0)
+        while True:
+            try:
+                batch = pickle.load(self.stream)
+            except EOFError:
+                return
+            for item in batch:
+                yield item
+
+    def close(self):
+        self.stream.close()
+
+
+def _runs(iterator, max_memory):
+    """
+    Splits items into lists which take about max_memory each
+    """
+    while True:
+        run, size = [], 0
+        for item in iterator:
+            run.append(item)
+            size += sys.getsizeof(item)
+            if size >= max_memory:
+                break
+        if not run:
+            return
+        yield run
+
+
+def external_sort(iterable, key, descending, max_memory):
+    """
+    Sorts runs of about max_memory bytes, spills them to temporary files and merges them with heapq.merge.
+    Input which fits in max_memory is sorted in memory. Sort is stable as runs are merged in input order.
+    :param iterable: items to sort
+    :param key: sort key function or None
+    :param descending: if True items are sorted in descending order
+    :param max_memory: approximate number of bytes of items kept in memory
+    :return: iterator of sorted items
+    """
+    runs = _runs(iter(iterable), max_memory)
+    first = next(runs, [])
+    second = next(runs, None)
+    if second is None:
+        first.sort(key=key, reverse=descending)
+        for item in first:
+            yield item
+        return
+
+    files = []
+    try:
+        for run in itertools.chain((first, second), runs):
+            run.sort(key=key, reverse=descending)
+            files.append(SpillFile())
+            files[-1].write(run)
+            del run[:]
+        first = second = None
+        for item in heapq.merge(*files, key=key, reverse=descending):
+            yield item
+    finally:
+        for spill in files:
+            spill.close()
+
+
+def external_distinct(iterable, key_selector, max_memory):
+    """
+    Streams distinct items while their keys fit in max_memory. After that items with unseen keys are spilled
+    with their positions into hash partitions, every partition is deduplicated in memory,
+    and partitions are merged back by position, so the first occurrence order is kept.
+    Every partition should fit in max_memory, so input may hold up to PARTITIONS times more distinct keys.
+    :param iterable: items
+    :param key_selector: function which takes item and returns key for it, or None
+    :param max_memory: approximate number of bytes of keys kept in memory
+    :return: iterator of distinct items
+    """
+    iterator = iter(iterable)
+    seen, size = set(), 0
+    for item in iterator:
+        key = key_selector(item) if key_selector is not None else item
+        if key not in seen:
+            seen.add(key)
+            size += sys.getsizeof(key)
+            yield item
+            if size >= max_memory:
+                break
+    else:
+        return
+
+    partitions = [SpillFile() for _ in range(PARTITIONS)]
+    survivors = []
+    try:
+        buffers = [[] for _ in range(PARTITIONS)]
+        for index, item in enumerate(iterator):
+            key = key_selector(item) if key_selector is not None else item
+            if key not in seen:
+                buffer = buffers[hash(key) % PARTITIONS]
+                buffer.append((index, item))
+                if len(buffer) >= BATCH_SIZE:
+                    partitions[hash(key) % PARTITIONS].write(buffer)
+                    del buffer[:]
+        for partition, buffer in zip(partitions, buffers):
+            partition.write(buffer)
+        seen = buffers = None
+
+        for partition in partitions:
+            survivors.append(SpillFile())
+            survivors[-1].write(_first_occurrences(partition, key_selector))
+            partition.close()
+        for index, item in heapq.merge(*survivors, key=_position):
+            yield item
+    finally:
+        for spill in partitions + survivors:
+            spill.close()
+
+
+def _first_occurrences(pairs, key_selector):
+    keys = set()
+    for pair in pairs:
+        key = key_selector(pair[1]) if key_selector is not None else pair[1]
+        if key not in keys:
+            keys.add(key)
+            yield pair
+
+
+def _position(pair):
+    return pair[0]
@@ -0,0 +1,343 @@
+"""
+Observable collection and materialized views which are updated incrementally:
+every append or remove is applied to subscribed views as a delta, so keeping a view
+over n items costs O(delta) per update instead of re-running the query over n items.
+
+    items = ObservableList(orders)
+    totals = AnLinq(items).where(F.paid).materialize_by(F.region, 'sum', F.amount)
+    items.append(order)     # totals is already up to date
+
+Views support queries built of where, select and select_many, and their functions must be deterministic,
+as removed items are passed through the same functions to find what to remove from the view.
+"""
+
+import collections
+import collections.abc
+import itertools
+import weakref
+
+from anlinq import AnLinq, _Query, _STAGES, _optimize, _function
+
+_INCREMENTAL_STAGES = ('where', 'select', 'select_many')
+
+
+class ObservableList(collections.abc.Sequence):
+    """
+    List which notifies subscribed views about appended and removed items.
+    Version is increased on every change, so cached queries over it are invalidated automatically.
+    """
+
+    def __init__(self, iterable=()):
+        """
+        :param iterable: initial items
+        """
+        self._items = list(iterable)
+        self._tokens = list(range(len(self._items)))
+        self._next_token = len(self._items)
+        self._views = weakref.WeakSet()
+        self.version = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __repr__(self):
+        return 'ObservableList(' + repr(self._items) + ')'
+
+    def append(self, item):
+        """
+        Appends item and updates views
+        :param item: any item
+        """
+        self.extend((item,))
+
+    def extend(self, iterable):
+        """
+        Appends items and updates views
+        :param iterable: any iterable
+        """
+        added = list(iterable)
+        tokens = list(range(self._next_token, self._next_token + len(added)))
+        self._next_token += len(added)
+        self._items.extend(added)
+        self._tokens.extend(tokens)
+        self._notify('_added', list(zip(tokens, added)))
+
+    def pop(self, index=-1):
+        """
+        Removes item at index and updates views
+        :param index: index of item, last by default
+        :return: removed item
+        """
+        token = self._tokens.pop(index)
+        item = self._items.pop(index)
+        self._notify('_removed', [(token, item)])
+        return item
+
+    def remove(self, item):
+        """
+        Removes first occurrence of item and updates views
+        :param item: item to remove
+        """
+        try:
+            index = self._items.index(item)
+        except ValueError:
+            raise AnLinq.AnLinqException("Item is not in list")
+        self.pop(index)
+
+    def clear(self):
+        """
+        Removes all items and updates views
+        """
+        removed = list(zip(self._tokens, self._items))
+        self._items, self._tokens = [], []
+        self._notify('_removed', removed)
+
+    def subscribe(self, view):
+        """
+        Subscribes view to changes, view is referenced weakly and unsubscribes when it is garbage collected
+        :param view: object with _added(pairs) and _removed(pairs) methods, which take (token, item) pairs
+        """
+        self._views.add(view)
+        view._added(list(zip(self._tokens, self._items)))
+
+    def unsubscribe(self, view):
+        """
+        Stops updating view
+        :param view: subscribed view
+        """
+        self._views.discard(view)
+
+    def _notify(self, method, pairs):
+        self.version += 1
+        if pairs:
+            for view in list(self._views):
+                getattr(view, method)(pairs)
+
+
+class _MaterializedView(object):
+    """
+    Base of views: runs recorded element-wise stages over every added or removed item
+    """
+
+    def __init__(self, iterable):
+        source, stages = (iterable.source, iterable.stages) if iterable.__class__ is _Query else (iterable, ())
+        if not isinstance(source, ObservableList):
+            raise AnLinq.AnLinqException("Materialized views require ObservableList source")
+        if any(name not in _INCREMENTAL_STAGES for name, args in stages):
+            raise AnLinq.AnLinqException("Only " + ', '.join(_INCREMENTAL_STAGES) + " can be maintained incrementally")
+        self.plan = _optimize(stages)
+        source.subscribe(self)
+
+    def _results(self, item):
+        iterable = (item,)
+        for name, args in self.plan:
+            iterable = _STAGES[name](iterable, *args)
+        return iterable
+
+    def _added(self, pairs):
+        for token, item in pairs:
+            for result in self._results(item):
+                self._add(token, result)
+
+    def _removed(self, pairs):
+        for token, item in pairs:
+            for result in self._results(item):
+                self._remove(token, result)
+
+
+class MaterializedList(_MaterializedView):
+    """
+    Results of query in source order
+    """
+
+    def __init__(self, iterable):
+        self._chunks = collections.OrderedDict()
+        self._count = 0
+        _MaterializedView.__init__(self, iterable)
+
+    def _add(self, token, result):
+        self._chunks.setdefault(token, []).append(result)
+        self._count += 1
+
+    def _removed(self, pairs):
+        # results are kept by source item, so removed item does not need to run through stages again
+        for token, item in pairs:
+            chunk = self._chunks.pop(token, None)
+            if chunk is not None:
+                self._count -= len(chunk)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._chunks.values())
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+    def to_list(self):
+        """
+        :return: copy of results
+        :rtype: list
+        """
+        return list(self)
+
+
+class MaterializedSet(_MaterializedView):
+    """
+    Distinct results of query, each one is kept while at least one source item produces it
+    """
+
+    def __init__(self, iterable):
+        self._counts = {}
+        _MaterializedView.__init__(self, iterable)
+
+    def _add(self, token, result):
+        self._counts[result] = self._counts.get(result, 0) + 1
+
+    def _remove(self, token, result):
+        count = self._counts[result] - 1
+        if count:
+            self._counts[result] = count
+        else:
+            del self._counts[result]
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __iter__(self):
+        return iter(self._counts)
+
+    def __contains__(self, item):
+        return item in self._counts
+
+    def __repr__(self):
+        return repr(self.to_set())
+
+    def to_set(self):
+        """
+        :return: copy of distinct results
+        :rtype: set
+        """
+        return set(self._counts)
+
+
+class MaterializedGroups(_MaterializedView):
+    """
+    Number, sum or average of values of every key, keys without items are dropped
+    """
+
+    def __init__(self, iterable, key_selector, func='count', value_selector=None):
+        if func not in ('count', 'sum', 'average'):
+            raise AnLinq.AnLinqException("func must be one of 'count', 'sum', 'average'")
+        self.key_selector = _function(key_selector)
+        self.value_selector = _function(value_selector)
+        self.func = func
+        self._groups = {}
+        _MaterializedView.__init__(self, iterable)
+
+    def _add(self, token, result):
+        key = self.key_selector(result)
+        value = self.value_selector(result) if self.value_selector is not None else result
+        group = self._groups.get(key)
+        if group is None:
+            self._groups[key] = [1, value if self.func != 'count' else 0]
+        else:
+            group[0] += 1
+            if self.func != 'count':
+                group[1] += value
+
+    def _remove(self, token, result):
+        key = self.key_selector(result)
+        group = self._groups[key]
+        group[0] -= 1
+        if not group[0]:
+            del self._groups[key]
+        elif self.func != 'count':
+            group[1] -= self.value_selector(result) if self.value_selector is not None else result
+
+    def _value(self, group):
+        if self.func == 'count':
+            return group[0]
+        return group[1] if self.func == 'sum' else group[1] / float(group[0])
+
+    def __getitem__(self, key):
+        return self._value(self._groups[key])
+
+    def __contains__(self, key):
+        return key in self._groups
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __iter__(self):
+        return iter(self._groups)
+
+    def __repr__(self):
+        return repr(self.to_dictionary())
+
+    def to_dictionary(self):
+        """
+        :return: copy of aggregated values by keys
+        :rtype: dict
+        """
+        return dict((key, self._value(group)) for key, group in self._groups.items())
+
+
+class MaterializedLookup(_MaterializedView):
+    """
+    Values of query results grouped by keys, in source order within every key
+    """
+
+    def __init__(self, iterable, key_selector, value_selector=None):
+        self.key_selector = _function(key_selector)
+        self.value_selector = _function(value_selector)
+        self._groups = {}
+        _MaterializedView.__init__(self, iterable)
+
+    def _add(self, token, result):
+        value = self.value_selector(result) if self.value_selector is not None else result
+        group = self._groups.setdefault(self.key_selector(result), collections.OrderedDict())
+        group.setdefault(token, []).append(value)
+
+    def _remove(self, token, result):
+        key = self.key_selector(result)
+        group = self._groups.get(key)
+        if group is not None and group.pop(token, None) is not None and not group:
+            del self._groups[key]
+
+    def __getitem__(self, key):
+        """
+        :return: values of given key wrapped with AnLinq, empty for missing key
+        :rtype: AnLinq
+        """
+        group = self._groups.get(key)
+        return AnLinq(list(itertools.chain.from_iterable(group.values())) if group is not None else [])
+
+    def __contains__(self, key):
+        return key in self._groups
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __iter__(self):
+        return iter(self._groups)
+
+    def __repr__(self):
+        return repr(self.to_lookup())
+
+    def to_lookup(self):
+        """
+        :return: copy of values by keys
+        :rtype: AnLinq.Lookup
+        """
+        result = AnLinq.Lookup()
+        for key in self._groups:
+            result[key] = self[key]
+        return result
@@ -0,0 +1,142 @@
+"""
+Microbenchmark of constant per-chain overhead: short AnLinq chains over tiny lists
+compared with equivalent list comprehensions, in microseconds per chain.
+
+    python benchmarks/overhead.py --sizes 0 1 10 100
+
+Chains may also be compared with another version of AnLinq, for example the last release,
+which is measured in a separate interpreter and printed as the before column:
+
+    git worktree add /tmp/anlinq-before <commit>
+    python benchmarks/overhead.py --sizes 10 --before /tmp/anlinq-before
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+AnLinq = None
+
+
+def is_even(x):
+    return x % 2 == 0
+
+
+def double(x):
+    return x * 2
+
+
+CHAINS = [
+    ('where.select.to_list',
+     lambda s: AnLinq(s).where(is_even).select(double).to_list(),
+     lambda s: [double(x) for x in s if is_even(x)]),
+    ('select.to_list',
+     lambda s: AnLinq(s).select(double).to_list(),
+     lambda s: [double(x) for x in s]),
+    ('where.count',
+     lambda s: AnLinq(s).where(is_even).count(),
+     lambda s: sum(1 for x in s if is_even(x))),
+    ('take.to_list',
+     lambda s: AnLinq(s).take(3).to_list(),
+     lambda s: s[:3]),
+    ('skip.take.to_list',
+     lambda s: AnLinq(s).skip(1).take(3).to_list(),
+     lambda s: s[1:4]),
+    ('order_by.take.to_list',
+     lambda s: AnLinq(s).order_by(descending=True).take(3).to_list(),
+     lambda s: sorted(s, reverse=True)[:3]),
+    ('any',
+     lambda s: AnLinq(s).any(is_even),
+     lambda s: any(is_even(x) for x in s)),
+]
+
+
+def _microseconds(func, source, number, repeat):
+    # minimum of many short runs is the least disturbed by other processes
+    return min(timeit.repeat(lambda: func(source), number=number, repeat=repeat)) / number * 1e6
+
+
+def _measure(sizes, number, repeat):
+    """
+    :return: dict of chain name and size to AnLinq microseconds, None for chains the version does not support
+    """
+    results = {}
+    for size in sizes:
+        source = list(range(size))
+        for name, func, baseline in CHAINS:
+            try:
+                results[name, size] = _microseconds(func, source, number, repeat)
+            except Exception:
+                results[name, size] = None
+    return results
+
+
+def _measure_before(path, sizes, number, repeat):
+    """
+    Measures chains with AnLinq imported from path in a separate interpreter
+    :return: dict of chain name and size to microseconds, None for chains the version does not support
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--anlinq', path, '--json', '--number', str(number),
+               '--repeat', str(repeat), '--sizes'] + [str(size) for size in sizes]
+    results = json.loads(subprocess.check_output(command).decode('utf-8'))
+    return dict(((name, size), value) for name, size, value in results)
+
+
+def _fastest(results, other):
+    return dict((key, None if value is None else min(value, other[key])) for key, value in results.items())
+
+
+def main(argv=None):
+    global AnLinq
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 1, 10, 100])
+    parser.add_argument('--number', type=int, default=2000, help='chains per run')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per measurement, the fastest one is reported')
+    parser.add_argument('--before', help='directory with anlinq package to compare with')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='with --before, versions are measured in turns this many times, so drift of machine '
+                             'speed affects both')
+    parser.add_argument('--anlinq', help='directory with anlinq package to measure, this checkout by default')
+    parser.add_argument('--json', action='store_true', help='print AnLinq timings as JSON')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, args.anlinq or os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from anlinq import AnLinq
+
+    if args.json:
+        results = _measure(args.sizes, args.number, args.repeat)
+        print(json.dumps([(name, size, value) for (name, size), value in sorted(results.items())]))
+        return
+
+    after = _measure(args.sizes, args.number, args.repeat)
+    before = None
+    if args.before:
+        before = _measure_before(args.before, args.sizes, args.number, args.repeat)
+        for _ in range(args.rounds - 1):
+            after = _fastest(after, _measure(args.sizes, args.number, args.repeat))
+            before = _fastest(before, _measure_before(args.before, args.sizes, args.number, args.repeat))
+
+    if before is None:
+        print('%-24s %6s %12s %12s %8s' % ('chain', 'size', 'anlinq us', 'raw us', 'ratio'))
+    else:
+        print('%-24s %6s %12s %12s %12s %8s %8s' % ('chain', 'size', 'before us', 'anlinq us', 'raw us', 'ratio',
+                                                    'speedup'))
+    for size in args.sizes:
+        source = list(range(size))
+        for name, func, baseline in CHAINS:
+            anlinq_time = after[name, size]
+            raw_time = _microseconds(baseline, source, args.number, args.repeat)
+            if before is None:
+                print('%-24s %6d %12.2f %12.2f %8.2f' % (name, size, anlinq_time, raw_time, anlinq_time / raw_time))
+                continue
+            before_time = before[name, size]
+            print('%-24s %6d %12s %12.2f %12.2f %8.2f %8s' % (
+                name, size, '-' if before_time is None else '%.2f' % before_time, anlinq_time, raw_time,
+                anlinq_time / raw_time, '-' if before_time is None else '%.2fx' % (before_time / anlinq_time)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+"""
+Benchmarks of AnLinq operators against equivalent comprehensions and itertools code.
+
+Every case runs over list, generator, range and dict sources of given sizes and reports
+operations per second, items per second and peak memory of AnLinq and of the raw baseline.
+Results may be saved as JSON and compared with previous run:
+
+    python benchmarks/run.py --sizes 1000 100000 --output before.json
+    python benchmarks/run.py --sizes 1000 100000 --output after.json --compare before.json
+    python benchmarks/run.py --cases where order_by_take --sources list --sizes 10000000
+
+Requires python 3.4+ for tracemalloc.
+"""
+
+import argparse
+import collections
+import functools
+import heapq
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anlinq import AnLinq  # noqa: E402
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+# memory budget of max_memory cases, small enough to spill sources of 100000 items to disk
+SPILL_MEMORY = 1 << 18
+
+
+def _sources(size):
+    """
+    :return: dict of source name to function returning fresh source with given number of integers
+    """
+    data = list(range(size))
+    mapping = dict.fromkeys(data, 0)
+    return collections.OrderedDict([
+        ('list', lambda: data),
+        ('generator', lambda: (i for i in data)),
+        ('range', lambda: range(size)),
+        ('dict', lambda: mapping),
+    ])
+
+
+def _distinct(iterable, key):
+    seen = set()
+    result = []
+    for i in iterable:
+        k = key(i)
+        if k not in seen:
+            seen.add(k)
+            result.append(i)
+    return result
+
+
+def _group_by(iterable, key):
+    groups = collections.defaultdict(list)
+    for i in iterable:
+        groups[key(i)].append(i)
+    return groups
+
+
+def _sum_by(iterable, key):
+    sums = collections.defaultdict(int)
+    for i in iterable:
+        sums[key(i)] += i
+    return sums
+
+
+def _join(outer, inner):
+    lookup = _group_by(inner, lambda x: x)
+    return [(o, i) for o in outer for i in lookup.get(o, ())]
+
+
+def _left_join(outer, inner):
+    lookup = _group_by(inner, lambda x: x)
+    return [(o, i) for o in outer for i in lookup.get(o) or (None,)]
+
+
+def _intersect(iterable, other):
+    keys = set(other)
+    return [x for x in iterable if x in keys]
+
+
+def _except(iterable, other):
+    keys = set(other)
+    return [x for x in iterable if x not in keys]
+
+
+def _symmetric_difference(iterable, other):
+    items = _distinct(iterable, lambda x: x)
+    keys, other_keys = set(items), set(other)
+    return [x for x in items if x not in other_keys] + [x for x in _distinct(other, lambda x: x) if x not in keys]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    return list(iter(lambda: list(itertools.islice(iterator, size)), []))
+
+
+def _windows(iterable, size):
+    window = collections.deque(maxlen=size)
+    result = []
+    for x in iterable:
+        window.append(x)
+        if len(window) == size:
+            result.append(tuple(window))
+    return result
+
+
+def _rolling_sum(iterable, size):
+    values = list(iterable)
+    total = sum(values[:size])
+    result = [total] if len(values) >= size else []
+    for index in range(size, len(values)):
+        total += values[index] - values[index - size]
+        result.append(total)
+    return result
+
+
+def _group_join(iterable, other):
+    lookup = _group_by(other, lambda x: x)
+    return [(x, lookup.get(x, [])) for x in iterable]
+
+
+def _last(iterable):
+    return collections.deque(iterable, maxlen=1)[0]
+
+
+def _cases(size):
+    """
+    :return: list of (name, anlinq function, baseline function), each function takes source
+    """
+    half, inner = size // 2, range(0, size, 10)
+    return [
+        ('where',
+         lambda s: AnLinq(s).where(lambda x: x % 3 == 0).to_list(),
+         lambda s: [x for x in s if x % 3 == 0]),
+        ('select',
+         lambda s: AnLinq(s).select(lambda x: x * 2).to_list(),
+         lambda s: [x * 2 for x in s]),
+        ('select_batch',
+         lambda s: AnLinq(s).select_batch(lambda b: [x * 2 for x in b], 1000).to_list(),
+         lambda s: [x * 2 for x in s]),
+        ('select_many',
+         lambda s: AnLinq(s).select_many(lambda x: (x, x)).to_list(),
+         lambda s: [y for x in s for y in (x, x)]),
+        ('distinct',
+         lambda s: AnLinq(s).distinct(lambda x: x % 1000).to_list(),
+         lambda s: _distinct(s, lambda x: x % 1000)),
+        ('take',
+         lambda s: AnLinq(s).take(10).to_list(),
+         lambda s: list(itertools.islice(s, 10))),
+        ('skip',
+         lambda s: AnLinq(s).skip(half).to_list(),
+         lambda s: list(itertools.islice(s, half, None))),
+        ('order_by',
+         lambda s: AnLinq(s).order_by(key=lambda x: -x).to_list(),
+         lambda s: sorted(s, key=lambda x: -x)),
+        ('order_by_then_by',
+         lambda s: AnLinq(s).order_by(key=lambda x: x % 10).then_by_descending(lambda x: x).to_list(),
+         lambda s: sorted(sorted(s, reverse=True), key=lambda x: x % 10)),
+        ('order_by_take',
+         lambda s: AnLinq(s).order_by(key=lambda x: -x).take(10).to_list(),
+         lambda s: heapq.nsmallest(10, s, key=lambda x: -x)),
+        ('group_by',
+         lambda s: AnLinq(s).group_by(lambda x: x % 100),
+         lambda s: _group_by(s, lambda x: x % 100)),
+        ('aggregate_by',
+         lambda s: AnLinq(s).aggregate_by(lambda x: x % 100, 'sum'),
+         lambda s: _sum_by(s, lambda x: x % 100)),
+        ('to_dictionary',
+         lambda s: AnLinq(s).to_dictionary(lambda x: x, lambda x: x),
+         lambda s: dict((x, x) for x in s)),
+        ('count',
+         lambda s: AnLinq(s).where(lambda x: x % 3 == 0).count(),
+         lambda s: sum(1 for x in s if x % 3 == 0)),
+        ('sum',
+         lambda s: AnLinq(s).sum(),
+         lambda s: sum(s)),
+        ('min',
+         lambda s: AnLinq(s).min(),
+         lambda s: min(s)),
+        ('first',
+         lambda s: AnLinq(s).first(lambda x: x >= half),
+         lambda s: next(x for x in s if x >= half)),
+        ('join',
+         lambda s: AnLinq(s).join(inner, lambda x: x, lambda x: x).to_list(),
+         lambda s: _join(s, inner)),
+        ('intersect',
+         lambda s: AnLinq(s).intersect(inner).to_list(),
+         lambda s: _intersect(s, inner)),
+        ('except_for',
+         lambda s: AnLinq(s).except_for(inner).to_list(),
+         lambda s: _except(s, inner)),
+        ('union',
+         lambda s: AnLinq(s).union(inner).to_list(),
+         lambda s: _distinct(itertools.chain(s, inner), lambda x: x)),
+        ('symmetric_difference',
+         lambda s: AnLinq(s).symmetric_difference(inner).to_list(),
+         lambda s: _symmetric_difference(s, inner)),
+        ('concat',
+         lambda s: AnLinq(s).concat(inner).to_list(),
+         lambda s: list(itertools.chain(s, inner))),
+        ('any',
+         lambda s: AnLinq(s).any(lambda x: x < 0),
+         lambda s: any(x < 0 for x in s)),
+        ('all',
+         lambda s: AnLinq(s).all(lambda x: x >= 0),
+         lambda s: all(x >= 0 for x in s)),
+        ('last',
+         lambda s: AnLinq(s).last(),
+         _last),
+        ('aggregate',
+         lambda s: AnLinq(s).aggregate(lambda total, x, index: total + x, 0),
+         lambda s: functools.reduce(lambda total, x: total + x, s, 0)),
+        ('left_join',
+         lambda s: AnLinq(s).left_join(inner, lambda x: x, lambda x: x).to_list(),
+         lambda s: _left_join(s, inner)),
+        ('group_join',
+         lambda s: AnLinq(s).group_join(inner, lambda x: x, lambda x: x).to_list(),
+         lambda s: _group_join(s, inner)),
+        ('semi_join',
+         lambda s: AnLinq(s).semi_join(inner, lambda x: x, lambda x: x).to_list(),
+         lambda s: _intersect(s, inner)),
+        ('anti_join',
+         lambda s: AnLinq(s).anti_join(inner, lambda x: x, lambda x: x).to_list(),
+         lambda s: _except(s, inner)),
+        ('to_lookup',
+         lambda s: AnLinq(s).to_lookup(lambda x: x % 100),
+         lambda s: _group_by(s, lambda x: x % 100)),
+        ('chunk',
+         lambda s: AnLinq(s).chunk(100).to_list(),
+         lambda s: _chunks(s, 100)),
+        ('window',
+         lambda s: AnLinq(s).window(10).to_list(),
+         lambda s: _windows(s, 10)),
+        ('pairwise',
+         lambda s: AnLinq(s).pairwise().to_list(),
+         lambda s: _windows(s, 2)),
+        ('rolling',
+         lambda s: AnLinq(s).rolling(10).to_list(),
+         lambda s: _rolling_sum(s, 10)),
+        ('order_by_max_memory',
+         lambda s: AnLinq(s).order_by(key=lambda x: -x, max_memory=SPILL_MEMORY).to_list(),
+         lambda s: sorted(s, key=lambda x: -x)),
+        ('distinct_max_memory',
+         lambda s: AnLinq(s).distinct(max_memory=SPILL_MEMORY).to_list(),
+         lambda s: _distinct(s, lambda x: x)),
+        ('approx_count_distinct',
+         lambda s: AnLinq(s).approx_count_distinct(),
+         lambda s: len(set(s))),
+        ('approx_top_k',
+         lambda s: AnLinq(s).approx_top_k(10, lambda x: x % 100),
+         lambda s: collections.Counter(x % 100 for x in s).most_common(10)),
+        ('approx_quantile',
+         lambda s: AnLinq(s).approx_quantile(0.5),
+         lambda s: sorted(s)[half]),
+        ('sample',
+         lambda s: AnLinq(s).sample(100).to_list(),
+         lambda s: random.sample(list(s), min(100, size))),
+        ('chain',
+         lambda s: AnLinq(s).where(lambda x: x % 2 == 0).select(lambda x: x % 5000).distinct()
+         .order_by(descending=True).take(10).to_list(),
+         lambda s: heapq.nlargest(10, set(x % 5000 for x in s if x % 2 == 0))),
+    ]
+
+
+def _ops_per_second(func, make_source, min_time):
+    """
+    Runs func over fresh sources, increasing number of runs until it takes min_time, best of 3 is used
+    :return: runs per second
+    :rtype: float
+    """
+    number = 1
+    while True:
+        best = None
+        for _ in range(3):
+            sources = [make_source() for _ in range(number)]
+            start = time.perf_counter()
+            for source in sources:
+                func(source)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            if elapsed < min_time:
+                break
+        if best >= min_time:
+            return number / best
+        number *= max(2, min(10, int(min_time / max(best, 1e-9)) + 1))
+
+
+def _peak_memory(func, make_source):
+    """
+    :return: peak bytes allocated by func, not counting source itself
+    :rtype: int
+    """
+    source = make_source()
+    tracemalloc.start()
+    try:
+        func(source)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes=DEFAULT_SIZES, cases=None, sources=None, min_time=0.1, log=None):
+    """
+    Runs benchmarks
+    :param sizes: numbers of items in sources
+    :param cases: names of cases to run, all by default
+    :param sources: names of sources to run, all by default
+    :param min_time: minimal duration of one measurement in seconds
+    :param log: function which takes result dict when it is ready
+    :return: list of result dicts
+    :rtype: list
+    """
+    results = []
+    for size in sizes:
+        for source_name, make_source in _sources(size).items():
+            if sources and source_name not in sources:
+                continue
+            for name, func, baseline in _cases(size):
+                if cases and name not in cases:
+                    continue
+                anlinq_ops = _ops_per_second(func, make_source, min_time)
+                baseline_ops = _ops_per_second(baseline, make_source, min_time)
+                result = collections.OrderedDict([
+                    ('case', name),
+                    ('source', source_name),
+                    ('size', size),
+                    ('anlinq_ops', anlinq_ops),
+                    ('baseline_ops', baseline_ops),
+                    ('anlinq_items_per_second', anlinq_ops * size),
+                    ('relative_speed', anlinq_ops / baseline_ops),
+                    ('anlinq_peak_bytes', _peak_memory(func, make_source)),
+                    ('baseline_peak_bytes', _peak_memory(baseline, make_source)),
+                ])
+                results.append(result)
+                if log is not None:
+                    log(result)
+    return results
+
+
+def _key(result):
+    return result['case'], result['source'], result['size']
+
+
+def _print_result(result, previous=None):
+    line = '%-18s %-10s %9d %14.1f ops/s  %5.2fx baseline  %12d peak bytes' % (
+        result['case'], result['source'], result['size'], result['anlinq_ops'], result['relative_speed'],
+        result['anlinq_peak_bytes'])
+    if previous is not None:
+        line += '  %+6.1f%% vs previous' % ((result['anlinq_ops'] / previous['anlinq_ops'] - 1) * 100)
+    print(line)
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--cases', nargs='+', help='names of cases to run, all by default')
+    parser.add_argument('--sources', nargs='+', choices=['list', 'generator', 'range', 'dict'])
+    parser.add_argument('--min-time', type=float, default=0.1, help='minimal duration of one measurement')
+    parser.add_argument('--output', help='path of JSON file to write results to')
+    parser.add_argument('--compare', help='path of JSON file with previous results')
+    args = parser.parse_args(argv)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as stream:
+            previous = dict((_key(result), result) for result in json.load(stream)['results'])
+
+    results = run(args.sizes, args.cases, args.sources, args.min_time,
+                  lambda result: _print_result(result, previous.get(_key(result))))
+    if args.output:
+        report = {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }
+        with open(args.output, 'w') as stream:
+            json.dump(report, stream, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,38 @@
+import array
+import asyncio
+import collections
+import itertools
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import tempfile
 import unittest
-from anlinq import AnLinq
+from anlinq import AnLinq, AsyncAnLinq, F
+from anlinq import instrumentation
+from anlinq.cache import QueryCache
+from anlinq.sketches import HyperLogLog, KllSketch, Reservoir, SpaceSaving, hash64
+from anlinq.sources import byte_ranges
+from anlinq.views import ObservableList
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+def square(x):
+    return x * x
+
+
+def is_odd(x):
+    return x % 2 == 1
 
 
 class TestAnLinq(unittest.TestCase):
@@ -42,6 +75,55 @@ class TestAnLinq(unittest.TestCase):
         except AnLinq.AnLinqException:
             pass
 
+    def test_getitem_negative(self):
+        self.assertEqual(AnLinq(self.number_array)[-1], 0)
+        self.assertEqual(AnLinq(self.number_array)[-10], 1)
+        self.assertEqual(AnLinq(iter(self.number_array))[-2], 9)
+        self.assertEqual(AnLinq(self.number_array).select(lambda x: x * 2)[-2], 18)
+        self.assertEqual(AnLinq(self.number_array).where(lambda x: x > 4)[1], 6)
+        for index in [-11, 10]:
+            for wrapped in [AnLinq(self.number_array), AnLinq(iter(self.number_array))]:
+                try:
+                    wrapped[index]
+                    self.assertTrue(False, "Must raise AnLinqException before this line")
+                except AnLinq.AnLinqException:
+                    pass
+
+    def test_getitem_slice(self):
+        for source in [self.number_array, tuple(self.number_array), range(10), array.array('i', self.number_array)]:
+            expected = list(source)
+            for slc in [slice(2, 5), slice(None, None, -1), slice(-3, None), slice(1, None, 3), slice(8, 1, -2),
+                        slice(100, None), slice(None, -100)]:
+                self.assertEqual(AnLinq(source)[slc], expected[slc])
+                self.assertEqual(AnLinq(iter(source))[slc], expected[slc])
+                self.assertEqual(len(AnLinq(source)[slc]), len(expected[slc]))
+            self.assertEqual(AnLinq(source)[1:][::2][1:-1], expected[1:][::2][1:-1])
+            self.assertEqual(AnLinq(source)[::-1][2], expected[::-1][2])
+            self.assertEqual(AnLinq(source)[::-1].last(), expected[0])
+            self.assertEqual(AnLinq(source).skip(3).take(4), expected[3:7])
+            self.assertEqual(AnLinq(source).skip(3).take(4)[-1], expected[6])
+
+    def test_sequence_view_is_live(self):
+        items = [1, 2, 3]
+        query = AnLinq(items).skip(1)
+        items.append(4)
+        self.assertEqual(query, [2, 3, 4])
+        self.assertEqual(query.count(), 3)
+
+    def test_static_count(self):
+        calls = []
+
+        def selector(x):
+            calls.append(x)
+            return x
+
+        query = AnLinq(self.number_array).select(selector).skip(2).concat([1, 2]).take(9).order_by(key=selector)
+        self.assertEqual(query.count(), 9)
+        self.assertEqual(len(query[1:4]), 3)
+        self.assertEqual(calls, [])
+        self.assertEqual(AnLinq(self.number_array).where(lambda x: x > 4).count(), 5)
+        self.assertEqual(AnLinq(self.number_array).concat(iter([1, 2])).count(), 12)
+
     def test_len(self):
         self.assertEqual(len(AnLinq(self.number_array)), len(self.number_array))
         self.assertEqual(len(AnLinq(self.object_array)), len(self.object_array))
@@ -121,6 +203,11 @@ class TestAnLinq(unittest.TestCase):
         except AnLinq.AnLinqException:
             pass
 
+    def test_last_sequence(self):
+        self.assertEqual(AnLinq(range(10 ** 9)).last(), 10 ** 9 - 1)
+        self.assertEqual(AnLinq(range(10 ** 9)).last(lambda x: x % 7 == 0), 999999994)
+        self.assertEqual(AnLinq(iter(self.number_array)).last(lambda x: x > 3), 9)
+
     def test_last_or_none(self):
         self.assertEqual(AnLinq(self.number_array).last_or_none(), self.number_array[-1])
         self.assertEqual(AnLinq(self.number_array).last_or_none(lambda x: x > 3), 9)
@@ -185,6 +272,32 @@ class TestAnLinq(unittest.TestCase):
         self.assertDictEqual(AnLinq(self.number_array).group_by(lambda x: 'even' if x % 2 == 0 else 'odd'),
                              {'even': [2, 4, 6, 8, 0], 'odd': [1, 3, 5, 7, 9]})
 
+    def test_aggregate_by(self):
+        parity = lambda x: 'even' if x % 2 == 0 else 'odd'
+        self.assertEqual(AnLinq(self.number_array).aggregate_by(parity, 'count'), {'even': 5, 'odd': 5})
+        self.assertEqual(AnLinq(self.number_array).aggregate_by(parity, 'sum'), {'even': 20, 'odd': 25})
+        self.assertEqual(AnLinq(self.number_array).aggregate_by(parity, 'min'), {'even': 0, 'odd': 1})
+        self.assertEqual(AnLinq(self.number_array).aggregate_by(parity, 'max', lambda x: -x), {'even': 0, 'odd': -1})
+        self.assertEqual(AnLinq(self.number_array).aggregate_by(parity, 'average'), {'even': 4.0, 'odd': 5.0})
+        self.assertEqual(AnLinq(self.word_array).aggregate_by(len, lambda prev, this: prev + this[0], None, ''),
+                         {3: 'R', 4: 'B', 5: 'G', 6: 'OYIV'})
+        self.assertEqual(AnLinq([]).aggregate_by(parity, 'sum'), {})
+        try:
+            AnLinq(self.number_array).aggregate_by(parity, 'median')
+            self.assertTrue(False, "Must raise AnLinqException before this line")
+        except AnLinq.AnLinqException:
+            pass
+
+    def test_group_adjacent(self):
+        groups = AnLinq([1, 1, 2, 3, 3, 3, 1]).group_adjacent()
+        self.assertEqual(groups.select(lambda g: (g[0], g[1].to_list())),
+                         [(1, [1, 1]), (2, [2]), (3, [3, 3, 3]), (1, [1])])
+        self.assertEqual(AnLinq(self.word_array).order_by(key=len).group_adjacent(len, lambda x: x[0])
+                         .select(lambda g: (g[0], g[1].to_list())),
+                         [(3, ['R']), (4, ['B']), (5, ['G']), (6, ['O', 'Y', 'I', 'V'])])
+        self.assertEqual(AnLinq(itertools.count()).group_adjacent(lambda x: x // 3).select(lambda g: g[1].sum())
+                         .take(3), [3, 12, 21])
+
     def test_map(self):
         self.assertEqual(AnLinq(self.number_array).map(lambda x: '#' + repr(x)),
                          ['#1', '#2', '#3', '#4', '#5', '#6', '#7', '#8', '#9', '#0'])
@@ -193,6 +306,47 @@ class TestAnLinq(unittest.TestCase):
         self.assertEqual(AnLinq(self.number_array).reduce(lambda prev, this, index: prev + this, 0), 45)
         self.assertEqual(AnLinq(self.number_array).reduce(lambda prev, this, index: prev + this, -1), 44)
 
+    def test_sum_min_max(self):
+        self.assertEqual(AnLinq(self.number_array).sum(), 45)
+        self.assertEqual(AnLinq([]).sum(), 0)
+        self.assertEqual(AnLinq(self.object_array).sum(lambda x: len(x['hobbies'])), 6)
+        self.assertEqual(AnLinq(self.number_array).min(), 0)
+        self.assertEqual(AnLinq(self.number_array).max(), 9)
+        self.assertEqual(AnLinq(self.word_array).max(len), 6)
+        self.assertEqual(AnLinq(self.object_array).min_by(lambda x: x['born'])['name'], 'Morticia')
+        self.assertEqual(AnLinq(self.word_array).max_by(len), 'ORANGE')
+        self.assertEqual(AnLinq(self.word_array).min_by(len), 'RED')
+        for call in [lambda: AnLinq([]).min(), lambda: AnLinq([]).max(), lambda: AnLinq([]).min_by(len),
+                     lambda: AnLinq([]).max_by(len), lambda: AnLinq([]).average(), lambda: AnLinq([]).variance(),
+                     lambda: AnLinq([1]).variance(sample=True), lambda: AnLinq([]).percentile(50),
+                     lambda: AnLinq([1]).percentile(101)]:
+            try:
+                call()
+                self.assertTrue(False, "Must raise AnLinqException before this line")
+            except AnLinq.AnLinqException:
+                pass
+
+    def test_average_variance_percentile(self):
+        self.assertEqual(AnLinq(self.number_array).average(), 4.5)
+        self.assertEqual(AnLinq(iter(self.number_array)).average(lambda x: x * 2), 9.0)
+        self.assertEqual(AnLinq([2, 4, 4, 4, 5, 5, 7, 9]).variance(), 4.0)
+        self.assertAlmostEqual(AnLinq([2, 4, 4, 4, 5, 5, 7, 9]).variance(sample=True), 32.0 / 7)
+        self.assertEqual(AnLinq(self.number_array).percentile(50), 4.5)
+        self.assertEqual(AnLinq(self.number_array).percentile(0), 0)
+        self.assertEqual(AnLinq(self.number_array).percentile(100), 9)
+        self.assertEqual(AnLinq([1, 2, 3, 4, 5]).percentile(25), 2)
+        self.assertEqual(AnLinq([5]).percentile(90), 5)
+
+    def test_stats(self):
+        stats = AnLinq(self.number_array).stats()
+        self.assertEqual((stats.count, stats.sum, stats.min, stats.max, stats.mean, stats.variance),
+                         (10, 45, 0, 9, 4.5, 8.25))
+        self.assertEqual(AnLinq([]).stats(), AnLinq.Stats(0, 0, None, None, None, None))
+        self.assertEqual(AnLinq(self.word_array).stats(len).max, 6)
+        self.assertEqual(AnLinq([0.1] * 10).stats().sum, 1.0)
+        self.assertEqual(AnLinq([0.1] * 10).sum(), sum([0.1] * 10))
+        self.assertAlmostEqual(AnLinq([1e9 + x for x in range(5)]).stats().variance, 2.0)
+
     def test_order_by(self):
         self.assertEqual(AnLinq(self.number_array_duplicates_distinct).order_by(), [1, 2, 3, 5])
         self.assertEqual(AnLinq(self.number_array_duplicates_distinct).order_by(descending=True), [5, 3, 2, 1])
@@ -220,6 +374,1100 @@ class TestAnLinq(unittest.TestCase):
         ordered_pokemons = ['Pikachu', 'Pikachu', 'Sandshrew', 'Vulpix', 'Pidgeotto', 'Raticate', 'Pidgeot' ]
         self.assertEqual(AnLinq(pokemons).order_by(pokemon_comparer), ordered_pokemons)
 
+    def test_order_by_key(self):
+        self.assertEqual(AnLinq(self.word_array).order_by(key=len), ['RED', 'BLUE', 'GREEN', 'ORANGE', 'YELLOW',
+                                                                     'INDIGO', 'VIOLET'])
+        self.assertEqual(AnLinq(self.word_array).order_by_descending(len), ['ORANGE', 'YELLOW', 'INDIGO', 'VIOLET',
+                                                                            'GREEN', 'BLUE', 'RED'])
+        self.assertEqual(AnLinq(self.number_array).order_by_descending(), [9, 8, 7, 6, 5, 4, 3, 2, 1, 0])
+        try:
+            AnLinq(self.number_array).order_by(lambda x, y: x - y, key=len)
+            self.assertTrue(False, "Must raise AnLinqException before this line")
+        except AnLinq.AnLinqException:
+            pass
+
+    def test_wrapper_has_no_instance_dict(self):
+        self.assertFalse(hasattr(AnLinq([1]).where(is_odd), '__dict__'))
+        self.assertEqual(AnLinq(list(range(10))).order_by(descending=True).take(3).to_list(), [9, 8, 7])
+        self.assertEqual(AnLinq(tuple(range(10)))[2:][::2].take(2).to_list(), [2, 4])
+
+    def test_then_by_mixed_directions(self):
+        items = [(i % 3, i % 5, i) for i in range(200)]
+        expected = sorted(sorted(items, key=lambda x: x[1], reverse=True), key=lambda x: x[0])
+        query = AnLinq(items).order_by(key=lambda x: x[0]).then_by_descending(lambda x: x[1])
+        self.assertEqual(query.to_list(), expected)
+        self.assertEqual(query.take(7).to_list(), expected[:7])
+
+    def test_take_while_skip_while(self):
+        self.assertEqual(AnLinq(self.number_array).take_while(F < 4).to_list(), [1, 2, 3])
+        self.assertEqual(AnLinq(self.number_array).skip_while(F < 8).to_list(), [8, 9, 0])
+        self.assertEqual(AnLinq(iter(self.number_array)).take_while(lambda x: x > 5).to_list(), [])
+
+    def test_chunk_and_window(self):
+        self.assertEqual(AnLinq(range(7)).chunk(3).to_list(), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(AnLinq(iter(range(4))).batch(2).to_list(), [[0, 1], [2, 3]])
+        self.assertEqual(AnLinq(range(7)).chunk(3).count(), 3)
+        self.assertEqual(AnLinq(range(5)).window(3).to_list(), [(0, 1, 2), (1, 2, 3), (2, 3, 4)])
+        self.assertEqual(AnLinq(range(7)).window(3, 2).to_list(), [(0, 1, 2), (2, 3, 4), (4, 5, 6)])
+        self.assertEqual(AnLinq(range(8)).window(3, 3).to_list(), [(0, 1, 2), (3, 4, 5)])
+        self.assertEqual(AnLinq(range(10)).window(2, 4).to_list(), [(0, 1), (4, 5), (8, 9)])
+        self.assertEqual([AnLinq(range(n)).window(3, 2).count() for n in range(7)],
+                         [len(list(AnLinq(list(range(n))).window(3, 2))) for n in range(7)])
+        self.assertEqual(AnLinq([1, 2]).window(3).to_list(), [])
+        with self.assertRaises(AnLinq.AnLinqException):
+            AnLinq([1]).chunk(0)
+
+    def test_pairwise_scan_zip(self):
+        self.assertEqual(AnLinq([1, 4, 9]).pairwise().select(lambda p: p[1] - p[0]).to_list(), [3, 5])
+        self.assertEqual(AnLinq([1]).pairwise().count(), 0)
+        self.assertEqual(AnLinq([1, 2, 3]).scan(lambda prev, x, i: prev + x, 0).to_list(), [1, 3, 6])
+        self.assertEqual(AnLinq(self.number_array).scan(lambda prev, x, i: max(prev, x), 0).last(),
+                         AnLinq(self.number_array).aggregate(lambda prev, x, i: max(prev, x), 0))
+        self.assertEqual(AnLinq([1, 2, 3]).zip('ab').to_list(), [(1, 'a'), (2, 'b')])
+        self.assertEqual(AnLinq([1, 2]).zip(iter([10, 20, 30]), lambda a, b: a + b).to_list(), [11, 22])
+        self.assertEqual(AnLinq([1, 2, 3]).zip([5, 6]).count(), 2)
+
+    def test_select_batch_where_batch(self):
+        sizes = []
+
+        def square(batch):
+            sizes.append(len(batch))
+            return [x * x for x in batch]
+
+        self.assertEqual(AnLinq(range(7)).select_batch(square, 3).to_list(), [0, 1, 4, 9, 16, 25, 36])
+        self.assertEqual(sizes, [3, 3, 1])
+        self.assertEqual(len(AnLinq(range(7)).select_batch(square, 3)), 7)
+        self.assertEqual(AnLinq(range(10)).where_batch(lambda batch: (x % 4 == 0 for x in batch), 4).to_list(),
+                         [0, 4, 8])
+        self.assertEqual(AnLinq(itertools.count()).select_batch(square, 2).take(3).to_list(), [0, 1, 4])
+        self.assertEqual(AnLinq(range(6)).as_parallel(2, backend='thread', chunk_size=2).where_batch(
+            lambda batch: [x > 2 for x in batch], 5).to_list(), [3, 4, 5])
+        self.assertRaises(AnLinq.AnLinqException, AnLinq(range(3)).select_batch(lambda batch: [], 2).to_list)
+        self.assertRaises(AnLinq.AnLinqException, AnLinq(range(3)).where_batch, square, 0)
+
+    def test_rolling(self):
+        values = [5, 3, 4, 1, 6, 2, 8]
+        windows = AnLinq(values).window(3)
+        self.assertEqual(AnLinq(values).rolling(3).to_list(), windows.select(sum).to_list())
+        self.assertEqual(AnLinq(values).rolling(3, 'min').to_list(), windows.select(min).to_list())
+        self.assertEqual(AnLinq(values).rolling(3, 'max').to_list(), windows.select(max).to_list())
+        self.assertEqual(AnLinq(values).rolling(2, 'average').first(), 4.0)
+        self.assertEqual(AnLinq(self.object_array).rolling(2, 'max', F['born']).count(), len(self.object_array) - 1)
+        with self.assertRaises(AnLinq.AnLinqException):
+            AnLinq(values).rolling(2, 'median')
+
+    def test_order_by_max_memory(self):
+        items = [(i * 7919 % 1000, i) for i in range(5000)]
+        query = AnLinq(iter(items)).order_by(key=lambda x: x[0], max_memory=8000)
+        self.assertEqual(query.to_list(), sorted(items, key=lambda x: x[0]))
+        self.assertEqual(AnLinq(items).order_by_descending(lambda x: x[0] % 10, max_memory=8000).then_by().to_list(),
+                         sorted(sorted(items), key=lambda x: x[0] % 10, reverse=True))
+        self.assertEqual(AnLinq(items).order_by(max_memory=1 << 30).take(3).to_list(), sorted(items)[:3])
+        self.assertTrue('max_memory=8000' in query.explain())
+
+    def test_distinct_max_memory(self):
+        items = [i * 7919 % 3000 for i in range(10000)]
+        expected = AnLinq(items).distinct().to_list()
+        self.assertEqual(AnLinq(items).distinct(max_memory=2000).to_list(), expected)
+        self.assertEqual(AnLinq(iter(items)).distinct(lambda x: x % 700, max_memory=500).to_list(),
+                         AnLinq(items).distinct(lambda x: x % 700).to_list())
+        self.assertEqual(AnLinq(items).distinct(max_memory=2000).take(5).to_list(), expected[:5])
+
+    def test_then_by(self):
+        self.assertEqual(AnLinq(self.word_array).order_by(key=len).then_by(), ['RED', 'BLUE', 'GREEN', 'INDIGO',
+                                                                               'ORANGE', 'VIOLET', 'YELLOW'])
+        self.assertEqual(AnLinq(self.word_array).order_by(key=len).then_by_descending(),
+                         ['RED', 'BLUE', 'GREEN', 'YELLOW', 'VIOLET', 'ORANGE', 'INDIGO'])
+        self.assertEqual(AnLinq(self.word_array).order_by_descending(len).then_by(lambda x: x[-1]),
+                         ['ORANGE', 'INDIGO', 'VIOLET', 'YELLOW', 'GREEN', 'BLUE', 'RED'])
+        self.assertEqual(AnLinq(self.object_array).order_by(key=lambda x: len(x['hobbies']))
+                         .then_by_descending(lambda x: x['born']).select(lambda x: x['name']),
+                         ['Julia', 'Masha', 'Morticia'])
+        try:
+            AnLinq(self.number_array).then_by()
+            self.assertTrue(False, "Must raise AnLinqException before this line")
+        except AnLinq.AnLinqException:
+            pass
+        try:
+            AnLinq(self.number_array).order_by().take(3).then_by()
+            self.assertTrue(False, "Must raise AnLinqException before this line")
+        except AnLinq.AnLinqException:
+            pass
+
+    def test_optimizer(self):
+        calls = []
+
+        def selector(x):
+            calls.append(x)
+            return x
+
+        query = AnLinq(self.number_array).where(lambda x: x > 1).where(is_odd).select(selector)
+        self.assertEqual(query.count(), 4)
+        self.assertEqual(calls, [])
+        self.assertEqual(query, [3, 5, 7, 9])
+
+        streamed = AnLinq(itertools.count()).skip(2).skip(-1).skip(3).take(10).take(3)
+        self.assertEqual(streamed, [5, 6, 7])
+        self.assertEqual(AnLinq(self.number_array_duplicates).distinct().union([7, 1]), [3, 2, 1, 5, 7])
+        self.assertEqual(AnLinq(self.word_array).distinct(len).distinct(len), ['RED', 'ORANGE', 'GREEN', 'BLUE'])
+        self.assertEqual(AnLinq(self.word_array).distinct(len).distinct(), ['RED', 'ORANGE', 'GREEN', 'BLUE'])
+        self.assertEqual(AnLinq(self.word_array).distinct().union(['red'], len), ['RED', 'ORANGE', 'GREEN', 'BLUE'])
+        self.assertEqual(AnLinq(iter(self.number_array)).order_by().skip(2).take(3), [2, 3, 4])
+        self.assertEqual(AnLinq(iter(self.number_array)).order_by().take(5).skip(1).take(3), [1, 2, 3])
+
+    def test_explain(self):
+        query = AnLinq(iter(self.number_array)).where(is_odd).where(lambda x: x > 2).select(square) \
+            .distinct().union([1]).order_by_descending().skip(1).skip(1).take(2)
+        self.assertEqual(query.explain().split('\n'), [
+            'Original plan:',
+            '  source: list_iterator',
+            '  where(is_odd)',
+            '  where(<lambda>)',
+            '  select(square)',
+            '  distinct(None)',
+            '  union(list[1], None)',
+            '  order_by(item desc)',
+            '  skip(1)',
+            '  skip(1)',
+            '  take(2)',
+            'Optimized plan:',
+            '  source: list_iterator',
+            '  where(is_odd, <lambda>)',
+            '  select(square)',
+            '  union(list[1], None)',
+            '  order_by(item desc, top=4)',
+            '  skip(2)',
+            '  take(2)'])
+        self.assertEqual(query, [25, 9])
+        self.assertEqual(AnLinq([1, 2]).explain(),
+                         'Original plan:\n  source: list[2]\nOptimized plan:\n  source: list[2]')
+
+    def test_order_by_top(self):
+        words = AnLinq(self.word_array)
+        for query in [words.order_by(key=len), words.order_by_descending(len),
+                      words.order_by(key=len).then_by_descending(), words.order_by_descending(len).then_by(),
+                      words.order_by(key=len).then_by(lambda x: x[-1])]:
+            full = query.to_list()
+            for number in range(0, 9):
+                self.assertEqual(query.take(number), full[:number])
+            self.assertEqual(query.first(), full[0])
+            self.assertEqual(query.take(5).take(2), full[:2])
+            self.assertEqual(query.take(2).take(5), full[:2])
+            self.assertEqual(query.take(5).skip(1), full[1:5])
+        self.assertEqual(AnLinq(itertools.count()).where(lambda x: x < 100).take(100).order_by_descending().take(2),
+                         [99, 98])
+        self.assertEqual(AnLinq(self.number_array).order_by(lambda x, y: y - x).take(3), [9, 8, 7])
+        try:
+            AnLinq([]).order_by().first()
+            self.assertTrue(False, "Must raise AnLinqException before this line")
+        except AnLinq.AnLinqException:
+            pass
+
+    def test_select_many(self):
+        self.assertEqual(AnLinq(self.object_array).select_many(lambda x: x['hobbies']),
+                         ['skating', 'reading', 'dancing', 'burial', 'knitting', 'haunting'])
+        self.assertEqual(AnLinq([]).select_many(lambda x: x), [])
+
+    def test_take(self):
+        self.assertEqual(AnLinq(self.number_array).take(3), [1, 2, 3])
+        self.assertEqual(AnLinq(self.number_array).take(0), [])
+        self.assertEqual(AnLinq(self.number_array).take(-1), [])
+        self.assertEqual(AnLinq(self.number_array).take(100), self.number_array)
+
+    def test_lazy_pipeline(self):
+        calls = []
+
+        def predicate(x):
+            calls.append(x)
+            return x % 2 == 0
+
+        query = AnLinq(self.number_array).where(predicate).select(lambda x: x * 10)
+        self.assertEqual(calls, [], "Pipeline must not run before consumption")
+        self.assertEqual(query.take(2), [20, 40])
+        self.assertEqual(calls, [1, 2, 3, 4])
+
+        del calls[:]
+        self.assertEqual(query.first(), 20)
+        self.assertEqual(calls, [1, 2])
+
+        del calls[:]
+        self.assertTrue(query.any())
+        self.assertEqual(calls, [1, 2])
+
+        infinite = itertools.count()
+        self.assertEqual(AnLinq(infinite).where(lambda x: x % 3 == 0).distinct().take(3), [0, 3, 6])
+
+    def test_skip(self):
+        self.assertEqual(AnLinq(self.number_array).skip(7), [8, 9, 0])
+        self.assertEqual(AnLinq(self.number_array).skip(0), self.number_array)
+        self.assertEqual(AnLinq(self.number_array).skip(100), [])
+        self.assertEqual(AnLinq(self.number_array).skip(2).take(2), [3, 4])
+        self.assertEqual(AnLinq('abcde').skip(1).take(2), ['b', 'c'])
+
+        class Unindexed(collections.deque):
+            def __getitem__(self, index):
+                raise AssertionError("deque is indexed in O(n) and must be iterated")
+
+        self.assertEqual(AnLinq(Unindexed(self.number_array)).skip(7).take(2), [8, 9])
+
+    def test_concat(self):
+        self.assertEqual(AnLinq([1, 2]).concat([3, 4]).concat_item(5), [1, 2, 3, 4, 5])
+        self.assertEqual(AnLinq([]).concat([]), [])
+
+    def test_query_arguments_stay_deferred(self):
+        calls = []
+
+        def key(x):
+            calls.append(x)
+            return x
+
+        other = AnLinq([3, 1, 2]).order_by(key=key)
+        queries = [AnLinq([0]).concat(other), AnLinq([1]).except_for(other.select(key)),
+                   AnLinq([1]).join(other, key, key), AnLinq([1]).zip(other)]
+        self.assertEqual(calls, [])
+        self.assertEqual(queries[0].to_list(), [0, 1, 2, 3])
+        self.assertEqual(queries[1].to_list(), [])
+        # one-shot iterators are still buffered, so query may be consumed twice
+        query = AnLinq([0]).concat(iter([1]))
+        self.assertEqual(query.to_list(), [0, 1])
+        self.assertEqual(query.to_list(), [0, 1])
+
+    def test_small_query(self):
+        calls = []
+
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        # small lists run plans directly, large ones through optimized plan, with the same results
+        for items in (list(range(10)), tuple(range(10)), list(range(1000))):
+            query = AnLinq(items).where(lambda x: x % 3).select(double).order_by(descending=True).skip(1).take(2)
+            self.assertEqual(query.to_list(), [1994, 1990] if len(items) > 10 else [14, 10])
+            self.assertEqual(list(query), query.to_list())
+            self.assertEqual(query.count(), 2)
+        del calls[:]
+        self.assertEqual(AnLinq([1, 2, 3, 4]).select(double).take(2).to_list(), [2, 4])
+        self.assertEqual(calls, [1, 2])
+        items = [1, 2]
+        query = AnLinq(items).where(lambda x: x > 1)
+        items.append(3)
+        self.assertEqual(query.to_list(), [2, 3])
+
+    def test_reusable_query(self):
+        query = AnLinq(self.number_array).skip(1).take(5).concat([10]).concat_item(11)
+        self.assertEqual(query.count(), 7)
+        self.assertEqual(query.count(), 7)
+        self.assertEqual(repr(query), repr([2, 3, 4, 5, 6, 10, 11]))
+        self.assertEqual(query, [2, 3, 4, 5, 6, 10, 11])
+        self.assertEqual(query.to_list(), [2, 3, 4, 5, 6, 10, 11])
+        self.assertEqual(query, query)
+
+    def test_memoize(self):
+        calls = []
+
+        def expensive(x):
+            calls.append(x)
+            return x * 2
+
+        shared = AnLinq(self.number_array).select(expensive).memoize()
+        self.assertEqual(calls, [])
+        self.assertEqual(shared.first(), 2)
+        self.assertEqual(calls, [1])
+        self.assertEqual(shared.where(lambda x: x > 10).to_list(), [12, 14, 16, 18])
+        self.assertEqual(shared.take(3), [2, 4, 6])
+        self.assertEqual(shared.count(), 10)
+        self.assertEqual(calls, self.number_array)
+
+        one_shot = AnLinq(x for x in range(3)).memoize()
+        self.assertEqual(one_shot.to_list(), [0, 1, 2])
+        self.assertEqual(one_shot.to_list(), [0, 1, 2])
+
+        first, second = iter(shared), iter(shared)
+        self.assertEqual([next(first), next(second), next(first)], [2, 2, 4])
+
+    def test_except_for(self):
+        self.assertEqual(AnLinq(self.number_array).except_for([1, 3, 5, 7, 9]), [2, 4, 6, 8, 0])
+        self.assertEqual(AnLinq(self.number_array_duplicates).except_for([1]), [3, 2, 3, 2, 5])
+        self.assertEqual(AnLinq(self.number_array).except_for(x for x in range(5, 10)), [1, 2, 3, 4, 0])
+        self.assertEqual(AnLinq(self.word_array).except_for(['red', 'blue'], lambda x: x.lower()),
+                         ['ORANGE', 'YELLOW', 'GREEN', 'INDIGO', 'VIOLET'])
+        self.assertEqual(AnLinq([[1], [2], [3]]).except_for([[2]]), [[1], [3]])
+        self.assertEqual(AnLinq([[1], 2, 3]).except_for([2]), [[1], 3])
+
+        query = AnLinq(self.number_array).except_for(x for x in range(1, 10))
+        self.assertEqual(query, [0])
+        self.assertEqual(query, [0])
+
+    def test_intersect(self):
+        self.assertEqual(AnLinq(self.number_array).intersect([1, 3, 5, 42]), [1, 3, 5])
+        self.assertEqual(AnLinq(self.number_array).intersect(x for x in range(8, 100)), [8, 9])
+        self.assertEqual(AnLinq(self.object_array).intersect([1992, 1978], lambda x: x if isinstance(x, int)
+                                                            else x['born']).select(lambda x: x['name']),
+                         ['Julia', 'Morticia'])
+        self.assertEqual(AnLinq([[1], [2], [3]]).intersect([[2]]), [[2]])
+        self.assertEqual(AnLinq([[1], 2, 3]).intersect([2, [1]]), [[1], 2])
+        self.assertEqual(AnLinq([[1], 2, 3]).intersect([2]), [2])
+
+    def test_union(self):
+        self.assertEqual(AnLinq(self.number_array_duplicates).union([5, 6, 1, 7]), [3, 2, 1, 5, 6, 7])
+        self.assertEqual(AnLinq(['a', 'B']).union(['b', 'C'], lambda x: x.lower()), ['a', 'B', 'C'])
+
+    def test_symmetric_difference(self):
+        self.assertEqual(AnLinq([1, 2, 3, 3]).symmetric_difference([3, 4, 4, 5]), [1, 2, 4, 5])
+        self.assertEqual(AnLinq(['a', 'B']).symmetric_difference(['b', 'C'], lambda x: x.lower()), ['a', 'C'])
+        self.assertEqual(AnLinq([[1], [2]]).symmetric_difference([[2], [3]]), [[1], [3]])
+
+    def test_to_lookup(self):
+        lookup = AnLinq(self.word_array).to_lookup(len, lambda x: x.lower())
+        self.assertEqual(lookup[6], ['orange', 'yellow', 'indigo', 'violet'])
+        self.assertEqual(lookup[3], ['red'])
+        self.assertEqual(lookup[42], [])
+        self.assertFalse(42 in lookup)
+        self.assertEqual(sorted(lookup.keys()), [3, 4, 5, 6])
+
+    def test_join(self):
+        people = AnLinq(self.object_array)
+        hobbies = [('reading', 'books'), ('knitting', 'wool'), ('reading', 'glasses'), ('diving', 'water')]
+        joined = people.select_many(lambda x: [(x['name'], h) for h in x['hobbies']]) \
+            .join(hobbies, lambda x: x[1], lambda x: x[0], lambda o, i: (o[0], i[1]))
+        self.assertEqual(joined, [('Masha', 'books'), ('Masha', 'glasses'), ('Morticia', 'wool')])
+        self.assertEqual(AnLinq([1, 2, 3]).join([2, 3, 3, 4], lambda x: x, lambda x: x), [(2, 2), (3, 3), (3, 3)])
+        # hash table is built on the smaller side, results follow the bigger one
+        self.assertEqual(AnLinq([3, 2]).join([1, 2, 3, 4], lambda x: x, lambda x: x), [(2, 2), (3, 3)])
+        self.assertEqual(AnLinq([1]).join([], lambda x: x, lambda x: x), [])
+
+    def test_left_join(self):
+        self.assertEqual(AnLinq([1, 2, 3]).left_join(['1a', '3a', '3b'], lambda x: x, lambda x: int(x[0])),
+                         [(1, '1a'), (2, None), (3, '3a'), (3, '3b')])
+        self.assertEqual(AnLinq([1, 2]).left_join([], lambda x: x, lambda x: x, lambda o, i: o * 10 + i, 0),
+                         [10, 20])
+
+    def test_group_join(self):
+        self.assertEqual(AnLinq([1, 2, 3]).group_join(['1a', '3a', '3b'], lambda x: x, lambda x: int(x[0]),
+                                                      lambda o, i: (o, i.to_list())),
+                         [(1, ['1a']), (2, []), (3, ['3a', '3b'])])
+
+    def test_semi_anti_join(self):
+        born = [1978, 1992]
+        self.assertEqual(AnLinq(self.object_array).semi_join(born, lambda x: x['born'], lambda x: x)
+                         .select(lambda x: x['name']), ['Julia', 'Morticia'])
+        self.assertEqual(AnLinq(self.object_array).anti_join(born, lambda x: x['born'], lambda x: x)
+                         .select(lambda x: x['name']), ['Masha'])
+
+    def test_as_parallel(self):
+        numbers = list(range(1000))
+        expected = [x * x for x in numbers if x % 2 == 1]
+        self.assertEqual(AnLinq(numbers).as_parallel(2, 'process', 64).where(is_odd).select(square), expected)
+        threaded = AnLinq(numbers).as_parallel(4, 'thread', 10).where(lambda x: x % 2 == 1).select(lambda x: x * x)
+        self.assertEqual(threaded, expected)
+        self.assertEqual(threaded.count(), len(expected))
+        self.assertEqual(sorted(threaded.as_unordered()), expected)
+        self.assertEqual(AnLinq(self.object_array).as_parallel(backend='thread', chunk_size=1)
+                         .select_many(lambda x: x['hobbies']).take(3), ['skating', 'reading', 'dancing'])
+        self.assertEqual(AnLinq(itertools.count()).as_parallel(backend='thread', chunk_size=10)
+                         .select(lambda x: x * 2).first(), 0)
+        self.assertEqual(AnLinq([]).as_parallel(backend='thread').select(square), [])
+        for call in [lambda: AnLinq(numbers).as_parallel(backend='fiber'),
+                     lambda: AnLinq(numbers).as_parallel(chunk_size=0),
+                     lambda: AnLinq(numbers).as_unordered()]:
+            try:
+                call()
+                self.assertTrue(False, "Must raise AnLinqException before this line")
+            except AnLinq.AnLinqException:
+                pass
+
+    def test_parallel_aggregates(self):
+        numbers = list(range(1000))
+        query = AnLinq(numbers).as_parallel(3, 'thread', 7).where(lambda x: x % 3 == 0)
+        self.assertEqual(query.count(), 334)
+        self.assertEqual(query.aggregate(lambda prev, this, index: prev + this, 0, lambda a, b: a + b),
+                         sum(range(0, 1000, 3)))
+        self.assertEqual(query.aggregate(lambda prev, this, index: index, 0), 333)
+        # seed starts every partition once and is not added again when partitions are merged
+        self.assertEqual(AnLinq(range(10)).as_parallel(2, 'thread', 5).aggregate(
+            lambda prev, this, index: prev + this, 10, lambda a, b: a + b), 45 + 2 * 10)
+        self.assertEqual(AnLinq(range(1, 8)).as_parallel(2, 'thread', 3).aggregate(
+            lambda prev, this, index: prev * this, 1, lambda a, b: a * b), 5040)
+        self.assertEqual(AnLinq([]).as_parallel(2, 'thread').aggregate(
+            lambda prev, this, index: prev + this, 10, lambda a, b: a + b), 10)
+        self.assertEqual(query.select(lambda x: x % 4).distinct(), [0, 3, 2, 1])
+        self.assertEqual(AnLinq(self.number_array_duplicates).as_parallel(2, 'process', 2).distinct(),
+                         self.number_array_duplicates_distinct)
+        groups = AnLinq(numbers).as_parallel(2, 'process', 100).group_by(is_odd)
+        self.assertEqual(groups[True], list(range(1, 1000, 2)))
+        self.assertEqual(groups[False], list(range(0, 1000, 2)))
+
+
+async def async_range(number):
+    for i in range(number):
+        await asyncio.sleep(0)
+        yield i
+
+
+class TestAsyncAnLinq(unittest.TestCase):
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_operators(self):
+        async def is_even(x):
+            await asyncio.sleep(0)
+            return x % 2 == 0
+
+        query = AnLinq.from_async(async_range(10)).where(is_even).select(lambda x: x * 10).skip(1).take(3)
+        self.assertEqual(self.run_async(query.to_list()), [20, 40, 60])
+        self.assertEqual(self.run_async(AsyncAnLinq([[1, 2], [3]]).select_many(lambda x: x).concat_item(4).to_list()),
+                         [1, 2, 3, 4])
+        self.assertEqual(self.run_async(AsyncAnLinq([3, 1, 3, 2, 1]).distinct().concat(async_range(2)).to_list()),
+                         [3, 1, 2, 0, 1])
+
+    def test_replay(self):
+        query = AsyncAnLinq(range(5)).where(lambda x: x > 1)
+        self.assertEqual(self.run_async(query.count()), 3)
+        self.assertEqual(self.run_async(query.to_list()), [2, 3, 4])
+
+    def test_terminals(self):
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(10)).first(lambda x: x > 3)), 4)
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(10)).first_or_none(lambda x: x > 30)), None)
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(10)).last()), 9)
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(0)).last_or_none()), None)
+        self.assertTrue(self.run_async(AsyncAnLinq(async_range(10)).any(lambda x: x == 9)))
+        self.assertFalse(self.run_async(AsyncAnLinq(async_range(10)).all(lambda x: x < 9)))
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(10)).aggregate(lambda p, t, i: p + t, 0)), 45)
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(4)).to_dictionary(lambda x: x * 2)),
+                         {0: 0, 2: 1, 4: 2, 6: 3})
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(4)).group_by(lambda x: x % 2)), {0: [0, 2], 1: [1, 3]})
+        try:
+            self.run_async(AsyncAnLinq([]).first())
+            self.assertTrue(False, "Must raise AnLinqException before this line")
+        except AnLinq.AnLinqException:
+            pass
+
+    def test_select_concurrent(self):
+        state = {'in_flight': 0, 'max_in_flight': 0}
+
+        async def fetch(x):
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            await asyncio.sleep(0.001 * (5 - x % 5))
+            state['in_flight'] -= 1
+            return x * 2
+
+        result = self.run_async(AsyncAnLinq(async_range(20)).select_concurrent(fetch, 4).to_list())
+        self.assertEqual(result, [x * 2 for x in range(20)])
+        self.assertEqual(state['max_in_flight'], 4)
+        self.assertEqual(self.run_async(AsyncAnLinq(range(100)).select_concurrent(fetch, 3).first()), 0)
+
+    def test_ordering_and_totals(self):
+        async def negate(x):
+            await asyncio.sleep(0)
+            return -x
+
+        words = ['pear', 'fig', 'apple', 'kiwi']
+        self.assertEqual(self.run_async(AsyncAnLinq(words).order_by().to_list()), ['apple', 'fig', 'kiwi', 'pear'])
+        self.assertEqual(self.run_async(AsyncAnLinq(words).order_by(len).take(3).to_list()), ['fig', 'pear', 'kiwi'])
+        self.assertEqual(self.run_async(AsyncAnLinq(words).order_by_descending(len).to_list()),
+                         ['apple', 'pear', 'kiwi', 'fig'])
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(5)).order_by(negate).to_list()), [4, 3, 2, 1, 0])
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(10)).sum()), 45)
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(10)).sum(negate)), -45)
+        self.assertEqual(self.run_async(AsyncAnLinq([]).sum()), 0)
+        self.assertEqual(self.run_async(AsyncAnLinq(words).min(len)), 3)
+        self.assertEqual(self.run_async(AsyncAnLinq(words).max()), 'pear')
+        self.assertEqual(self.run_async(AsyncAnLinq(async_range(10)).aggregate_by(lambda x: x % 2, 'sum')),
+                         {0: 20, 1: 25})
+        for call in [AsyncAnLinq([]).min(), AsyncAnLinq([]).max(len)]:
+            try:
+                self.run_async(call)
+                self.assertTrue(False, "Must raise AnLinqException before this line")
+            except AnLinq.AnLinqException:
+                pass
+
+
+class Point(object):
+    def __init__(self, x, y, parent=None):
+        self.x = x
+        self.y = y
+        self.parent = parent
+
+
+class TestExpressions(unittest.TestCase):
+    def setUp(self):
+        self.rows = [{'name': 'a', 'price': 5, 'qty': 2}, {'name': 'b', 'price': 15, 'qty': 0},
+                     {'name': 'c', 'price': 25, 'qty': 3}]
+
+    def test_fields(self):
+        self.assertEqual(AnLinq(self.rows).select(F['name']), ['a', 'b', 'c'])
+        points = [Point(1, 2, Point(0, 7)), Point(3, 4, Point(0, 8))]
+        self.assertEqual(AnLinq(points).select(F.x), [1, 3])
+        self.assertEqual(AnLinq(points).select(F.parent.y), [7, 8])
+        self.assertEqual(AnLinq([[1, [2, 3]], [4, [5, 6]]]).select(F[1][0]), [2, 5])
+        self.assertEqual(AnLinq([3, 1, 2]).select(F), [3, 1, 2])
+        self.assertEqual((F.parent.y).compile().__class__.__name__, 'attrgetter')
+
+    def test_untrusted_attribute_names(self):
+        printed = []
+        field = 'x if printed.append(1) else 0'
+        item = Point(1, 2)
+        setattr(item, field, 0)
+        self.assertEqual(AnLinq([item]).where(getattr(F, field) == 0).count(), 1)
+        self.assertEqual(AnLinq([item]).where((F.attr(field) + 1) * 2 == 2).count(), 1)
+        self.assertEqual(printed, [])
+        self.assertEqual(repr(getattr(F, field) == 0), "(F.attr('x if printed.append(1) else 0') == 0)")
+
+    def test_reserved_attribute_names(self):
+        item = Point(1, 2)
+        item.op, item.args = 'add', (1, 2)
+        self.assertEqual(AnLinq([item]).select(F.attr('op')).to_list(), ['add'])
+        self.assertEqual(AnLinq([item]).where(F.attr('args') == (1, 2)).count(), 1)
+        self.assertEqual(repr(F.attr('args')[0]), "F.attr('args')[0]")
+        self.assertEqual(F['name'].compile().__class__.__name__, 'itemgetter')
+
+    def test_predicates(self):
+        self.assertEqual(AnLinq(self.rows).where(F['price'] > 10).select(F['name']), ['b', 'c'])
+        self.assertEqual(AnLinq(self.rows).where((F['price'] > 10) & (F['qty'] > 0)).select(F['name']), ['c'])
+        self.assertEqual(AnLinq(self.rows).where((F['price'] < 10) | ~(F['qty'] != 0)).select(F['name']), ['a', 'b'])
+        self.assertEqual(AnLinq(self.rows).where(F['name'].isin(['a', 'c'])).count(), 2)
+        self.assertEqual(AnLinq([[1], [2], [3]]).where(F.isin([[2], [3]])), [[2], [3]])
+        self.assertTrue(AnLinq(self.rows).any(F['qty'] == 0))
+        self.assertEqual(AnLinq(self.rows).first(F['price'] >= 15)['name'], 'b')
+        try:
+            (F.x > 1) and (F.y > 1)
+            self.assertTrue(False, "Must raise TypeError before this line")
+        except TypeError:
+            pass
+
+    def test_arithmetic(self):
+        self.assertEqual(AnLinq(self.rows).select(F['price'] * F['qty']), [10, 0, 75])
+        self.assertEqual(AnLinq([1, 2, 3]).select((F + 1) * 2 - F / 2), [3.5, 5.0, 6.5])
+        self.assertEqual(AnLinq([1, 2, 3]).select(10 - F), [9, 8, 7])
+        self.assertEqual(AnLinq([7, 8]).select(-(F // 2) % 3 + F ** 2), [49, 66])
+
+    def test_bitwise(self):
+        # & | ~ over values which are not conditions stay bitwise, like in python and on columns
+        self.assertEqual(AnLinq([4, 6]).select(F & 4), [4, 4])
+        self.assertEqual(AnLinq([4, 6]).select(F & 2), [0, 2])
+        self.assertEqual(AnLinq([4, 6]).select(F | 1), [5, 7])
+        self.assertEqual(AnLinq([6, 1]).select(~F), [-7, -2])
+        self.assertEqual(AnLinq([6, 1]).select(~(F > 3)), [False, True])
+        self.assertEqual(AnLinq([6, 1]).select((F > 3) | (F & 1 == 1)), [True, True])
+        self.assertEqual(AnLinq(self.rows).sum(F['price'] * F['qty']), 85)
+
+    def test_other_operators(self):
+        self.assertEqual(AnLinq(self.rows).order_by_descending(F['price']).select(F['name']), ['c', 'b', 'a'])
+        self.assertEqual(AnLinq(self.rows).group_by(F['qty'] > 0, F['name']), {True: ['a', 'c'], False: ['b']})
+        self.assertEqual(AnLinq(self.rows).aggregate_by(F['qty'] > 0, 'sum', F['price']), {True: 30, False: 15})
+        self.assertEqual(AnLinq(self.rows).distinct(F['qty'] > 0).count(), 2)
+        self.assertEqual(AnLinq(self.rows).max_by(F['qty'])['name'], 'c')
+        self.assertEqual(AnLinq(self.rows).join([5, 25], F['price'], F, lambda o, i: o['name']), ['a', 'c'])
+
+    def test_inspectable(self):
+        expression = (F.price > 10) & F['tags'].isin(['x'])
+        self.assertEqual(repr(expression), "((F.price > 10) & F['tags'].isin(['x']))")
+        self.assertEqual(F.user.id.field_path(), [('attr', 'user'), ('attr', 'id')])
+        self.assertEqual((F.user + 1).field_path(), None)
+        self.assertTrue('where((F.price > 10))' in AnLinq([]).where(F.price > 10).explain())
+        restored = pickle.loads(pickle.dumps(F['a'] * 2))
+        self.assertEqual(restored({'a': 4}), 8)
+
+    def test_parallel(self):
+        numbers = list(range(100))
+        self.assertEqual(AnLinq(numbers).as_parallel(2, 'process', 10).where(F % 3 == 0).select(F * F).sum(),
+                         sum(x * x for x in range(0, 100, 3)))
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.now = [0]
+        self.cache = QueryCache(maxsize=2, clock=lambda: self.now[0])
+        self.calls = []
+
+    def select(self, x):
+        self.calls.append(x)
+        return x * 10
+
+    def test_cached_hits_for_rebuilt_query(self):
+        items = [1, 2, 3]
+        for _ in range(3):
+            query = AnLinq(items).where(F > 1).select(self.select).cached(cache=self.cache)
+            self.assertEqual(query.to_list(), [20, 30])
+        self.assertEqual(self.calls, [2, 3])
+        stats = AnLinq.cache_stats(self.cache)
+        self.assertEqual((stats.hits, stats.misses, stats.size), (2, 1, 1))
+
+    def test_cached_distinguishes_chains(self):
+        items = [1, 2, 3]
+        self.assertEqual(AnLinq(items).where(F > 1).cached(cache=self.cache).to_list(), [2, 3])
+        self.assertEqual(AnLinq(items).where(F > 2).cached(cache=self.cache).to_list(), [3])
+        self.assertEqual(AnLinq(items)[1:].cached(cache=self.cache).to_list(), [2, 3])
+        self.assertEqual(AnLinq(list(items)).where(F > 1).cached(cache=self.cache).to_list(), [2, 3])
+        self.assertEqual(self.cache.stats().hits, 0)
+
+    def test_cached_explicit_key_and_invalidation(self):
+        items = [1, 2, 3]
+        query = lambda: AnLinq(items).select(lambda x: x + 1).cached('plus one', cache=self.cache)
+        self.assertEqual(query().to_list(), [2, 3, 4])
+        items.append(4)
+        self.assertEqual(query().to_list(), [2, 3, 4])
+        AnLinq.invalidate_cache(items, self.cache)
+        self.assertEqual(query().to_list(), [2, 3, 4, 5])
+        self.assertRaises(AnLinq.AnLinqException, lambda: AnLinq(items).concat([1]).cached(cache=self.cache))
+
+    def test_cached_ttl_and_lru_eviction(self):
+        items = [1, 2, 3]
+        AnLinq(items).select(self.select).cached(ttl=5, cache=self.cache).to_list()
+        self.now[0] = 4
+        AnLinq(items).select(self.select).cached(ttl=5, cache=self.cache).to_list()
+        self.now[0] = 5
+        AnLinq(items).select(self.select).cached(ttl=5, cache=self.cache).to_list()
+        self.assertEqual(len(self.calls), 6)
+
+        for limit in (1, 2, 3):
+            AnLinq(items).take(limit).cached(cache=self.cache).to_list()
+        AnLinq(items).take(1).cached(cache=self.cache).to_list()
+        stats = self.cache.stats()
+        self.assertEqual((stats.size, stats.evictions), (2, 3))
+
+    def test_cached_memory_limit(self):
+        cache = QueryCache(maxsize=None, max_bytes=2000)
+        AnLinq(range(100)).select(str).cached(cache=cache).to_list()
+        self.assertEqual(cache.stats().size, 0)
+        AnLinq(range(5)).select(str).cached(cache=cache).to_list()
+        self.assertEqual(cache.stats().size, 1)
+        self.assertTrue(0 < cache.stats().bytes <= 2000)
+
+
+class TestMaterializedViews(unittest.TestCase):
+    def setUp(self):
+        self.items = ObservableList([1, 2, 3, 4, 5, 6])
+
+    def test_materialize_list(self):
+        query = lambda q: q.where(F % 2 == 0).select_many(lambda x: [x, -x])
+        view = query(AnLinq(self.items)).materialize()
+        self.items.extend([8, 9, 10])
+        self.items.remove(4)
+        self.items.pop(0)
+        self.assertEqual(view.to_list(), query(AnLinq(list(self.items))).to_list())
+        self.assertEqual(len(view), 8)
+        self.items.clear()
+        self.assertEqual((view.to_list(), len(view)), ([], 0))
+
+    def test_materialize_distinct_and_by(self):
+        distinct = AnLinq(self.items).select(F % 3).materialize_distinct()
+        counts = AnLinq(self.items).materialize_by(F % 3)
+        sums = AnLinq(self.items).where(F > 1).materialize_by(F % 2, 'sum', F * 10)
+        averages = AnLinq(self.items).materialize_by(F % 2, 'average')
+        self.assertEqual((distinct.to_set(), counts.to_dictionary()), ({0, 1, 2}, {0: 2, 1: 2, 2: 2}))
+        self.items.remove(3)
+        self.items.remove(6)
+        self.items.append(7)
+        self.assertEqual(distinct.to_set(), {1, 2})
+        self.assertFalse(0 in distinct)
+        self.assertEqual(counts.to_dictionary(), {1: 3, 2: 2})
+        self.assertEqual(sums.to_dictionary(), {0: 60, 1: 120})
+        self.assertEqual(averages[1], 13 / 3.0)
+        self.assertEqual(AnLinq(self.items).where(F > 1).aggregate_by(F % 2, 'sum', F * 10), sums.to_dictionary())
+
+    def test_materialize_lookup(self):
+        lookup = AnLinq(self.items).materialize_lookup(F % 2, F * 10)
+        self.items.append(1)
+        self.items.remove(1)
+        self.assertEqual(lookup[1].to_list(), [30, 50, 10])
+        self.assertEqual(lookup[7].to_list(), [])
+        self.assertEqual(dict((k, v.to_list()) for k, v in lookup.to_lookup().items()),
+                         dict((k, v.to_list()) for k, v in AnLinq(self.items).to_lookup(F % 2, F * 10).items()))
+
+    def test_materialize_requires_incremental_query(self):
+        self.assertRaises(AnLinq.AnLinqException, lambda: AnLinq([1, 2]).materialize())
+        self.assertRaises(AnLinq.AnLinqException, lambda: AnLinq(self.items).take(2).materialize())
+        self.assertRaises(AnLinq.AnLinqException, lambda: self.items.remove(100))
+
+    def test_observable_list_version_invalidates_cache(self):
+        cache = QueryCache()
+        query = lambda: AnLinq(self.items).where(F > 4).cached(cache=cache).to_list()
+        self.assertEqual(query(), [5, 6])
+        self.items.append(7)
+        self.assertEqual(query(), [5, 6, 7])
+        self.assertEqual(AnLinq(self.items)[-2:].to_list(), [6, 7])
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_profile_counts_items_per_stage(self):
+        report = AnLinq(range(100)).where(F % 4 == 0).select(F * 2).order_by(descending=True).take(3).profile()
+        self.assertEqual([stage.stage.split('(')[0] for stage in report.stages],
+                         ['source: range', 'where', 'select', 'order_by'])
+        self.assertEqual([(stage.items_in, stage.items_out) for stage in report.stages],
+                         [(None, 100), (100, 25), (25, 25), (25, 3)])
+        self.assertEqual(report.stages[1].selectivity, 0.25)
+        self.assertEqual(report.items_out, 3)
+        self.assertTrue(all(stage.wall_time >= 0 and stage.allocated_bytes is None for stage in report.stages))
+        self.assertTrue('selectivity' in str(report))
+        self.assertEqual(report.to_list()[3]['items_in'], 25)
+
+    def test_instrument_reports_every_iteration(self):
+        reports = []
+        query = AnLinq([1, 2, 3, 4]).where(F > 1).instrument(reports.append)
+        self.assertEqual(query.to_list(), [2, 3, 4])
+        self.assertEqual(query.first(), 2)
+        self.assertEqual([report.items_out for report in reports], [3, 1])
+        self.assertEqual(reports[1].stages[0].items_out, 2)
+        self.assertEqual(AnLinq([1, 2]).instrument(reports.append, allocations=True).count(), 2)
+        self.assertTrue(reports[2].stages[0].allocated_bytes is not None)
+
+    def test_global_hooks(self):
+        reports = []
+
+        def hook(report):
+            # queries run by hooks are not reported again
+            reports.append(AnLinq(report.stages).select(F.items_out).to_list())
+
+        instrumentation.add_hook(hook)
+        try:
+            self.assertEqual(AnLinq([3, 1, 2]).where(F < 3).order_by().to_list(), [1, 2])
+            self.assertEqual(AnLinq([1, 2]).to_list(), [1, 2])
+        finally:
+            instrumentation.remove_hook(hook)
+        self.assertEqual(AnLinq([1]).select(F).to_list(), [1])
+        self.assertEqual(reports, [[3, 2, 2]])
+
+
+class TestSketches(unittest.TestCase):
+    def setUp(self):
+        self.numbers = [(i * 7919) % 10007 for i in range(20000)]
+
+    def test_approx_count_distinct(self):
+        self.assertAlmostEqual(AnLinq(range(100)).approx_count_distinct(), 100, delta=2)
+        self.assertAlmostEqual(AnLinq(self.numbers).approx_count_distinct() / 10007.0, 1, delta=0.03)
+        self.assertAlmostEqual(AnLinq(self.numbers).approx_count_distinct(str, precision=10) / 10007.0, 1, delta=0.1)
+        self.assertAlmostEqual(AnLinq(self.numbers).as_parallel(3, chunk_size=1000).approx_count_distinct() / 10007.0,
+                               1, delta=0.03)
+        self.assertEqual(AnLinq([]).approx_count_distinct(), 0)
+        self.assertRaises(AnLinq.AnLinqException, HyperLogLog(10).merge, HyperLogLog(12))
+
+    def test_hash64(self):
+        self.assertEqual(hash64(1), hash64(1.0))
+        self.assertEqual(hash64(0), hash64(-0.0))
+        self.assertEqual(hash64(2 ** 70), hash64(float(2 ** 70)))
+        # hash() is the same for -1 and -2, and for numbers equal modulo 2 ** 61 - 1
+        self.assertNotEqual(hash64(-1), hash64(-2))
+        self.assertNotEqual(hash64(5), hash64(5 + 2 ** 61 - 1))
+        self.assertNotEqual(hash64(2 ** 64 - 1), hash64(-1))
+        self.assertNotEqual(hash64(0.5), hash64(0.5 + 2 ** -52))
+        self.assertEqual(AnLinq([-1, -2, 3, 3 + 2 ** 61 - 1]).approx_count_distinct(), 4)
+
+    def test_approx_top_k(self):
+        items = [i % 7 for i in range(700)] + [3] * 300 + list(range(100, 1100))
+        self.assertEqual(AnLinq(items).approx_top_k(2), [(3, 400), (0, 100)])
+        self.assertEqual([pair[0] for pair in AnLinq(items).approx_top_k(1, capacity=20)], [3])
+        self.assertEqual(AnLinq(items).as_parallel(2, chunk_size=300).approx_top_k(1, F % 7)[0][0], 3)
+        sketch = SpaceSaving(5).update('aaab').merge(SpaceSaving(5).update('abc'))
+        self.assertEqual(sketch.top(2), [('a', 4), ('b', 2)])
+        self.assertEqual(sketch.count, 7)
+
+    def test_approx_quantile(self):
+        for quantile in (0, 0.1, 0.5, 0.9, 1):
+            rank = sorted(self.numbers).index(AnLinq(self.numbers).approx_quantile(quantile))
+            self.assertAlmostEqual(rank / 20000.0, quantile, delta=0.02)
+        self.assertAlmostEqual(AnLinq(self.numbers).as_parallel(4).approx_quantile(0.5, F / 10007.0), 0.5, delta=0.02)
+        self.assertEqual(AnLinq([5]).approx_quantile(0.5), 5)
+        sketch = KllSketch(k=50).update(range(1000)).merge(KllSketch(k=50).update(range(1000, 2000)))
+        self.assertEqual(sketch.count, 2000)
+        self.assertAlmostEqual(sketch.quantile(0.25), 500, delta=100)
+        self.assertRaises(AnLinq.AnLinqException, AnLinq([]).approx_quantile, 0.5)
+        self.assertRaises(AnLinq.AnLinqException, AnLinq([1]).approx_quantile, 50)
+
+    def test_sample(self):
+        self.assertEqual(sorted(AnLinq(range(3)).sample(5)), [0, 1, 2])
+        self.assertEqual(AnLinq(range(1000)).sample(10, seed=1).to_list(), AnLinq(range(1000)).sample(10, seed=1))
+        counts = [0] * 10
+        for seed in range(1000):
+            for i in AnLinq(x for x in range(10)).sample(3, seed=seed):
+                counts[i] += 1
+        self.assertTrue(all(240 < count < 360 for count in counts))
+        sample = AnLinq(range(100)).as_parallel(3, chunk_size=10).sample(5, seed=2)
+        self.assertEqual(len(set(sample)), 5)
+        reservoir = Reservoir(3, seed=1).update(range(10)).update(range(10, 50))
+        self.assertEqual(reservoir.count, 50)
+        self.assertEqual(reservoir.merge(Reservoir(3).update('ab')).count, 52)
+        self.assertRaises(AnLinq.AnLinqException, AnLinq([1]).sample, 0)
+
+
+class TestIndexes(unittest.TestCase):
+    def setUp(self):
+        self.rows = [{'id': i, 'region': ('eu', 'us', 'asia')[i % 3], 'qty': i % 5} for i in range(30)]
+        self.table = AnLinq(self.rows).with_index(F['id'], F['region'])
+
+    def test_expression_lookups(self):
+        self.assertEqual(self.table.first(F['id'] == 7), self.rows[7])
+        self.assertEqual(self.table.first_or_none(F['id'] == 100), None)
+        self.assertEqual(self.table.where(F['region'] == 'us').select(F['id']).to_list(), list(range(1, 30, 3)))
+        self.assertEqual(self.table.where(F['id'].isin([9, 2, 100])).select(F['id']).to_list(), [2, 9])
+        self.assertEqual(self.table.where((F['id'] >= 10) & (F['id'] < 13)).select(F['id']).to_list(), [10, 11, 12])
+        self.assertEqual(self.table.where((F['region'] == 'eu') & (F['qty'] == 0)).select(F['id']).to_list(), [0, 15])
+        self.assertEqual(self.table.where(F['id'] > 27).count(), 2)
+        # predicates without indexed conditions scan items
+        self.assertEqual(self.table.where(F['qty'] == 4).count(), 6)
+        self.assertEqual(self.table.where(lambda r: r['id'] == 3).to_list(), [self.rows[3]])
+
+    def test_key_selector_lookups(self):
+        region = lambda r: r['region']
+        table = AnLinq(iter(self.rows)).with_index(region, F['qty'])
+        self.assertEqual(table.get('asia').count(), 10)
+        self.assertEqual(table.get_many(['eu', 'us'], region).count(), 20)
+        self.assertEqual(table.get_range(3, key=F['qty']).select(F['id']).take(3).to_list(), [3, 4, 8])
+        self.assertEqual(table.get_range(1, 2, F['qty'], include_high=True).count(), 12)
+        self.assertRaises(AnLinq.AnLinqException, table.get, 1, F['id'])
+        self.assertEqual(self.table.where(F['id'].isin([2, 2])).select(F['id']).to_list(), [2])
+        self.assertEqual(self.table.get_many([2, 2.0, 1, True], F['id']).select(F['id']).to_list(), [1, 2])
+
+    def test_rebuilt_on_changes(self):
+        items = ObservableList([1, 2, 3])
+        table = AnLinq(items).with_index(F)
+        self.assertEqual(table.where(F == 4).count(), 0)
+        items.append(4)
+        self.assertEqual(table.where(F == 4).to_list(), [4])
+        rows = [3, 1]
+        table = AnLinq(rows).with_index(F)
+        rows.append(2)
+        self.assertEqual(table.where(F < 3).to_list(), [1, 2])
+        rows[0] = 0
+        self.assertEqual(table.reindex().where(F < 3).to_list(), [0, 1, 2])
+
+    def test_stale_index(self):
+        rows = [{'id': 1}, {'id': 2}]
+        table = AnLinq(rows).with_index(F['id'])
+        # replaced in place, length is the same, so index still has the old key
+        rows[0] = {'id': 5}
+        self.assertEqual(table.where(F['id'] == 1).to_list(), [])
+        self.assertEqual(table.first_or_none(F['id'] == 1), None)
+        self.assertEqual(table.get(1).to_list(), [])
+        self.assertEqual(table.get_many([1, 2]).to_list(), [{'id': 2}])
+        self.assertEqual(table.get_range(0, 3).to_list(), [{'id': 2}])
+        self.assertEqual(table.reindex().get(5).to_list(), [{'id': 5}])
+
+
+class TestBuffers(unittest.TestCase):
+    def test_round_trip(self):
+        rows = [{'id': i, 'price': i * 0.5, 'name': 'item' + str(i), 'paid': i % 2 == 0,
+                 'note': None if i % 3 else u'\xe9'} for i in range(10)]
+        table = AnLinq.from_buffer(AnLinq(rows).to_buffer())
+        self.assertEqual(table.to_list(), rows)
+        self.assertEqual(table.where(F['paid']).sum(F['price']), 10.0)
+        self.assertEqual(table.iterable[-1], rows[-1])
+        self.assertEqual(table.iterable.column('id').tolist(), list(range(10)))
+        self.assertEqual(table.iterable.column('note')[:3], [u'\xe9', None, None])
+        pairs = [(1, b'a', None), (2, b'', 2 ** 70)]
+        self.assertEqual(AnLinq.from_buffer(AnLinq(pairs).to_buffer()).to_list(), pairs)
+        self.assertEqual(AnLinq.from_buffer(bytes(AnLinq([3, None, 1]).to_buffer())).to_list(), [3, None, 1])
+        for mixed in ([2 ** 60 + 1, 0.5], [-2 ** 53 - 1, None, 1.5], [2 ** 53, 0.5]):
+            self.assertEqual(AnLinq.from_buffer(AnLinq(mixed).to_buffer()).to_list(), mixed)
+        self.assertEqual(AnLinq.from_buffer(AnLinq([]).to_buffer()).count(), 0)
+        self.assertRaises(AnLinq.AnLinqException, AnLinq.from_buffer, b'not a table')
+
+    def test_mixed_dicts(self):
+        # dicts are stored as named columns only when all of them have the same string keys
+        same = [{'a': 1, 'b': 'x'}, {'b': 'y', 'a': 2}]
+        self.assertEqual(AnLinq.from_buffer(AnLinq(same).to_buffer()).iterable.names, ['a', 'b'])
+        self.assertEqual(AnLinq.from_buffer(AnLinq(same).to_buffer()).to_list(), same)
+        for rows in ([{'a': 1}, {'a': 2, 'b': 3}], [{'a': 1, 'b': 2}, {'a': 3}], [{'a': 1}, {1: 2}],
+                     [{1: 'a'}, {'a': 1}]):
+            table = AnLinq.from_buffer(AnLinq(rows).to_buffer())
+            self.assertEqual(table.iterable.shape, 'scalar')
+            self.assertEqual(table.to_list(), rows)
+
+    @unittest.skipIf(shared_memory is None, "shared memory requires python 3.8+")
+    def test_shared_memory(self):
+        block = AnLinq(range(100)).select(lambda x: x * 1.5).to_shared_memory()
+        try:
+            table = AnLinq.from_buffer(block)
+            self.assertEqual(table.sum(), 7425.0)
+            table.iterable.release()
+        finally:
+            block.close()
+            block.unlink()
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as stream:
+            stream.write(AnLinq(['a', 'b']).to_buffer())
+            stream.flush()
+            mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            table = AnLinq.from_buffer(mapped)
+            self.assertEqual(table.to_list(), ['a', 'b'])
+            table.iterable.release()
+            mapped.close()
+
+    def test_to_array(self):
+        self.assertEqual(AnLinq([1, 2]).to_array(), array.array('q', [1, 2]))
+        self.assertEqual(AnLinq([1, 2.5]).to_array().typecode, 'd')
+        self.assertEqual(AnLinq(range(3)).to_array('i').tolist(), [0, 1, 2])
+
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as stream:
+            stream.write(content)
+        return path
+
+    def test_lines(self):
+        path = self.write('log.txt', u'first\nsecond \u00e9\r\n\nlast'.encode('utf-8'))
+        lines = AnLinq.from_lines(path)
+        self.assertEqual(lines, ['first', u'second \u00e9', '', 'last'])
+        self.assertEqual(lines.count(), 4)
+        self.assertEqual(AnLinq.from_lines(path, encoding=None).first(), b'first')
+        self.assertEqual(AnLinq.from_lines(path, raw_filter=lambda line: b'st' in line), ['first', 'last'])
+
+    def test_byte_ranges(self):
+        lines = ['line %d %s' % (i, 'x' * (i % 7)) for i in range(100)]
+        path = self.write('log.txt', '\n'.join(lines).encode('ascii'))
+        for parts in [1, 2, 3, 7, 50, 2000]:
+            ranges = byte_ranges(path, parts)
+            self.assertEqual(len(ranges), parts)
+            self.assertEqual(AnLinq(ranges).select_many(lambda r: AnLinq.from_lines(path, start=r[0], end=r[1])),
+                             lines)
+
+    def test_jsonl(self):
+        path = self.write('events.jsonl', b'{"level": "info", "id": 1}\n{"level": "error", "id": 2}\n\n'
+                                          b'{"level": "error", "id": 3}\n')
+        self.assertEqual(AnLinq.from_jsonl(path).select(lambda x: x['id']), [1, 2, 3])
+        self.assertEqual(AnLinq.from_jsonl(path, raw_filter=lambda line: b'"error"' in line)
+                         .select(lambda x: x['id']), [2, 3])
+        half = os.path.getsize(path) // 2
+        self.assertEqual(AnLinq.from_jsonl(path, end=half).concat(AnLinq.from_jsonl(path, start=half))
+                         .select(lambda x: x['id']), [1, 2, 3])
+
+    def test_csv(self):
+        path = self.write('table.csv', b'name,born\nMasha,1986\n"Smith, Julia",1992\nMorticia,1978\n')
+        self.assertEqual(AnLinq.from_csv(path).select(lambda x: x['name']), ['Masha', 'Smith, Julia', 'Morticia'])
+        self.assertEqual(AnLinq.from_csv(path, header=False).first(), ['name', 'born'])
+        self.assertEqual(AnLinq.from_csv(path, raw_filter=lambda line: b'19' in line).count(), 3)
+        for parts in [2, 3, 10]:
+            self.assertEqual(AnLinq(byte_ranges(path, parts))
+                             .select_many(lambda r: AnLinq.from_csv(path, start=r[0], end=r[1]))
+                             .select(lambda x: int(x['born'])), [1986, 1992, 1978])
+        tabbed = self.write('table.tsv', b'a\tb\n1\t2\n')
+        self.assertEqual(AnLinq.from_csv(tabbed, delimiter='\t'), [{'a': '1', 'b': '2'}])
+
+    def test_binary_records(self):
+        path = self.write('records.bin', b''.join(struct.pack('<id', i, i / 2.0) for i in range(10)) + b'\0\0')
+        records = AnLinq.from_binary_records(path, '<id')
+        self.assertEqual(records.count(), 10)
+        self.assertEqual(records.first(), (0, 0.0))
+        self.assertEqual(records.select(lambda x: x[0]), list(range(10)))
+        for parts in [1, 3, 4, 11]:
+            self.assertEqual(AnLinq(byte_ranges(path, parts))
+                             .select_many(lambda r: AnLinq.from_binary_records(path, '<id', r[0], r[1]))
+                             .select(lambda x: x[0]), list(range(10)))
+        self.assertEqual(AnLinq.from_binary_records(path, '<i', 0, 12), [0, 0, 0])
+        self.assertEqual(AnLinq.from_binary_records(self.write('empty.bin', b''), '<i'), [])
+        self.assertEqual(AnLinq.from_binary_records(path, '<id', 24, 24).count(), 0)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestColumnarAnLinq(unittest.TestCase):
+    def setUp(self):
+        self.numbers = AnLinq.from_array(numpy.arange(10), vectorize=True)
+        self.records = AnLinq([{'region': 'eu', 'price': 10, 'qty': 1},
+                               {'region': 'us', 'price': 25, 'qty': 2},
+                               {'region': 'eu', 'price': 5, 'qty': 7}]).as_columnar(vectorize=True)
+
+    def test_vectorized(self):
+        query = self.numbers.where(lambda x: x % 2 == 0).select(lambda x: x * 10)
+        self.assertEqual(query.__class__.__name__, 'ColumnarAnLinq')
+        self.assertEqual(query, [0, 20, 40, 60, 80])
+        self.assertEqual(query.count(), 5)
+        self.assertEqual(query[-1], 80)
+        self.assertEqual(query.skip(1).take(2), [20, 40])
+        self.assertEqual(self.records.where(lambda r: r['price'] > 6).select(lambda r: r['price'] * r['qty']),
+                         [10, 50])
+        self.assertEqual(self.records[0], {'region': 'eu', 'price': 10, 'qty': 1})
+
+    def test_functions_opt_in(self):
+        words = AnLinq.from_array(['abc', 'aba', 'xyz'])
+        self.assertEqual(words.select(lambda s: s[::-1]), ['cba', 'aba', 'zyx'])
+        self.assertEqual(AnLinq.from_array(numpy.arange(4)).where(lambda x: x % 2 == 0).__class__, AnLinq)
+        self.assertEqual(AnLinq.from_array(numpy.arange(4)).where(F % 2 == 0).__class__.__name__, 'ColumnarAnLinq')
+        self.assertEqual(AnLinq([{'a': 1}, {'b': 2}]).as_columnar(), [{'a': 1}, {'b': 2}])
+
+    def test_integer_overflow(self):
+        big = AnLinq.from_array(numpy.array([10 ** 7, 2]), vectorize=True)
+        self.assertEqual(big.select(lambda x: x ** 3), [10 ** 21, 8])
+        self.assertEqual(big.select(F * F * F), [10 ** 21, 8])
+        self.assertEqual(big.where(F * F * F > 10 ** 20), [10 ** 7])
+        self.assertEqual(big.select(F * 2).__class__.__name__, 'ColumnarAnLinq')
+        self.assertEqual(AnLinq.from_array(numpy.array([2 ** 62, 2 ** 62])).sum(), 2 ** 63)
+        self.assertEqual(AnLinq.from_array([2 ** 62, 2 ** 62, 1]).aggregate_by(F % 2, 'sum'), {0: 2 ** 63, 1: 1})
+        flags = AnLinq.from_array(numpy.array([True, True]), vectorize=True)
+        self.assertEqual(flags.select(lambda x: x + x), [2, 2])
+
+    def test_two_dimensional_rows(self):
+        # square arrays must not confuse rows with columns
+        self.assertEqual(AnLinq([(1, 2), (3, 4)]).as_columnar().select(lambda r: r[0] + r[1]), [3, 7])
+        self.assertEqual(AnLinq.from_array([[0, 5], [0, 0]]).where(lambda r: r[0] > 1), [])
+        self.assertEqual(AnLinq.from_array([[1, 2], [3, 4]]).sum(lambda r: r[1]), 6)
+
+    def test_to_array(self):
+        self.assertTrue(isinstance(self.numbers.to_array(), numpy.ndarray))
+        self.assertEqual(AnLinq.from_array([1.0, 2.5]).to_array('d'), array.array('d', [1.0, 2.5]))
+        self.assertEqual(self.numbers.where(F > 7).to_array('q'), array.array('q', [8, 9]))
+
+    def test_expressions(self):
+        query = self.records.where((F['price'] > 6) & ~F['region'].isin(['us']))
+        self.assertEqual(query.__class__.__name__, 'ColumnarAnLinq')
+        self.assertEqual(query.select(F['qty']), [1])
+        self.assertEqual(self.numbers.where((F > 2) & (F < 5)).__class__.__name__, 'ColumnarAnLinq')
+        self.assertEqual(self.numbers.where((F > 2) & (F < 5)), [3, 4])
+        self.assertEqual(AnLinq.from_array(numpy.array([6, 1])).select(~F), [-7, -2])
+        self.assertEqual(self.records.aggregate_by(F['region'], 'sum', F['price'] * F['qty']), {'eu': 45, 'us': 50})
+
+    def test_fallback(self):
+        query = self.numbers.where(lambda x: 2 < x < 5)
+        self.assertEqual(query.__class__, AnLinq)
+        self.assertEqual(query, [3, 4])
+        self.assertEqual(self.numbers.select(lambda x: '#' + repr(x)).take(2), ['#0', '#1'])
+        self.assertEqual(self.numbers.select(lambda x: x and 1 / x).take(2), [0, 1.0])
+        try:
+            self.numbers.select(lambda x: 1 / x).to_list()
+            self.assertTrue(False, "Must raise ZeroDivisionError before this line")
+        except ZeroDivisionError:
+            pass
+        self.assertEqual(self.records.first(lambda r: r['region'] == 'us')['price'], 25)
+
+    def test_aggregates(self):
+        self.assertEqual(self.numbers.sum(), 45)
+        self.assertEqual(self.numbers.min(lambda x: -x), -9)
+        self.assertEqual(self.numbers.max(), 9)
+        self.assertEqual(self.numbers.average(), 4.5)
+        self.assertEqual(self.records.sum(lambda r: r['price'] * r['qty']), 95)
+        self.assertEqual(self.numbers.variance(), 8.25)
+        self.assertEqual(self.numbers.percentile(50), 4.5)
+        self.assertEqual(self.numbers.max(lambda x: -x if x > 3 else 0), 0)
+        self.assertEqual(self.numbers.average(lambda x: x if x > 4 else 5), 6.0)
+        self.assertEqual(self.records.min_by(lambda r: r['price'])['region'], 'eu')
+        self.assertEqual(self.records.stats(lambda r: r['qty']).sum, 10)
+        try:
+            self.numbers.where(lambda x: x > 100).max()
+            self.assertTrue(False, "Must raise AnLinqException before this line")
+        except AnLinq.AnLinqException:
+            pass
+
+    def test_aggregate_by(self):
+        self.assertEqual(self.records.aggregate_by(lambda r: r['region'], 'sum', lambda r: r['qty']),
+                         {'eu': 8, 'us': 2})
+        self.assertEqual(self.records.aggregate_by(lambda r: r['region'], 'count'), {'eu': 2, 'us': 1})
+        self.assertEqual(self.records.aggregate_by(lambda r: r['region'], 'min', lambda r: r['price']),
+                         {'eu': 5, 'us': 25})
+        self.assertEqual(self.numbers.aggregate_by(lambda x: x % 3, 'average'), {0: 4.5, 1: 4.0, 2: 5.0})
+        self.assertEqual(self.numbers.aggregate_by(lambda x: 'odd' if x % 2 else 'even', 'max'),
+                         {'odd': 9, 'even': 8})
+        self.assertEqual(self.numbers.aggregate_by(lambda x: x % 2, lambda prev, this: prev * 10 + this, None, 0),
+                         {0: 2468, 1: 13579})
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file